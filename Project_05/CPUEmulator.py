@@ -0,0 +1,257 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+# Runs .hack binaries, like those written by Project_06/assembler.lua, without the
+# CPU emulator of the course tools. Every ROM word is decoded once: an A-instruction
+# becomes its value, a C-instruction a tuple of its comp function, dest bits and jump
+# table. The RAM is a NumPy int16 array, read and written through a memoryview so the
+# loop works on plain Python ints.
+# command line prompt: "python CPUEmulator.py Program.hack [--cycles N] [--set ADDR=VALUE] [--show ADDR]"
+
+SCREEN = 16384
+KBD = 24576
+RAM_SIZE = 32768
+ROM_SIZE = 32768
+
+def wrap(value):
+    """value as a signed 16-bit word."""
+    return ((value + 0x8000) & 0xFFFF) - 0x8000
+
+# comp functions of (D, A, M) for the a bit and c bits of every computation the
+# assembler knows. Values are kept as signed 16-bit ints, so only +, - and negation
+# need to wrap.
+comps = {
+    "0101010": lambda d, a, m: 0,
+    "0111111": lambda d, a, m: 1,
+    "0111010": lambda d, a, m: -1,
+    "0001100": lambda d, a, m: d,
+    "0110000": lambda d, a, m: a,
+    "1110000": lambda d, a, m: m,
+    "0001101": lambda d, a, m: ~d,
+    "0110001": lambda d, a, m: ~a,
+    "1110001": lambda d, a, m: ~m,
+    "0001111": lambda d, a, m: wrap(-d),
+    "0110011": lambda d, a, m: wrap(-a),
+    "1110011": lambda d, a, m: wrap(-m),
+    "0011111": lambda d, a, m: wrap(d + 1),
+    "0110111": lambda d, a, m: wrap(a + 1),
+    "1110111": lambda d, a, m: wrap(m + 1),
+    "0001110": lambda d, a, m: wrap(d - 1),
+    "0110010": lambda d, a, m: wrap(a - 1),
+    "1110010": lambda d, a, m: wrap(m - 1),
+    "0000010": lambda d, a, m: wrap(d + a),
+    "1000010": lambda d, a, m: wrap(d + m),
+    "0010011": lambda d, a, m: wrap(d - a),
+    "1010011": lambda d, a, m: wrap(d - m),
+    "0000111": lambda d, a, m: wrap(a - d),
+    "1000111": lambda d, a, m: wrap(m - d),
+    "0000000": lambda d, a, m: d & a,
+    "1000000": lambda d, a, m: d & m,
+    "0010101": lambda d, a, m: d | a,
+    "1010101": lambda d, a, m: d | m,
+}
+
+def alu(bits):
+    """comp function of any other a and c bits, computed the way the Hack ALU does."""
+    uses_m, zx, nx, zy, ny, f, no = (bit == "1" for bit in bits)
+    def comp(d, a, m):
+        x, y = d, (m if uses_m else a)
+        if zx:
+            x = 0
+        if nx:
+            x = ~x
+        if zy:
+            y = 0
+        if ny:
+            y = ~y
+        out = wrap(x + y) if f else x & y
+        return ~out if no else out
+    return comp
+
+# jump bits: whether to jump for an output that is (negative, zero, positive)
+jumps = {bits: (bits[0] == "1", bits[1] == "1", bits[2] == "1") for bits in (format(i, "03b") for i in range(1, 8))}
+
+class HackError(Exception):
+    pass
+
+def decode(word):
+    """An int for an A-instruction, else (comp, uses M, dest A, dest D, dest M, jump table or None)."""
+    if len(word) != 16 or word.strip("01"):
+        raise HackError(f"'{word}' is not a 16-bit binary word")
+    if word[0] == "0":
+        return int(word, 2)
+    comp_bits = word[3:10]
+    comp = comps.get(comp_bits) or alu(comp_bits)
+    dest = word[10:13]
+    return (comp, comp_bits[0] == "1", dest[0] == "1", dest[1] == "1", dest[2] == "1", jumps.get(word[13:16]))
+
+def read_hack(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip() and not line.strip().startswith("//")]
+
+class CPUEmulator:
+    """The Hack computer: a decoded ROM, the A, D and PC registers and 32K words of RAM.
+
+    run() executes a budget of instructions and can be called again to continue.
+    The program counts as halted when it reaches the usual (END) @END 0;JMP loop.
+    """
+    def __init__(self, words):
+        if len(words) > ROM_SIZE:
+            raise HackError(f"The program has {len(words)} instructions, the ROM holds {ROM_SIZE}")
+        self.rom = [decode(word) for word in words]
+        self.ram = np.zeros(RAM_SIZE, dtype=np.int16)
+        self.memory = memoryview(self.ram)
+        self.halts = self.haltAddresses()
+        self.reset()
+
+    @classmethod
+    def load(cls, path):
+        return cls(read_hack(path))
+
+    # @n at address n followed by an unconditional jump that writes nothing
+    def haltAddresses(self):
+        halts = set()
+        for address, instruction in enumerate(self.rom[:-1]):
+            following = self.rom[address + 1]
+            if instruction == address and isinstance(following, tuple):
+                comp, uses_m, dest_a, dest_d, dest_m, jump = following
+                if jump == (True, True, True) and not (dest_a or dest_d or dest_m):
+                    halts.add(address)
+        return halts
+
+    def reset(self, clear_ram = True):
+        self.a = self.d = self.pc = 0
+        self.cycles = 0
+        self.halted = False
+        if clear_ram:
+            self.ram[:] = 0
+
+    def run(self, max_cycles):
+        """Execute up to max_cycles instructions, returns the number executed."""
+        if self.halted:
+            return 0
+        rom, memory, halts = self.rom, self.memory, self.halts
+        size = len(rom)
+        a, d, pc = self.a, self.d, self.pc
+        count = max_cycles
+        try:
+            for step in range(max_cycles):
+                if pc >= size:
+                    # Past the end of the program the ROM holds 0, which is @0
+                    a = 0
+                    pc += 1
+                    continue
+                instruction = rom[pc]
+                if instruction.__class__ is int:
+                    a = instruction
+                    pc += 1
+                    continue
+                comp, uses_m, dest_a, dest_d, dest_m, jump = instruction
+                address = a & 0x7FFF
+                out = comp(d, a, memory[address] if uses_m else 0)
+                if dest_m:
+                    memory[address] = out
+                if dest_a:
+                    a = out
+                if dest_d:
+                    d = out
+                if jump is not None and jump[0 if out < 0 else (1 if out == 0 else 2)]:
+                    pc = address
+                    if pc in halts:
+                        self.halted = True
+                        count = step + 1
+                        break
+                else:
+                    pc += 1
+        finally:
+            self.a, self.d, self.pc = a, d, pc & 0x7FFF
+            self.cycles += count
+        return count
+
+    def screen(self):
+        """The screen memory as a (256, 32) uint16 view of the RAM, no copy is made."""
+        return self.ram[SCREEN:KBD].view(np.uint16).reshape(256, 32)
+
+    def pixels(self):
+        """The screen as a (256, 512) uint8 array of 0 and 1, pixel x is bit x % 16 of its word."""
+        words = self.ram[SCREEN:KBD].astype("<u2")
+        return np.unpackbits(words.view(np.uint8), bitorder="little").reshape(256, 512)
+
+    def writeScreen(self, path):
+        """Save the screen as a plain PBM image."""
+        with open(path, 'w', encoding='ascii') as file:
+            file.write("P1\n512 256\n")
+            for row in self.pixels():
+                file.write("".join("1" if pixel else "0" for pixel in row) + "\n")
+
+def parse_assignment(text):
+    address, _, value = text.partition("=")
+    return int(address), wrap(int(value))
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a .hack program on an emulated Hack computer.")
+    parser.add_argument('program', help="The .hack file to run.")
+    parser.add_argument(
+        '--cycles',
+        type=int,
+        default=10_000_000,
+        help="Stop after this many instructions when the program does not halt (default 10000000)."
+    )
+    parser.add_argument(
+        '--set',
+        action='append',
+        default=[],
+        metavar='ADDR=VALUE',
+        help="Set a RAM word before the run, may be repeated, for example --set 0=6 --set 1=7."
+    )
+    parser.add_argument(
+        '--key',
+        type=int,
+        default=0,
+        help="Key code held down during the whole run."
+    )
+    parser.add_argument(
+        '--show',
+        action='append',
+        default=[],
+        metavar='ADDR',
+        help="Print a RAM word after the run, may be repeated."
+    )
+    parser.add_argument(
+        '--screen',
+        metavar='FILE',
+        default=None,
+        help="Save the screen as a PBM image after the run."
+    )
+    args = parser.parse_args()
+
+    try:
+        cpu = CPUEmulator.load(args.program)
+        for text in args.set:
+            address, value = parse_assignment(text)
+            cpu.ram[address] = value
+    except (OSError, ValueError, IndexError, HackError) as e:
+        print(f"Error: {e}")
+        return 1
+    cpu.ram[KBD] = args.key
+
+    start = time.perf_counter()
+    cpu.run(args.cycles)
+    elapsed = time.perf_counter() - start
+
+    state = "halted" if cpu.halted else "stopped"
+    rate = cpu.cycles / elapsed if elapsed > 0 else 0
+    print(f"{state} after {cpu.cycles} instructions in {elapsed:.2f}s ({rate / 1e6:.2f}M instructions/s)")
+    for text in args.show:
+        address = int(text)
+        print(f"RAM[{address}] = {int(cpu.ram[address])}")
+    if args.screen:
+        cpu.writeScreen(args.screen)
+        print(f"Wrote {args.screen}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
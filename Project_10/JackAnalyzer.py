@@ -1,14 +1,14 @@
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
-from io import BytesIO
 import argparse
 import glob
 import os
 import re
+import sys
+
+from array import array
 
 from pathlib import Path
 
-keywords = [
+keywords = {
     "class",
     "constructor",
     "function",
@@ -30,9 +30,9 @@ keywords = [
     "else",
     "while",
     "return"
-]
+}
 
-symbols = [
+symbols = {
     '{',
     '}',
     '(',
@@ -52,9 +52,14 @@ symbols = [
     '>',
     '=',
     '~'
-]
+}
+
+# Token type codes, token_types maps a code back to its xml tag name
+KEYWORD, SYMBOL, INTEGER_CONSTANT, STRING_CONSTANT, IDENTIFIER = range(5)
+token_types = ("keyword", "symbol", "integerConstant", "stringConstant", "identifier")
+token_codes = {name: code for code, name in enumerate(token_types)}
 
-operators = [
+operators = {
     '+',
     '-',
     '*',
@@ -64,147 +69,137 @@ operators = [
     '<',
     '>',
     '='
-]
-
-# Reads through file, returns an array with filtered out code lines
-def read_and_parse_file(file_path):
-    """Read and parse the contents of the file, ignoring empty lines and comments."""
-    in_multi_line_comment = False
-    lines = []
-
+}
+
+# Master pattern for the scanner, one named group per token class. Comments are
+# matched as whole units, so "//" or "/*" inside a string constant stays part of
+# the string, and any character that starts no token lands in the error group.
+token_pattern = re.compile(r'''
+    (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | "(?P<stringConstant>[^"\n]*)"
+  | (?P<integerConstant>\d+)
+  | (?P<word>[A-Za-z_]\w*)
+  | (?P<symbol>[{}()\[\].,;+\-*/&|<>=~])
+  | (?P<error>\S)
+''', re.VERBOSE | re.DOTALL)
+
+# Reads the whole file, comments are stripped by the scanner
+def read_source(file_path):
+    """Read the contents of the file as a single string."""
     try:
         with open(file_path, 'r') as file:
-            for line in file:
-                stripped_line = line.strip()
-
-                # Handle multi-line comments
-                while '/*' in stripped_line or '*/' in stripped_line:
-                    if in_multi_line_comment:
-                        end_index = stripped_line.find('*/')
-                        if end_index != -1:
-                            in_multi_line_comment = False
-                            stripped_line = stripped_line[end_index + 2:].strip()
-                            if not stripped_line:
-                                break  # Exit while loop if nothing left to process
-                        else:
-                            stripped_line = ''
-                            break
-                    else:
-                        start_index = stripped_line.find('/*')
-                        if start_index != -1:
-                            end_index = stripped_line.find('*/', start_index)
-                            if end_index != -1:
-                                # Multi-line comment starts and ends on the same line
-                                stripped_line = stripped_line[:start_index].strip()
-                                stripped_line = stripped_line[end_index + 2:].strip()
-                            else:
-                                # Multi-line comment starts but does not end on this line
-                                in_multi_line_comment = True
-                                stripped_line = stripped_line[:start_index].strip()
-                                if not stripped_line:
-                                    break  # Skip this line as it contains only a comment
-
-                if in_multi_line_comment:
-                    continue  # Skip lines inside multi-line comments
-
-                # Remove inline single-line comments
-                if '//' in stripped_line:
-                    stripped_line = stripped_line.split('//', 1)[0].strip()
-
-                # Skip the line if it is empty after removing comments
-                if stripped_line:
-                    lines.append(stripped_line)
-
+            return file.read()
     except FileNotFoundError:
         print(f"Error: The file at {file_path} was not found.")
     except IOError as e:
         print(f"Error: An I/O error occurred. Details: {e}")
 
-    return lines
-
-def is_integer(token):
-    try:
-        # Attempt to convert the token to an integer
-        int(token)
-        return True
-    except ValueError:
-        # If conversion fails, token is not an integer
-        return False
-
-# Return the token type, from the 5 base types
-def tokenType(token):
-    if token in symbols:
-        return "symbol"
-    elif token in keywords:
-        return "keyword"
-    elif is_integer(token):
-        return "integerConstant"
-    else:
-        return "identifier"
+    return ""
+
+# Tokenize the source text into a TokenStream
+def tokenize(source, track_lines=False):
+    """Tokenize the whole source in a single pass, skipping comments and classifying each token as it is matched."""
+    tokens = TokenStream(track_lines)
+    ids = tokens.ids
+    strings = tokens.strings
+    values = tokens.values
+    types = tokens.types
+    lines = tokens.lines
+    line = 1
+    lineStart = 0
+
+    for match in token_pattern.finditer(source):
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+        token = match.group(kind)
+        if kind == "word":
+            type = KEYWORD if token in keywords else IDENTIFIER
+        elif kind == "error":
+            print(f"Error: Unexpected character {token!r} in source")
+            continue
+        else:
+            type = token_codes[kind]
+
+        index = ids.get(token)
+        if index is None:
+            index = ids[token] = len(strings)
+            strings.append(sys.intern(token))
+        values.append(index)
+        types.append(type)
+        if lines is not None:
+            line += source.count("\n", lineStart, match.start())
+            lineStart = match.start()
+            lines.append(line)
 
-# Tokenize array of code lines( (token, type) )
-def tokenize(strings):
-    """Tokenize an array of strings based on spaces, specific punctuation, and quoted elements, with special handling for parentheses and brackets."""
-    # Regular expression to match quoted strings, words, and punctuation
-    pattern = r'"[^"]*"|[^\s";,.()\[\]~\-]+|[.,;(){}\[\]~\-]|[-~](?=\w)'
-    
-    tokens = [] #(token, type)
-    
-    for string in strings:
-        # Find all matches according to the pattern
-        matches = re.findall(pattern, string)
-        
-        # Process each match
-        for match in matches:
-            if match.startswith('"') and match.endswith('"'):
-                # Handle quoted strings by removing quotes
-                tokens.append( (match[1:-1], "stringConstant") )  # Remove the surrounding quotes
-            else:
-                # Handle non-quoted strings and punctuation
-                tokens.append( (match, tokenType(match)) )
-    
     return tokens
 
-# Write xml token file, takes in an array of pairs(token, type)
-def tokenFile(tokens, output_file):
-    # Create the root element
-    root = ET.Element("tokens")
+class TokenStream:
+    """The tokens of one file kept in parallel arrays.
 
-    # Iterate over the array and create a child element for each token
-    for token in tokens:
-        token_element = ET.SubElement(root, token[1])
-        token_element.text = f" {token[0]} "
+    Each token is an index into a table of interned token strings plus a small
+    type code, with an optional source line per token. The cursor methods are
+    what the parser uses to walk the stream.
+    """
+    def __init__(self, track_lines=False):
+        self.strings = []          # interned token strings
+        self.ids = {}              # token string -> index into strings
+        self.values = array('I')   # index into strings per token
+        self.types = array('B')    # type code per token
+        self.lines = array('I') if track_lines else None
+        self.pos = 0
 
-    # Create an ElementTree object from the root element
-    tree = ET.ElementTree(root)
+    def __len__(self):
+        return len(self.values)
 
-    # Root here is the root name, not tree root
-    root, ext = os.path.splitext(output_file)
-    # Create the new file name with 'T' before the extension
-    new_name = f"{root}T{ext}"
+    def __iter__(self):
+        # (token, type) pairs, the type as its xml tag name
+        strings = self.strings
+        for index, type in zip(self.values, self.types):
+            yield strings[index], token_types[type]
+
+    def reset(self):
+        self.pos = 0
 
-    # THIS CODE IS TO MAKE THE XML PRINT WITH INDENTS("PRETTY")
-    # Use a BytesIO buffer to capture the XML bytes
-    buffer = BytesIO()
-    tree.write(buffer, encoding='utf-8', xml_declaration=False)
+    def advance(self):
+        self.pos += 1
 
-    # Get the XML string from the buffer and decode it to a string
-    xml_bytes = buffer.getvalue()
-    xml_str = xml_bytes.decode('utf-8')
+    def current(self):
+        return self.strings[self.values[self.pos]]
 
-    # Pretty-print the XML
-    pretty_xml = minidom.parseString(xml_str).toprettyxml(indent="    ")
+    def currentType(self):
+        return self.types[self.pos]
 
-    # Remove the XML declaration from the pretty-printed string
-    pretty_xml_lines = pretty_xml.splitlines()
-    if pretty_xml_lines[0].startswith('<?xml'):
-        pretty_xml_lines.pop(0)  # Remove the first line if it's the declaration
-    pretty_xml_final = "\n".join(pretty_xml_lines)
+    def peek(self):
+        return self.strings[self.values[self.pos+1]]
+
+    def peekType(self):
+        return self.types[self.pos+1]
+
+    def previous(self):
+        return self.strings[self.values[self.pos-1]]
+
+    def line(self):
+        # Source line of the current token, 0 when lines are not tracked
+        if self.lines is None or self.pos >= len(self.lines):
+            return 0
+        return self.lines[self.pos]
+
+# Write xml token file, takes in a TokenStream
+def tokenFile(tokens, output_file):
+    # Root here is the root name, not tree root
+    root, ext = os.path.splitext(output_file)
+    # Create the new file name with 'T' before the extension
+    new_name = f"{root}T{ext}"
 
-    # Write the pretty-printed XML to a file
+    # Stream each token as a child element of <tokens>
     with open(new_name, "w", encoding="utf-8") as fh:
         print(f"Writing file: {new_name}")
-        fh.write(pretty_xml_final)
+        writer = XMLWriter(fh)
+        writer.openElement("tokens")
+        for token, type in tokens:
+            writer.leaf(type, f" {token} ")
+        writer.closeElement()
 
 def change_extension_to_xml(file_path):
     # Create a Path object
@@ -215,7 +210,7 @@ def change_extension_to_xml(file_path):
     
     return new_path
 
-# Create tokenized files of each jack file and return a dictionary containing the tokenized files by path {'path' : tokens[(token, type)]}
+# Create tokenized files of each jack file and return a dictionary containing the tokenized files by path {'path' : TokenStream}
 def find_jack_files(directory_path):
     tokens_Dict = {} 
 
@@ -238,206 +233,158 @@ def find_jack_files(directory_path):
             print(file)
             output = os.path.abspath(file)
             output_file_path = change_extension_to_xml(output)
-            lines = read_and_parse_file(output)
-            tokens = tokenize(lines)
+            source = read_source(output)
+            tokens = tokenize(source)
             tXML = tokenFile(tokens, output_file_path)
             tokens_Dict[output_file_path] = tokens
     return tokens_Dict
 
 def printXMLToken():
-    global currentToken
-    val = tokenPairs[currentToken][0]
-    type = tokenPairs[currentToken][1]
-    element = ET.SubElement(Parent.peek(), type)
-    element.text = f" {val} "
-
-def advanceToken():
-    global currentToken
-    currentToken += 1
-
-def lookAhead():
-    global currentToken
-    return tokenPairs[currentToken+1][0]
-
-def currToken():
-    global currentToken
-    t = tokenPairs[currentToken][0]
-    return t
-
-def currTokenType():
-    global currentToken
-    t = tokenPairs[currentToken][1]
-    return t
+    xmlOut.leaf(token_types[stream.currentType()], f" {stream.current()} ")
+
+# Open a new depth in the parse tree
+def openElement(tag, text = None):
+    xmlOut.openElement(tag, text)
+
+# Go back up to the parent element
+def closeElement():
+    xmlOut.closeElement()
 
 def process(str):
-    if (currToken() == str):
+    if (stream.current() == str):
         printXMLToken()
     else:
         print("Syntax Error at " + str)
     # Get the next token
-    advanceToken()
+    stream.advance()
 
 def compileClass():
     # <class> </class> is already added from init
     process("class")
     # Print ClassName and advance 1 token
     printXMLToken()
-    advanceToken()
+    stream.advance()
     process("{")
     compileClassVarDec()
     compileSubroutine()
     #This will error until other functions are completed.
     process("}")
 
+# One classVarDec per iteration, declarations are not parsed recursively
 def compileClassVarDec():
-    t = currToken()
-    if (t != "static" and t != "field"):
-        return
+    while stream.current() in ("static", "field"):
+        # Set new depth
+        openElement("classVarDec")
 
-    # Set new depth
-    global Parent
-    classVarDec = ET.SubElement(Parent.peek(), "classVarDec")
-    Parent.push(classVarDec)
-    
-    # Next element must be static or field
-    while(tokenPairs[currentToken][0] != ";"):
-        # Loop up until ;
-        printXMLToken()
-        advanceToken()
-    process(";")
+        # Next element must be static or field
+        while(stream.current() != ";"):
+            # Loop up until ;
+            printXMLToken()
+            stream.advance()
+        process(";")
 
-    # Go back up to parent
-    Parent.pop()
-    compileClassVarDec()
+        # Go back up to parent
+        closeElement()
 
+# One subroutineDec per iteration
 def compileSubroutine():
-    t = currToken()
+    while stream.current() in ("constructor", "function", "method"):
+        # Set new depth
+        openElement("subroutineDec")
 
-    if (t!= "constructor" and t!= "function" and t!= "method"):
-        return
-
-    # Set new depth
-    global Parent
-    subroutineDec = ET.SubElement(Parent.peek(), "subroutineDec")
-    Parent.push(subroutineDec)
-    
-    # Print (method|function|constructor) type routineName
-    for i in range(0,3):
-        t = currToken()
-        printXMLToken()
-        advanceToken()
+        # Print (method|function|constructor) type routineName
+        for i in range(0,3):
+            printXMLToken()
+            stream.advance()
 
-    process("(")
-    compileParameterList()
-    process(")")
-    compileSubroutineBody()
+        process("(")
+        compileParameterList()
+        process(")")
+        compileSubroutineBody()
 
-    Parent.pop()
-    compileSubroutine()
+        closeElement()
 
 
-def compileParameterList(firstFlag = True):
+def compileParameterList():
     # Set new depth
-    global Parent
-    if firstFlag:
-        paramList = ET.SubElement(Parent.peek(), "parameterList")
-        paramList.text = "\n"
-        Parent.push(paramList)
-
-    t = currToken()
-    # If next token is ) return
-    if (t == ")"):
-        Parent.pop()
-        return
-    else:
+    openElement("parameterList", "\n")
+
+    # Every token up to the ) is a type, a name or a comma
+    t = stream.current()
+    while (t != ")"):
         process(t)
-    
-    compileParameterList(False)
+        t = stream.current()
+    closeElement()
 
 def compileSubroutineBody():
     # Set new depth
-    global Parent
-    subBody = ET.SubElement(Parent.peek(), "subroutineBody")
-    Parent.push(subBody)
+    openElement("subroutineBody")
 
     process("{") 
     compileVarDec()
     compileStatements()
     process("}")
-    Parent.pop()
+    closeElement()
 
+# One varDec per iteration
 def compileVarDec():
-    t = currToken()
-    if (t != "var"):
-        return
-
-    # Set new depth
-    global Parent
-    varDec = ET.SubElement(Parent.peek(), "varDec")
-    Parent.push(varDec)
-    
-    # Next element must be a var declaration
-    t = currToken()
-    while(t != ";"):
-        # Loop up until ;
-        process(t)
-        t = currToken()
-    process(";")
+    while stream.current() == "var":
+        # Set new depth
+        openElement("varDec")
+
+        # Next element must be a var declaration
+        t = stream.current()
+        while(t != ";"):
+            # Loop up until ;
+            process(t)
+            t = stream.current()
+        process(";")
 
-    # Go back up to parent
-    Parent.pop()
-    compileVarDec()
+        # Go back up to parent
+        closeElement()
 
-def compileStatements(firstFlag = True):
+# One statement per iteration, only nested blocks recurse
+def compileStatements():
     # Set new depth
-    global Parent
-    if firstFlag:
-        statements = ET.SubElement(Parent.peek(), "statements")
-        statements.text = "\n"
-        Parent.push(statements)
-    t = currToken()
-    #print("Statement t: " + t)
-    if(t=="let"):
-        compileLet()
-    elif(t=="do"):
-        compileDo()
-    elif(t=="if"):
-        compileIf()
-    elif(t=="while"):
-        compileWhile()
-    elif(t=="return"):
-        compileReturn()
-    else:
-        Parent.pop()
-        return
-    
-    compileStatements(False)
+    openElement("statements", "\n")
+    while True:
+        t = stream.current()
+        #print("Statement t: " + t)
+        if(t=="let"):
+            compileLet()
+        elif(t=="do"):
+            compileDo()
+        elif(t=="if"):
+            compileIf()
+        elif(t=="while"):
+            compileWhile()
+        elif(t=="return"):
+            compileReturn()
+        else:
+            break
+    closeElement()
 
 def compileLet():
     # Add depth
-    global Parent
-    letStatement = ET.SubElement(Parent.peek(), "letStatement")
-    Parent.push(letStatement)
+    openElement("letStatement")
 
     # Print let and varName
     printXMLToken()
-    advanceToken()
+    stream.advance()
     printXMLToken()
-    advanceToken()
-    if currToken() == "[":
+    stream.advance()
+    if stream.current() == "[":
         process("[")
         compileExpression()
         process("]")
     process("=")
     compileExpression()
     process(";")
-    Parent.pop()
+    closeElement()
 
 def compileIf():
     # Add depth
-    global Parent
-    ifStatement = ET.SubElement(Parent.peek(), "ifStatement")
-    Parent.push(ifStatement)
+    openElement("ifStatement")
 
     process("if")
     process("(")
@@ -447,20 +394,18 @@ def compileIf():
     compileStatements()
     process("}")
     #check if there is an else statement
-    t = currToken()
+    t = stream.current()
     if t == "else":
         process("else")
         process("{")
         compileStatements()
         process("}")
 
-    Parent.pop()
+    closeElement()
 
 def compileWhile():
     # Add depth
-    global Parent
-    whileStatement = ET.SubElement(Parent.peek(), "whileStatement")
-    Parent.push(whileStatement)
+    openElement("whileStatement")
 
     process("while")
     process("(")
@@ -470,89 +415,80 @@ def compileWhile():
     compileStatements()
     process("}")
 
-    Parent.pop()
+    closeElement()
 
 def compileDo():
     # Add depth
-    global Parent
-    doStatement = ET.SubElement(Parent.peek(), "doStatement")
-    Parent.push(doStatement)
+    openElement("doStatement")
 
     # Going to be name(exp *,exp) or nameA.nameB(exp *,exp) or nameA.nameB.nameC etc
     process("do")
-    t = currToken()
+    t = stream.current()
     while (t !=  "("):
         process(t)
-        t = currToken()
+        t = stream.current()
     process("(")
     compileExpressionList()
     process(")")
     process(";")
-    Parent.pop()
+    closeElement()
 
 def compileReturn():
     # Add depth
-    global Parent
-    returnStatement = ET.SubElement(Parent.peek(), "returnStatement")
-    Parent.push(returnStatement)
+    openElement("returnStatement")
 
     process("return")
     
-    t = currToken()
+    t = stream.current()
     if t!= ";":
         compileExpression()
     process(";")
-    Parent.pop()
+    closeElement()
 
 def compileExpression():
-    expression = ET.SubElement(Parent.peek(), "expression")
-    expression.text = "\n"
-    Parent.push(expression)
+    openElement("expression", "\n")
 
-    t = currToken()
+    t = stream.current()
     #print("Expression t: " + t)
     compileTerm()
     # Check for (op term)*
-    t = currToken()
+    t = stream.current()
     if t in operators:
        process(t) # Should be the op
        compileTerm()
-    Parent.pop()
+    closeElement()
 
 def compileTerm(firstFlag = True):
     # TODO lookahead to match the type of term
-    global Parent
     if firstFlag:
-        term = ET.SubElement(Parent.peek(), "term")
-        term.text = "\n"
-        Parent.push(term)
+        openElement("term", "\n")
 
-    t = currToken()
+    t = stream.current()
     #print("Term t: " + t)
-    ty = currTokenType()
+    ty = stream.currentType()
     #print("Type is: " + ty)
 
-    if ty == "identifier":
-        if lookAhead() == "[":
+    if ty == IDENTIFIER:
+        if stream.peek() == "[":
             process(t)
             process("[")
             compileExpression()
             process("]")
-            Parent.pop()
+            closeElement()
             return
-        if lookAhead() == ".": # example : Keyboard.readInt("ENTER THE NEXT NUMBER: ");
+        if stream.peek() == ".": # example : Keyboard.readInt("ENTER THE NEXT NUMBER: ");
             process(t)
             process(".")
-            t = currToken()
+            t = stream.current()
             process(t)
             # (
-            t = currToken()
+            t = stream.current()
             process(t)
             count = compileExpressionList()
             process(")")
-            Parent.pop()
+            closeElement()
             return
-        if lookAhead() == "(":
+        if stream.peek() == "(":
             pass
     process(t)
     
@@ -562,18 +498,15 @@ def compileTerm(firstFlag = True):
     if t == "-" or t == "~":
         compileTerm()
 
-    Parent.pop()
+    closeElement()
 
 
 def compileExpressionList():
     # Set new depth
-    global Parent
-    expressionList = ET.SubElement(Parent.peek(), "expressionList")
-    expressionList.text = "\n"
-    Parent.push(expressionList)
+    openElement("expressionList", "\n")
 
     count = 1
-    t = currToken()
+    t = stream.current()
     #print("Expression list = " + t)
     while(t != ")"):
         if t == ",":
@@ -581,51 +514,76 @@ def compileExpressionList():
             process(",")
         else:    
             compileExpression()
-        t = currToken()
-    Parent.pop()
+        t = stream.current()
+    closeElement()
     return count
 
 def compileTokens(tokens, output_file):
     # Make these variables global so no passing around
-    global tree
-    global Parent
-    global tokenPairs
-    global currentToken
+    global xmlOut
+    global stream
 
     # Init
-    root = ET.Element("class")
-    tree = ET.ElementTree(root)
-    tokenPairs  = tokens
-    Parent = Stack()
-    Parent.push(root)
-    currentToken = 0
-    
-    compileClass()
-
-    # THIS CODE IS TO MAKE THE XML PRINT WITH INDENTS("PRETTY")
-    # Use a BytesIO buffer to capture the XML bytes
-    buffer = BytesIO()
-    tree.write(buffer, encoding='utf-8', xml_declaration=False)
-
-    # Get the XML string from the buffer and decode it to a string
-    xml_bytes = buffer.getvalue()
-    xml_str = xml_bytes.decode('utf-8')
+    stream = tokens
+    stream.reset()
 
-    # Pretty-print the XML
-    pretty_xml = minidom.parseString(xml_str).toprettyxml(indent="    ")
-
-    # Remove the XML declaration from the pretty-printed string
-    pretty_xml_lines = pretty_xml.splitlines()
-    if pretty_xml_lines[0].startswith('<?xml'):
-        pretty_xml_lines.pop(0)  # Remove the first line if it's the declaration
-    
-    # Join the lines back together, filtering out empty lines
-    pretty_xml_final = "\n".join(line for line in pretty_xml_lines if line.strip())
-
-    # Write the pretty-printed XML to a file
+    # The parse tree is streamed to the file while compiling
     with open(output_file, "w", encoding="utf-8") as fh:
+        xmlOut = XMLWriter(fh)
+        xmlOut.openElement("class")
+        compileClass()
+        xmlOut.closeElement()
         print(f"Writing file: {output_file}")
-        fh.write(pretty_xml_final)
+
+class XMLWriter:
+    """Streams the indented xml straight to a file as the parser descends.
+
+    The layout matches what the old ElementTree -> minidom.toprettyxml round
+    trip produced: four space indents, leaf tokens on one line, elements with
+    only whitespace text written as "<tag>" and "</tag>" lines, no blank lines
+    and no trailing newline. Only the open elements are kept in memory.
+    """
+    indent = "    "
+    escapes = str.maketrans({"&": "&amp;", "<": "&lt;", '"': "&quot;", ">": "&gt;"})
+
+    def __init__(self, file):
+        self.file = file
+        self.open = Stack()   # [tag, text, start tag written]
+        self.separator = ""
+
+    def writeLine(self, line):
+        self.file.write(self.separator + line)
+        self.separator = "\n"
+
+    # Write the start tag of the innermost element once it gets a child
+    def startParent(self):
+        if not self.open.is_empty():
+            parent = self.open.peek()
+            if not parent[2]:
+                parent[2] = True
+                self.writeLine(self.indent * (self.open.size() - 1) + f"<{parent[0]}>")
+
+    def openElement(self, tag, text = None):
+        self.startParent()
+        self.open.push([tag, text, False])
+
+    def closeElement(self):
+        tag, text, started = self.open.pop()
+        depth = self.indent * self.open.size()
+        if started:
+            self.writeLine(f"{depth}</{tag}>")
+        elif text is None:
+            self.writeLine(f"{depth}<{tag}/>")
+        else:
+            # Text that holds a newline leaves the closing tag unindented
+            element = f"{depth}<{tag}>{text.translate(self.escapes)}</{tag}>"
+            for line in element.split("\n"):
+                if line.strip():
+                    self.writeLine(line)
+
+    def leaf(self, tag, text):
+        self.startParent()
+        self.writeLine(self.indent * self.open.size() + f"<{tag}>{text.translate(self.escapes)}</{tag}>")
 
 class Stack:
     def __init__(self):
@@ -673,9 +631,9 @@ def main():
     # Check if the path is a file or directory and process accordingly
     if os.path.isfile(path):
         print(f"Reading file: {path}")
-        # Read and print file contents, filtered out to lines of code in an array
-        lines = read_and_parse_file(path)
-        tokens = tokenize(lines)
+        # Read the file contents and scan them into tokens
+        source = read_source(path)
+        tokens = tokenize(source)
         tXML = tokenFile(tokens, output_file_path)
         print("Compiling xml files now...")
         compileTokens(tokens, output_file_path)
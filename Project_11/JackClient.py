@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+
+from pathlib import Path
+
+# Thin client for the warm compile server started with `JackCompiler.py --serve`.
+# It only imports the standard library it needs, the compiler itself is loaded
+# when no server is listening and the class has to be compiled in this process.
+
+def default_socket_path():
+    return os.environ.get("JACKC_SOCKET") or os.path.join(tempfile.gettempdir(), f"jackc-{os.getuid()}.sock")
+
+def read_message(file):
+    line = file.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+def write_message(file, message):
+    file.write(json.dumps(message).encode("utf-8") + b"\n")
+    file.flush()
+
+# Send one request to the server, None when no server is listening on socket_path
+def request(message, socket_path = None):
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(socket_path or default_socket_path())
+            with conn.makefile("rwb") as file:
+                write_message(file, message)
+                return read_message(file)
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+
+# Compile a class given by path or by inline source, returns (vm_text, diagnostics)
+def compile_class(path = None, source = None, class_name = None, socket_path = None, peephole = None, shift_helper = False, pool_strings = False, level = 1,
+                  inline_lib = None, inline_size = None, inline_depth = None):
+    if path is not None:
+        message = {"path": os.path.abspath(path)}
+    else:
+        message = {"source": source, "class": class_name}
+    if peephole is not None:
+        message["peephole"] = peephole
+    if shift_helper:
+        message["shiftHelper"] = True
+    if pool_strings:
+        message["poolStrings"] = True
+    if level != 1:
+        message["level"] = level
+    if inline_lib is not None:
+        message["inlineLib"] = os.path.abspath(inline_lib)
+    if inline_size is not None:
+        message["inlineSize"] = inline_size
+    if inline_depth is not None:
+        message["inlineDepth"] = inline_depth
+
+    response = request(message, socket_path)
+    if response is None:
+        # No server, compile in process
+        import JackCompiler
+        response = JackCompiler.CompileService().handle(message)
+    return response["vm"], response["diagnostics"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile Jack classes through a running compile server.")
+    parser.add_argument(
+        'files',
+        nargs='+',
+        help="The .jack files to compile, '-' reads one class from stdin and writes its VM code to stdout."
+    )
+    parser.add_argument(
+        '--class',
+        dest='class_name',
+        default="Main",
+        help="Class name of the source read from stdin."
+    )
+    parser.add_argument(
+        '--socket',
+        default=None,
+        help="Socket of the compile server, defaults to $JACKC_SOCKET or a per-user socket in the temp dir."
+    )
+    parser.add_argument(
+        '--peephole',
+        action='store_true',
+        help="Run the peephole optimizer with every rule."
+    )
+    parser.add_argument(
+        '--peephole-rules',
+        metavar='RULES',
+        default=None,
+        help="Run the peephole optimizer with only these rules, a comma separated list of rule names."
+    )
+    parser.add_argument(
+        '--shift-helper',
+        action='store_true',
+        help="Compile x / 2^k to Math.shiftRight when x is known to be non-negative."
+    )
+    parser.add_argument(
+        '--pool-strings',
+        action='store_true',
+        help="Build every distinct string literal of a class once and reuse it."
+    )
+    parser.add_argument(
+        '-O',
+        dest='level',
+        type=int,
+        choices=[0, 1, 2],
+        default=1,
+        help="Optimization level, as for JackCompiler.py."
+    )
+    parser.add_argument(
+        '--inline-lib',
+        metavar='DIR',
+        default=None,
+        help="Directory of library classes whose subroutines -O2 may inline, as for JackCompiler.py."
+    )
+    parser.add_argument(
+        '--inline-size',
+        type=int,
+        default=None,
+        metavar='N',
+        help="Largest subroutine, in IR nodes, that -O2 inlines."
+    )
+    parser.add_argument(
+        '--inline-depth',
+        type=int,
+        default=None,
+        metavar='N',
+        help="How deep calls inside inlined code are inlined again at -O2."
+    )
+    args = parser.parse_args()
+
+    inlining = {"inline_lib": args.inline_lib, "inline_size": args.inline_size, "inline_depth": args.inline_depth}
+    peephole = args.peephole_rules if args.peephole_rules is not None else ("all" if args.peephole else None)
+    status = 0
+    for file in args.files:
+        if file == "-":
+            vm, diagnostics = compile_class(source=sys.stdin.read(), class_name=args.class_name, socket_path=args.socket, peephole=peephole, shift_helper=args.shift_helper, pool_strings=args.pool_strings, level=args.level, **inlining)
+            sys.stdout.write(vm)
+        else:
+            vm, diagnostics = compile_class(path=file, socket_path=args.socket, peephole=peephole, shift_helper=args.shift_helper, pool_strings=args.pool_strings, level=args.level, **inlining)
+            with open(Path(file).with_suffix('.vm'), 'w', encoding='utf-8') as out:
+                out.write(vm)
+        for message in diagnostics:
+            print(f"{file}: {message}", file=sys.stderr)
+        if diagnostics:
+            status = 1
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
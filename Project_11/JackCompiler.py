@@ -1,14 +1,25 @@
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
-from io import BytesIO
 import argparse
+import contextlib
 import glob
+import hashlib
+import io
+import itertools
+import json
 import os
 import re
+import sys
+import time
+import tracemalloc
+
+from array import array
 
 from pathlib import Path
 
-keywords = [
+from JackIR import (TRUE_WORD, WORD_MASK, Binary, Call, ClassIR, Const, Do, If, Index, Let,
+                    Lowering, PassManager, Return, String, Subroutine, Unary, Var, VMBuffer, While, levels)
+from VMPeephole import Peephole, parse_rules
+
+keywords = {
     "class",
     "constructor",
     "function",
@@ -30,9 +41,9 @@ keywords = [
     "else",
     "while",
     "return"
-]
+}
 
-symbols = [
+symbols = {
     '{',
     '}',
     '(',
@@ -52,9 +63,14 @@ symbols = [
     '>',
     '=',
     '~'
-]
+}
+
+# Token type codes, token_types maps a code back to its xml tag name
+KEYWORD, SYMBOL, INTEGER_CONSTANT, STRING_CONSTANT, IDENTIFIER = range(5)
+token_types = ("keyword", "symbol", "integerConstant", "stringConstant", "identifier")
+token_codes = {name: code for code, name in enumerate(token_types)}
 
-operators = [
+operators = {
     '+',
     '-',
     '*',
@@ -64,147 +80,150 @@ operators = [
     '<',
     '>',
     '='
-]
-
-# Reads through file, returns an array with filtered out code lines
-def read_and_parse_file(file_path):
-    """Read and parse the contents of the file, ignoring empty lines and comments."""
-    in_multi_line_comment = False
-    lines = []
-
+}
+
+# VM segment of each symbol table kind
+segments = {
+    'local': "local",
+    'argument': "argument",
+    'static': "static",
+    'field': "this"
+}
+
+# Master pattern for the scanner, one named group per token class. Comments are
+# matched as whole units, so "//" or "/*" inside a string constant stays part of
+# the string, and any character that starts no token lands in the error group.
+token_pattern = re.compile(r'''
+    (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | "(?P<stringConstant>[^"\n]*)"
+  | (?P<integerConstant>\d+)
+  | (?P<word>[A-Za-z_]\w*)
+  | (?P<symbol>[{}()\[\].,;+\-*/&|<>=~])
+  | (?P<error>\S)
+''', re.VERBOSE | re.DOTALL)
+
+# Reads the whole file, comments are stripped by the scanner
+def read_source(file_path):
+    """Read the contents of the file as a single string."""
     try:
         with open(file_path, 'r') as file:
-            for line in file:
-                stripped_line = line.strip()
-
-                # Handle multi-line comments
-                while '/*' in stripped_line or '*/' in stripped_line:
-                    if in_multi_line_comment:
-                        end_index = stripped_line.find('*/')
-                        if end_index != -1:
-                            in_multi_line_comment = False
-                            stripped_line = stripped_line[end_index + 2:].strip()
-                            if not stripped_line:
-                                break  # Exit while loop if nothing left to process
-                        else:
-                            stripped_line = ''
-                            break
-                    else:
-                        start_index = stripped_line.find('/*')
-                        if start_index != -1:
-                            end_index = stripped_line.find('*/', start_index)
-                            if end_index != -1:
-                                # Multi-line comment starts and ends on the same line
-                                stripped_line = stripped_line[:start_index].strip()
-                                stripped_line = stripped_line[end_index + 2:].strip()
-                            else:
-                                # Multi-line comment starts but does not end on this line
-                                in_multi_line_comment = True
-                                stripped_line = stripped_line[:start_index].strip()
-                                if not stripped_line:
-                                    break  # Skip this line as it contains only a comment
-
-                if in_multi_line_comment:
-                    continue  # Skip lines inside multi-line comments
-
-                # Remove inline single-line comments
-                if '//' in stripped_line:
-                    stripped_line = stripped_line.split('//', 1)[0].strip()
-
-                # Skip the line if it is empty after removing comments
-                if stripped_line:
-                    lines.append(stripped_line)
-
+            return file.read()
     except FileNotFoundError:
         print(f"Error: The file at {file_path} was not found.")
     except IOError as e:
         print(f"Error: An I/O error occurred. Details: {e}")
 
-    return lines
-
-def is_integer(token):
-    try:
-        # Attempt to convert the token to an integer
-        int(token)
-        return True
-    except ValueError:
-        # If conversion fails, token is not an integer
-        return False
-
-# Return the token type, from the 5 base types
-def tokenType(token):
-    if token in symbols:
-        return "symbol"
-    elif token in keywords:
-        return "keyword"
-    elif is_integer(token):
-        return "integerConstant"
-    else:
-        return "identifier"
+    return ""
+
+# Tokenize the source text into a TokenStream
+def tokenize(source, track_lines=False, verbose=True):
+    """Tokenize the whole source in a single pass, skipping comments and classifying each token as it is matched."""
+    tokens = TokenStream(track_lines)
+    ids = tokens.ids
+    strings = tokens.strings
+    values = tokens.values
+    types = tokens.types
+    lines = tokens.lines
+    line = 1
+    lineStart = 0
+
+    for match in token_pattern.finditer(source):
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+        token = match.group(kind)
+        if kind == "word":
+            type = KEYWORD if token in keywords else IDENTIFIER
+        elif kind == "error":
+            # Its own count, the running line and lineStart belong to the tracked tokens
+            errorLine = source.count("\n", 0, match.start()) + 1
+            tokens.errors.append(f"Error: Unexpected character {token!r} in source (line {errorLine})")
+            if verbose:
+                print(tokens.errors[-1])
+            continue
+        else:
+            type = token_codes[kind]
+
+        index = ids.get(token)
+        if index is None:
+            index = ids[token] = len(strings)
+            strings.append(sys.intern(token))
+        values.append(index)
+        types.append(type)
+        if lines is not None:
+            line += source.count("\n", lineStart, match.start())
+            lineStart = match.start()
+            lines.append(line)
 
-# Tokenize array of code lines( (token, type) )
-def tokenize(strings):
-    """Tokenize an array of strings based on spaces, specific punctuation, and quoted elements, with special handling for parentheses and brackets."""
-    # Regular expression to match quoted strings, words, and punctuation
-    pattern = r'"[^"]*"|[^\s";,.()\[\]~\-\/]+|[.,;(){}\[\]~\-\/]|[-~](?=\w)|\/'
-    
-    tokens = [] #(token, type)
-    
-    for string in strings:
-        # Find all matches according to the pattern
-        matches = re.findall(pattern, string)
-        
-        # Process each match
-        for match in matches:
-            if match.startswith('"') and match.endswith('"'):
-                # Handle quoted strings by removing quotes
-                tokens.append( (match[1:-1], "stringConstant") )  # Remove the surrounding quotes
-            else:
-                # Handle non-quoted strings and punctuation
-                tokens.append( (match, tokenType(match)) )
-    
     return tokens
 
-# Write xml token file, takes in an array of pairs(token, type)
-def tokenFile(tokens, output_file):
-    # Create the root element
-    root = ET.Element("tokens")
+class TokenStream:
+    """The tokens of one file kept in parallel arrays.
+
+    Each token is an index into a table of interned token strings plus a small
+    type code, with an optional source line per token. The cursor methods are
+    what the parser uses to walk the stream.
+    """
+    def __init__(self, track_lines=False):
+        self.strings = []          # interned token strings
+        self.ids = {}              # token string -> index into strings
+        self.values = array('I')   # index into strings per token
+        self.types = array('B')    # type code per token
+        self.lines = array('I') if track_lines else None
+        self.errors = []           # scanner error messages
+        self.pos = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        # (token, type) pairs, the type as its xml tag name
+        strings = self.strings
+        for index, type in zip(self.values, self.types):
+            yield strings[index], token_types[type]
 
-    # Iterate over the array and create a child element for each token
-    for token in tokens:
-        token_element = ET.SubElement(root, token[1])
-        token_element.text = f" {token[0]} "
+    def reset(self):
+        self.pos = 0
 
-    # Create an ElementTree object from the root element
-    tree = ET.ElementTree(root)
+    def advance(self):
+        self.pos += 1
 
-    # Root here is the root name, not tree root
-    root, ext = os.path.splitext(output_file)
-    # Create the new file name with 'T' before the extension
-    new_name = f"{root}T{ext}"
+    def current(self):
+        return self.strings[self.values[self.pos]]
 
-    # THIS CODE IS TO MAKE THE XML PRINT WITH INDENTS("PRETTY")
-    # Use a BytesIO buffer to capture the XML bytes
-    buffer = BytesIO()
-    tree.write(buffer, encoding='utf-8', xml_declaration=False)
+    def currentType(self):
+        return self.types[self.pos]
 
-    # Get the XML string from the buffer and decode it to a string
-    xml_bytes = buffer.getvalue()
-    xml_str = xml_bytes.decode('utf-8')
+    def peek(self):
+        return self.strings[self.values[self.pos+1]]
 
-    # Pretty-print the XML
-    pretty_xml = minidom.parseString(xml_str).toprettyxml(indent="    ")
+    def peekType(self):
+        return self.types[self.pos+1]
 
-    # Remove the XML declaration from the pretty-printed string
-    pretty_xml_lines = pretty_xml.splitlines()
-    if pretty_xml_lines[0].startswith('<?xml'):
-        pretty_xml_lines.pop(0)  # Remove the first line if it's the declaration
-    pretty_xml_final = "\n".join(pretty_xml_lines)
+    def previous(self):
+        return self.strings[self.values[self.pos-1]]
 
-    # Write the pretty-printed XML to a file
+    def line(self):
+        # Source line of the current token, 0 when lines are not tracked
+        if self.lines is None or self.pos >= len(self.lines):
+            return 0
+        return self.lines[self.pos]
+
+# Write xml token file, takes in a TokenStream
+def tokenFile(tokens, output_file):
+    # Root here is the root name, not tree root
+    root, ext = os.path.splitext(output_file)
+    # Create the new file name with 'T' before the extension
+    new_name = f"{root}T{ext}"
+
+    # Stream each token as a child element of <tokens>
     with open(new_name, "w", encoding="utf-8") as fh:
         print(f"Writing file: {new_name}")
-        fh.write(pretty_xml_final)
+        writer = XMLWriter(fh)
+        writer.openElement("tokens")
+        for token, type in tokens:
+            writer.leaf(type, f" {token} ")
+        writer.closeElement()
 
 def change_extension_to_xml(file_path):
     # Create a Path object
@@ -224,8 +243,8 @@ def change_extension_to_vm(file_path):
     
     return new_path
 
-# Create tokenized files of each jack file and return a dictionary containing the tokenized files by path {'path' : tokens[(token, type)]}
-def find_jack_files(directory_path):
+# Create tokenized files of each jack file and return a dictionary containing the tokenized files by path {'path' : TokenStream}
+def find_jack_files(directory_path, emit_xml = True, jack_files = None, profile = None):
     tokens_Dict = {} 
     VMPaths = {}
 
@@ -237,700 +256,907 @@ def find_jack_files(directory_path):
     # Create a pattern to match all .jack files in the directory
     pattern = os.path.join(directory_path, '*.jack')
     
-    # Use glob to find all .jack files
-    jack_files = glob.glob(pattern)
+    # Use glob to find all .jack files, sorted so output order is stable
+    if jack_files is None:
+        jack_files = sorted(glob.glob(pattern))
     
     if not jack_files:
         print("No .jack files found.")
     else:
-        print("\nFound .jack files and writing token.xml files...")
+        if emit_xml:
+            print("\nFound .jack files and writing token.xml files...")
+        else:
+            print("\nFound .jack files and tokenizing...")
         for file in jack_files:
             print(file)
             output = os.path.abspath(file)
             output_file_path = change_extension_to_xml(output)
             VMPaths[output_file_path] = change_extension_to_vm(output)
-            lines = read_and_parse_file(output)
-            tokens = tokenize(lines)
-            tXML = tokenFile(tokens, output_file_path)
+            with phase(profile, "read", output):
+                source = read_source(output)
+            with phase(profile, "tokenize", output):
+                tokens = tokenize(source)
+            if emit_xml:
+                with phase(profile, "tokens_xml", output):
+                    tokenFile(tokens, output_file_path)
+            if profile is not None:
+                profile.file(output)["tokens"] = len(tokens)
             tokens_Dict[output_file_path] = tokens
     return tokens_Dict, VMPaths
 
-def printXMLToken():
-    global currentToken
-    val = tokenPairs[currentToken][0]
-    type = tokenPairs[currentToken][1]
-    element = ET.SubElement(Parent.peek(), type)
-    element.text = f" {val} "
-
-def advanceToken():
-    global currentToken
-    currentToken += 1
-
-def lookAhead():
-    global currentToken
-    return tokenPairs[currentToken+1][0]
-
-def lookAheadType():
-    global currentToken
-    return tokenPairs[currentToken+1][1]
-
-def vmPeekAhead(index):
-    return tokenPairs[index+1][0]
-
-def lookBack():
-    global currentToken
-    return tokenPairs[currentToken-1][0]
-
-def currToken():
-    global currentToken
-    t = tokenPairs[currentToken][0]
-    return t
-
-def currTokenType():
-    global currentToken
-    t = tokenPairs[currentToken][1]
-    return t
-
-def process(str):
-    if (currToken() == str):
-        printXMLToken()
-    else:
-        print("Syntax Error at " + str)
-    # Get the next token
-    advanceToken()
-
-def compileClass():
-    print("Compile new file " + currentFile)
-    # <class> </class> is already added from init
-    process("class")
-    # Print ClassName and advance 1 token
-    printXMLToken()
-    advanceToken()
-    process("{")
-    compileClassVarDec()
-    compileSubroutine()
-    #This will error until other functions are completed.
-    process("}")
-
-def compileClassVarDec():
-    t = currToken()
-    if (t != "static" and t != "field"):
-        return
-
-    # Set new depth
-    global Parent
-    classVarDec = ET.SubElement(Parent.peek(), "classVarDec")
-    Parent.push(classVarDec)
-    
-    # For symbol table
-    pairs = []
-
-    # Next element must be static or field
-    while(tokenPairs[currentToken][0] != ";"):
-        # Fill array for symbol table
-        tokenP = tokenPairs[currentToken]
-        if tokenP[0] not in symbols:
-            pairs.append(tokenP)
-        # Loop up until ;
-        printXMLToken()
-        advanceToken()
-    process(";")
-
-    varType = pairs[1][0] #int
-    kind = pairs[0][0]   #field/static
-    # Add class vars to symbol table
-    global classSB
-    for i in range(2, len(pairs)):
-        classSB.define(pairs[i][0], varType, kind, "Dec")
-        
-    # Go back up to parent
-    Parent.pop()
-    compileClassVarDec()
-
-def compileSubroutine():
-    t = currToken()
-
-    if (t!= "constructor" and t!= "function" and t!= "method"):
-        return
+# Tokenize, compile and write the outputs of a single .jack file
+def compileFile(file_path, emit_xml = True, options = None, program = None):
+    output = os.path.abspath(file_path)
+    output_file_path = change_extension_to_xml(output)
+    source = read_source(output)
+    tokens = tokenize(source)
+    if emit_xml:
+        tokenFile(tokens, output_file_path)
+    unit = compileTokens(tokens, output_file_path, emit_xml, options, program)
+    writeVMFile(change_extension_to_vm(output), unit.VMCode)
+    return unit
+
+# Process pool task, returns (file, log, error) so the parent can report in order
+def compileJob(file_path, emit_xml, options, program):
+    log = io.StringIO()
+    error = None
+    with contextlib.redirect_stdout(log):
+        try:
+            unit = compileFile(file_path, emit_xml, options, program)
+            if unit.diagnostics:
+                error = unit.diagnostics[0]
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return file_path, log.getvalue(), error
+
+# Compile the given .jack files across a process pool, returns the files that failed
+def compileDirectoryParallel(jack_files, jobs, emit_xml = True, options = None, program = None):
+    # Imported here so that builds without -j do not pay for it
+    import concurrent.futures
+
+    print(f"\nFound .jack files, compiling with {jobs} processes...")
+    failed = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        # map yields results in submission order, so logs come out in file order
+        for file_path, log, error in executor.map(compileJob, jack_files, itertools.repeat(emit_xml), itertools.repeat(options), itertools.repeat(program)):
+            print(file_path)
+            print(log, end="")
+            if error is not None:
+                failed.append((file_path, error))
+
+    reportFailed(failed, len(jack_files))
+    return [file_path for file_path, error in failed]
+
+# Summary of the (file, first error) pairs of a directory build
+def reportFailed(failed, total):
+    if failed:
+        print(f"\n{len(failed)} of {total} files failed to compile:")
+        for file_path, error in failed:
+            print(f"  {file_path}: {error}")
+
+class CompileOptions:
+    """Settings that change the generated VM code.
+
+    level is the optimization level of -O: 0 lowers the IR as is, 1 folds
+    constants and lays out branches and constant multiplications the fast way,
+    2 also runs every peephole rule. peephole is the list of peephole rules to
+    run, None leaves the choice to the level. shift_helper allows calls to
+    Math.shiftRight, which only the Project_12 Math class has. pool_strings
+    builds every distinct string literal of a class once and keeps it in a
+    static, instead of building a new String each time it is evaluated. All
+    uses of a pooled literal share one String, so the subroutines it is passed
+    to must not dispose or change it; literals that are assigned or returned
+    are never pooled.
+    time_passes prints the time spent in every pass and does not change the code.
+
+    At level 2 calls to small subroutines are inlined, also across classes, a
+    subroutine that returns a call to itself jumps back to its start instead of
+    calling, and locals whose values are never needed at the same time share a
+    slot: inline_size is the largest callee in IR nodes, inline_depth how deep
+    calls inside inlined code are inlined again (0 turns inlining off).
+    inline_lib is a directory of classes, like the Project_12 OS, whose
+    subroutines may be inlined without being compiled.
+    """
+    def __init__(self, peephole = None, shift_helper = False, pool_strings = False, level = 1, time_passes = False,
+                 inline_size = 24, inline_depth = 2, inline_lib = None):
+        self.peephole = peephole
+        self.shift_helper = shift_helper
+        self.pool_strings = pool_strings
+        self.level = level
+        self.time_passes = time_passes
+        self.inline_size = inline_size
+        self.inline_depth = inline_depth
+        self.inline_lib = inline_lib
+
+    # Options from a compile server request, raises ValueError for unknown settings
+    @classmethod
+    def fromRequest(cls, message):
+        peephole = message.get("peephole")
+        if peephole is not None:
+            peephole = parse_rules(peephole)
+        level = message.get("level", 1)
+        if level not in levels:
+            raise ValueError(f"unknown optimization level {level!r}")
+        inline_size = message.get("inlineSize", 24)
+        inline_depth = message.get("inlineDepth", 2)
+        if not isinstance(inline_size, int) or not isinstance(inline_depth, int):
+            raise ValueError("inlineSize and inlineDepth must be integers")
+        return cls(peephole, bool(message.get("shiftHelper")), bool(message.get("poolStrings")), level,
+                   inline_size = inline_size, inline_depth = inline_depth, inline_lib = message.get("inlineLib"))
+
+    # True when a class is compiled against the other classes of the program
+    def inlining(self):
+        return self.level >= 2 and self.inline_depth > 0
+
+    # Short text that is different for every combination of options
+    def describe(self):
+        text = f" O{self.level}"
+        if self.peephole is not None:
+            text += " peephole=" + ",".join(self.peephole)
+        if self.shift_helper:
+            text += " shift-helper"
+        if self.pool_strings:
+            text += " pool-strings"
+        if self.inlining():
+            text += f" inline={self.inline_size}/{self.inline_depth}"
+            if self.inline_lib:
+                text += " inline-lib=" + os.path.abspath(self.inline_lib)
+        return text
+
+# The .jack files of a program: jack_files and the classes of lib_dir they do not define
+def program_files(jack_files, lib_dir = None):
+    files = list(jack_files)
+    if lib_dir:
+        names = {Path(file).stem for file in files}
+        files += [file for file in sorted(glob.glob(os.path.join(lib_dir, '*.jack'))) if Path(file).stem not in names]
+    return files
+
+# IR of every class of the program, by class name. Errors are left to the compile of each class
+def load_program(files):
+    program = {}
+    for file in files:
+        name = Path(file).stem
+        program[name] = CompilationUnit(tokenize(read_source(file), verbose = False), name).parseClass()
+    return program
+
+# Fingerprint of the sources of a program, a class compiled against other classes is
+# out of date as soon as any of them changes
+def programVersion(files):
+    digest = hashlib.sha256()
+    for file in files:
+        digest.update(Path(file).stem.encode("utf-8") + b"\0")
+        digest.update(Path(file).read_bytes())
+    return digest.hexdigest()[:16]
+
+# Fingerprint of the compiler sources, a build made by any other version is not reused
+def compilerVersion():
+    digest = hashlib.sha256()
+    for file in sorted(Path(__file__).parent.glob("*.py")):
+        digest.update(file.read_bytes())
+    return digest.hexdigest()[:16]
+
+class BuildCache:
+    """Manifest of the last build of a directory, kept in .jackcache.json.
+
+    Each class is keyed by the hash of its source and the compiler version;
+    a class whose entry matches and whose outputs still exist is skipped.
+    The CompileOptions are part of the version, so switching them rebuilds
+    every class.
+    """
+    file_name = ".jackcache.json"
+
+    def __init__(self, directory_path, settings = ""):
+        self.path = os.path.join(directory_path, self.file_name)
+        self.version = compilerVersion() + settings
+        self.entries = {}   # file name: {"hash": source hash, "xml": xml files written}
+        self.hashes = {}    # file path: source hash of this run
+        self.changed = False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                manifest = json.load(file)
+            if manifest.get("version") == self.version:
+                self.entries = manifest.get("files", {})
+        except (OSError, ValueError):
+            pass
 
-    # Create new local symbol table
-    if (t== "constructor" or t== "function" or t== "method"):
-        global localSB
-        localSB.reset()
+    def sourceHash(self, file_path):
+        file_path = os.path.abspath(file_path)
+        if file_path not in self.hashes:
+            self.hashes[file_path] = hashlib.sha256(Path(file_path).read_bytes()).hexdigest()
+        return self.hashes[file_path]
+
+    def outputs(self, file_path, emit_xml):
+        output = Path(os.path.abspath(file_path))
+        paths = [change_extension_to_vm(output)]
+        if emit_xml:
+            xml_path = change_extension_to_xml(output)
+            paths += [xml_path, xml_path.with_name(xml_path.stem + "T.xml")]
+        return paths
+
+    def isFresh(self, file_path, emit_xml):
+        entry = self.entries.get(os.path.basename(file_path))
+        if entry is None or entry["hash"] != self.sourceHash(file_path):
+            return False
+        if emit_xml and not entry["xml"]:
+            return False
+        return all(path.exists() for path in self.outputs(file_path, emit_xml))
+
+    # Files that need compiling, every file when force is set
+    def staleFiles(self, jack_files, emit_xml, force = False):
+        # Forget classes that were deleted since the last build
+        names = {os.path.basename(file) for file in jack_files}
+        if not names.issuperset(self.entries):
+            self.entries = {name: entry for name, entry in self.entries.items() if name in names}
+            self.changed = True
+        return [file for file in jack_files if force or not self.isFresh(file, emit_xml)]
+
+    def record(self, file_path, emit_xml):
+        self.entries[os.path.basename(file_path)] = {"hash": self.sourceHash(file_path), "xml": emit_xml}
+        self.changed = True
+
+    def save(self):
+        manifest = {"version": self.version, "files": self.entries}
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+class BuildProfile:
+    """Wall time and peak allocations of every phase of a build, for --profile.
+
+    Each file gets its phases (read, tokenize, tokens_xml, compile, write_vm), its
+    token and VM line counts and the time of every compiler pass. Phases that are
+    not about one file, like loading the program for inlining, are kept apart.
+    tracemalloc runs for the whole build, so the times are higher than without
+    --profile, and the peak of a phase is counted from what was allocated when it began.
+    """
+    def __init__(self):
+        self.files = {}     # path: {"tokens", "vm_lines", "phases", "passes"}
+        self.build = {}     # phase: {"seconds", "peak_kb"}
+        self.start = time.perf_counter()
+        tracemalloc.start()
+
+    def file(self, path):
+        return self.files.setdefault(str(path), {"tokens": 0, "vm_lines": 0, "phases": {}, "passes": {}})
+
+    def phase(self, name, path = None):
+        return PhaseProfile(self.build if path is None else self.file(path)["phases"], name)
+
+    def summary(self, options, status):
+        tracemalloc.stop()
+        phases = {}
+        for record in [self.build] + [entry["phases"] for entry in self.files.values()]:
+            for name, measured in record.items():
+                total = phases.setdefault(name, {"seconds": 0.0, "peak_kb": 0})
+                total["seconds"] = round(total["seconds"] + measured["seconds"], 6)
+                total["peak_kb"] = max(total["peak_kb"], measured["peak_kb"])
+        return {
+            "options": options.describe().strip(),
+            "status": status,
+            "seconds": round(time.perf_counter() - self.start, 6),
+            "tokens": sum(entry["tokens"] for entry in self.files.values()),
+            "vm_lines": sum(entry["vm_lines"] for entry in self.files.values()),
+            "phases": phases,
+            "build": self.build,
+            "files": self.files,
+        }
+
+class PhaseProfile:
+    def __init__(self, phases, name):
+        self.phases = phases
+        self.name = name
 
-    # Set new depth
-    global Parent
-    subroutineDec = ET.SubElement(Parent.peek(), "subroutineDec")
-    Parent.push(subroutineDec)
-    
-    meth = []
-    subInfo = [None] * 4 #name, type , localArgs, argCount
-    subInfo[2] = currentFile
-    # Print (method|function|constructor) type routineName
-    for i in range(0,3):
-        t = currToken()
-        if i == 2: # if void
-            subInfo[0] = t
-        if i == 0:
-            subInfo[1] = t
-        meth.append(t)
-        printXMLToken()
-        advanceToken()
-
-    # Add this to subroutine table if method
-    if meth[0] == "method":
-        localSB.define("this", meth[1], "argument")
-
-
-    VMCode.append(subInfo)
-    index_of_subroutine = len(VMCode) - 1
-
-    process("(")
-    compileParameterList()
-    subInfo[3] = classSB.varCount("field")
-    process(")")
-    compileSubroutineBody()
-    
-    localVarCount = localSB.varCount("local")
-    subInfo[2] = localVarCount
-
-    writeFunction(index_of_subroutine, subInfo)
-
-    Parent.pop()
-    compileSubroutine()
-
-# The is not currently in use anymore
-def compileParameterList(count = 0, firstFlag = True):
-    global localSB
-    # Set new depth
-    global Parent
-    if firstFlag:
-        paramList = ET.SubElement(Parent.peek(), "parameterList")
-        paramList.text = "\n"
-        Parent.push(paramList)
-
-    t = currToken()
-    # If next token is ) return
-    if (t == ")"):
-        Parent.pop()
+    def __enter__(self):
+        tracemalloc.reset_peak()
+        self.base = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        peak = tracemalloc.get_traced_memory()[1] - self.base
+        measured = self.phases.setdefault(self.name, {"seconds": 0.0, "peak_kb": 0})
+        measured["seconds"] = round(measured["seconds"] + seconds, 6)
+        measured["peak_kb"] = max(measured["peak_kb"], round(peak / 1024))
+
+# Time a step of the build when profiling, a no-op otherwise
+def phase(profile, name, path = None):
+    return contextlib.nullcontext() if profile is None else profile.phase(name, path)
+
+class CompilationUnit:
+    """Compiles one class; owns the token stream cursor, symbol tables, xml output and VM code.
+
+    parseClass reads the tokens into a ClassIR (see JackIR.py) while the xml parse
+    tree is written, generate runs the optimization passes of the chosen level and
+    lowers the IR to VMCode. compileClass does both.
+
+    Nothing is kept in module globals, so units can be compiled side by side in
+    threads. Progress and syntax errors are printed only when verbose is set;
+    syntax errors are always collected in diagnostics.
+    """
+    def __init__(self, tokens, class_name, xml_file = None, verbose = False, options = None):
+        self.stream = tokens
+        self.stream.reset()
+        self.className = class_name
+        self.xmlOut = XMLWriter(xml_file) if xml_file is not None else None
+        self.verbose = verbose
+        self.options = options if options is not None else CompileOptions()
+        self.diagnostics = list(tokens.errors)
+        self.classIR = None
+        self.VMCode = VMBuffer()
+        self.passes = PassManager(levels[self.options.level])
+        self.peephole = None
+        # Symbol Tables
+        self.classSB = SymbolTable()
+        self.localSB = SymbolTable()
+
+    def log(self, message):
+        if self.verbose:
+            print(message)
+
+    def error(self, message):
+        line = self.stream.line()
+        if line:
+            message += f" (line {line})"
+        self.diagnostics.append(message)
+        self.log(message)
+
+    def printXMLToken(self):
+        if self.xmlOut is not None:
+            self.xmlOut.leaf(token_types[self.stream.currentType()], f" {self.stream.current()} ")
+
+    # Open a new depth in the parse tree, nothing is written when only VM code is emitted
+    def openElement(self, tag, text = None):
+        if self.xmlOut is not None:
+            self.xmlOut.openElement(tag, text)
+
+    # Go back up to the parent element
+    def closeElement(self):
+        if self.xmlOut is not None:
+            self.xmlOut.closeElement()
+
+    def process(self, str):
+        if (self.stream.current() == str):
+            self.printXMLToken()
+        else:
+            self.error("Syntax Error at " + str)
+        # Get the next token
+        self.stream.advance()
+
+    def compileClass(self, program = None):
+        self.parseClass()
+        self.generate(program)
+
+    # Run the passes over the IR and lower it to VMCode, the peephole rules run on the VM code.
+    # program maps class names to the ClassIR of the other classes, see load_program
+    def generate(self, program = None):
+        self.passes.run(self.classIR, self.options, program)
+        with self.passes.timed("lower"):
+            self.VMCode = Lowering(self.classIR, self.options, fast = self.options.level > 0).lowerClass()
+        rules = self.options.peephole
+        if rules is None and self.options.level >= 2:
+            rules = parse_rules("all")
+        if rules is not None:
+            self.peephole = Peephole(rules)
+            with self.passes.timed("peephole"):
+                self.VMCode.rewrite(self.peephole.optimizeFunction)
+
+    def parseClass(self):
+        with self.passes.timed("parse"):
+            self.log("Compile new file " + self.className)
+            self.openElement("class")
+            self.process("class")
+            # Print ClassName and advance 1 token
+            self.printXMLToken()
+            self.stream.advance()
+            self.process("{")
+            self.compileClassVarDec()
+            self.classIR = ClassIR(self.className, self.classSB.varCount("static"))
+            self.compileSubroutine()
+            #This will error until other functions are completed.
+            self.process("}")
+            self.closeElement()
+        return self.classIR
+
+    # One classVarDec per iteration, declarations are not parsed recursively
+    def compileClassVarDec(self):
+        t = self.stream.current()
+        while (t == "static" or t == "field"):
+            # Set new depth
+            self.openElement("classVarDec")
+        
+            # For symbol table
+            names = []
+
+            # Next element must be static or field
+            while(t != ";"):
+                # Fill array for symbol table
+                if t not in symbols:
+                    names.append(t)
+                # Loop up until ;
+                self.printXMLToken()
+                self.stream.advance()
+                t = self.stream.current()
+            self.process(";")
+
+            varType = names[1] #int
+            kind = names[0]   #field/static
+            # Add class vars to symbol table
+            for i in range(2, len(names)):
+                self.classSB.define(names[i], varType, kind, "Dec")
+            
+            # Go back up to parent
+            self.closeElement()
+            t = self.stream.current()
+
+    # One subroutineDec per iteration, so the class size does not bound the recursion depth
+    def compileSubroutine(self):
+        t = self.stream.current()
+        while (t== "constructor" or t== "function" or t== "method"):
+            # Create new local symbol table
+            self.localSB.reset()
+
+            # Set new depth
+            self.openElement("subroutineDec")
+        
+            meth = []
+            # Print (method|function|constructor) type routineName
+            for i in range(0,3):
+                meth.append(self.stream.current())
+                self.printXMLToken()
+                self.stream.advance()
+            kind, name = meth[0], meth[2]
+
+            # Add this to subroutine table if method
+            if kind == "method":
+                self.localSB.define("this", meth[1], "argument")
+
+            self.process("(")
+            self.compileParameterList()
+            self.process(")")
+            body = self.compileSubroutineBody()
+            if kind == "constructor":
+                self.log("")
+
+            self.classIR.subroutines.append(Subroutine(self.className + "." + name, kind,
+                self.localSB.varCount("local"), self.classSB.varCount("field"), body,
+                self.localSB.varCount("argument")))
+
+            self.closeElement()
+            t = self.stream.current()
+
+    def compileParameterList(self):
+        # Set new depth
+        self.openElement("parameterList", "\n")
+
+        count = 0
+        t = self.stream.current()
+        # Loop up until )
+        while (t != ")"):
+            if self.stream.currentType() == IDENTIFIER and self.stream.peekType() != IDENTIFIER:
+                self.localSB.define(t, self.stream.previous(), "argument")
+                count += 1
+            self.process(t)
+            t = self.stream.current()
+        self.closeElement()
         return count
-    else:
-        if currTokenType() == "identifier" and lookAheadType() != "identifier":
-            localSB.define(t, lookBack(), "argument")
-            count += 1
-        process(t)
-    return compileParameterList(count, False)
-
-def compileSubroutineBody():
-    # Set new depth
-    global Parent
-    subBody = ET.SubElement(Parent.peek(), "subroutineBody")
-    Parent.push(subBody)
-
-    process("{") 
-    compileVarDec()
-    compileStatements()
-    process("}")
-    Parent.pop()
-
-def compileVarDec():
-    t = currToken()
-    if (t != "var"):
-        return
 
-    # Set new depth
-    global Parent
-    varDec = ET.SubElement(Parent.peek(), "varDec")
-    Parent.push(varDec)
-    
-    # For symbol table
-    global localSB
-    vars = []
-
-    # Next element must be a var declaration
-    t = currToken()
-    while(t != ";"):
-        if t not in symbols:
-            vars.append(t)
-        # Loop up until ;
-        process(t)
-        t = currToken()
-    process(";")
-
-    # First two indeces of vars are 'var' and type
-    varType = vars[1] #int, char, Class
-    # Add class vars to symbol table
-    global classSB
-    for i in range(2, len(vars)):
-        #print(vars[i])
-        localSB.define(vars[i], varType, "local", "Dec")
-
-    # Go back up to parent
-    Parent.pop()
-    compileVarDec()
-
-def compileStatements(firstFlag = True):
-    # Set new depth
-    global Parent
-    if firstFlag:
-        statements = ET.SubElement(Parent.peek(), "statements")
-        statements.text = "\n"
-        Parent.push(statements)
-    t = currToken()
-    #print("Statement t: " + t)
-    if(t=="let"):
-        compileLet()
-    elif(t=="do"):
-        compileDo()
-    elif(t=="if"):
-        compileIf()
-    elif(t=="while"):
-        compileWhile()
-    elif(t=="return"):
-        compileReturn()
-    else:
-        Parent.pop()
-        return
-    
-    compileStatements(False)
-
-def compileLet():
-    # Add depth
-    global Parent
-    letStatement = ET.SubElement(Parent.peek(), "letStatement")
-    Parent.push(letStatement)
-
-    # Print let and varName
-    printXMLToken()
-    advanceToken() 
-    t = currToken() # varName
-    isArray = False
-    if lookAhead() == "[":
-        isArray = True
-        if classSB.kindOf(t) != "NONE":
-            writePush(classSB.kindOf(t), classSB.indexOf(t))
-        elif localSB.kindOf(t) != "NONE":
-            writePush(localSB.kindOf(t), localSB.indexOf(t))
-    process(t)
-    variableUsed = t
-    #check array
-    if currToken() == "[":
-        process("[")
-        compileExpression()
-        VMCode.append("add")
-        process("]")
-    process("=")
-    compileExpression()
-    if isArray:
-        VMCode.append("pop temp 0")
-        VMCode.append("pop pointer 1")
-        VMCode.append("push temp 0")
-        VMCode.append("pop that 0")
-    elif classSB.kindOf(t) != "NONE":
-        writePop(classSB.kindOf(variableUsed), classSB.indexOf(variableUsed))
-    elif localSB.kindOf(t) != "NONE":
-        writePop(localSB.kindOf(variableUsed), localSB.indexOf(variableUsed))
-    process(";")
-    Parent.pop()
-
-def compileIf():
-    global ifWhileCounter
-    L1 = ifWhileCounter
-    L2 = L1+1
-    ifWhileCounter += 2
-
-    #print("If L1,L2 --" + str(L1) + "," + str(L2) )
-    # Add depth
-    global Parent
-    ifStatement = ET.SubElement(Parent.peek(), "ifStatement")
-    Parent.push(ifStatement)
-
-    process("if")
-    process("(")
-    compileExpression()
-    VMCode.append("not")
-    writeIf("if-goto L" + str(L1))
-    process(")")
-    process("{")
-    compileStatements()
-    writeGoto("goto L" + str(L2))
-    process("}")
-    #check if there is an else statement
-    t = currToken()
-    writeLabel("L" + str(L1))
-    if t == "else":
-        process("else")
-        process("{")
-        compileStatements()
-        process("}")
-    writeLabel("L" + str(L2))
-    Parent.pop()
-
-def compileWhile():
-    global ifWhileCounter
-    L1 = ifWhileCounter
-    L2 = L1+1
-    ifWhileCounter += 2
-
-    #print("While L1,L2 --" + str(L1) + "," + str(L2) )
-    # Add depth
-    global Parent
-    whileStatement = ET.SubElement(Parent.peek(), "whileStatement")
-    Parent.push(whileStatement)
-
-    process("while")
-    writeLabel("L" + str(L1))
-    process("(")
-    compileExpression()
-    process(")")
-    VMCode.append("not")
-    process("{")
-    writeIf("if-goto L" + str(L2))
-    compileStatements()
-    writeGoto("goto L" + str(L1))
-    process("}")
-    writeLabel("L" + str(L2))
-    Parent.pop()
-
-def compileDo():
-    # Add depth
-    global Parent
-    doStatement = ET.SubElement(Parent.peek(), "doStatement")
-    Parent.push(doStatement)
-
-    # Going to be name(exp *,exp) or nameA.nameB(exp *,exp) or nameA.nameB.nameC etc
-    call = []
-    process("do")
-    t = currToken()
-    while (t !=  "("):
-        call.append(t)
-        process(t)
-        t = currToken()
-    process("(")
-    count = compileExpressionList()
-    #print("Do count: " + str(count))
-    process(")")
-    vmString = ""
-    if len(call) == 1: #Method call that takes in the class. ie Math.double(this)
-        vmString = currentFile + "." + call[0] 
-        count = 1
-        VMCode.append("push pointer 0")
-    # if this is a method call on an obj variable ie square.new(); where field Square square
-    elif classObj(call[0]):
-        tab = whatTable(call[0])
-        vmString = call[0].capitalize() + "." + call[2]
-        tab = whatTable(call[0])
-        if tab == "class":
-            VMCode.append("push this " + str(classSB.indexOf(call[0])) )
-            count = 1
-        else:
-            k = localSB.kindOf(call[0])
-            VMCode.append("push " + k + " "+ str(localSB.indexOf(call[0])))
-            vmString = localSB.typeOf(call[0]) + call[1] + call[2]
-            count = 1
-    else:
-        for elem in call:
-            vmString += elem
-    writeCall(vmString, count)
-    writePop("temp", 0)
-    process(";")
-    Parent.pop()
-
-def whatTable(obj):
-    if classSB.kindOf(obj) != "NONE":
-        return "class"
-    if localSB.kindOf(obj) != "NONE":
-        return "local"
-
-def classObj(obj):
-    if classSB.kindOf(obj) != "NONE":
-        return True
-    if localSB.kindOf(obj) != "NONE":
-        return True
-    else:
-        return False
-
-def compileReturn():
-    # Add depth
-    global Parent
-    returnStatement = ET.SubElement(Parent.peek(), "returnStatement")
-    Parent.push(returnStatement)
-
-    process("return")
-    emptyReturn = True
-    t = currToken()
-    if t!= ";":
-        emptyReturn = False
-        compileExpression()
-    process(";")
-    writeReturn(emptyReturn)
-    Parent.pop()
-
-def compileExpression(first_call=True):
-    expression = ET.SubElement(Parent.peek(), "expression")
-    expression.text = "\n"
-    Parent.push(expression)
-
-    t = currToken()
-    #print("Expression t: " + t)
-    compileTerm()
-    # Check for (op term)*
-    t = currToken()
-    if t in operators:
-       op = t 
-       process(t) # Should be the op
-       compileTerm()
-       #VMCode.append((t, "op"))
-       writeArithmetic(t)
-    Parent.pop()
-
-def compileTerm(firstFlag = True):
-    global Parent
-    if firstFlag:
-        term = ET.SubElement(Parent.peek(), "term")
-        term.text = "\n"
-        Parent.push(term)
-
-    t = currToken()
-    #print("Term t: " + t)
-    ty = currTokenType()
-    #print("Type is: " + ty)
-
-    if ty == "identifier":
-        # This will go ahead for a term like a[i] where we are at a
-        if lookAhead() == "[":
-            # b[j] push b, push j, add
-            if classSB.kindOf(t) != "NONE":
-                writePush(classSB.kindOf(t), classSB.indexOf(t))
-            elif localSB.kindOf(t) != "NONE":
-                writePush(localSB.kindOf(t), localSB.indexOf(t))
-            process(t)
-            process("[")
-            compileExpression(False)
-            process("]")
-            VMCode.append("add")
-            VMCode.append("pop pointer 1")
-            VMCode.append("push that 0")
-            Parent.pop()
-            return
-        if lookAhead() == ".": # example : Keyboard.readInt("ENTER THE NEXT NUMBER: ");
-            callString = t
-            process(t)
-            process(".")
-            t = currToken()
-            process(t)
-            callString += "." + t
-            # (
-            t = currToken()
-            process(t)
-            count = compileExpressionList()
-            process(")")
-            Parent.pop()
-            writeCall(callString, count)
-            return
-        if lookAhead() == "(":
-            pass
-    process(t)
-    if t == "(":
-        compileExpression(False)
-        process(")")
-    if t == "-" or t == "~":
-        compileTerm()
-        writeArithmetic(t, True)
-    elif t != "(":
-        if classSB.kindOf(t) != "NONE":
-            writePush(classSB.kindOf(t), classSB.indexOf(t))
-        elif localSB.kindOf(t) != "NONE":
-            if t == "this":
-                writePush("pointer",0)
+    def compileSubroutineBody(self):
+        # Set new depth
+        self.openElement("subroutineBody")
+
+        self.process("{") 
+        self.compileVarDec()
+        body = self.compileStatements()
+        self.process("}")
+        self.closeElement()
+        return body
+
+    def compileVarDec(self):
+        t = self.stream.current()
+        while (t == "var"):
+            # Set new depth
+            self.openElement("varDec")
+        
+            # For symbol table
+            vars = []
+
+            # Next element must be a var declaration
+            while(t != ";"):
+                if t not in symbols:
+                    vars.append(t)
+                # Loop up until ;
+                self.process(t)
+                t = self.stream.current()
+            self.process(";")
+
+            # First two indeces of vars are 'var' and type
+            varType = vars[1] #int, char, Class
+            # Add class vars to symbol table
+            for i in range(2, len(vars)):
+                #print(vars[i])
+                self.localSB.define(vars[i], varType, "local", "Dec")
+
+            # Go back up to parent
+            self.closeElement()
+            t = self.stream.current()
+
+    # Returns the list of statements
+    def compileStatements(self):
+        # Set new depth
+        self.openElement("statements", "\n")
+        statements = []
+        while True:
+            t = self.stream.current()
+            #print("Statement t: " + t)
+            if(t=="let"):
+                statement = self.compileLet()
+            elif(t=="do"):
+                statement = self.compileDo()
+            elif(t=="if"):
+                statement = self.compileIf()
+            elif(t=="while"):
+                statement = self.compileWhile()
+            elif(t=="return"):
+                statement = self.compileReturn()
             else:
-                writePush(localSB.kindOf(t), localSB.indexOf(t))
+                self.closeElement()
+                return statements
+            if statement is not None:
+                statements.append(statement)
+
+    # Var for a name, subroutine scope first; None when the name is not declared
+    def lookup(self, name):
+        for table in (self.localSB, self.classSB):
+            kind = table.kindOf(name)
+            if kind != "NONE":
+                return Var(segments[kind], table.indexOf(name))
+        return None
+
+    def typeOf(self, name):
+        if self.localSB.kindOf(name) != "NONE":
+            return self.localSB.typeOf(name)
+        return self.classSB.typeOf(name)
+
+    # Var for a name that must be declared, an undeclared name is reported and reads as 0
+    def variable(self, name):
+        var = self.lookup(name)
+        if var is None:
+            self.error("Undefined variable " + name)
+            var = Var("constant", 0)
+        return var
+
+    def compileLet(self):
+        # Add depth
+        self.openElement("letStatement")
+
+        # Print let and varName
+        self.printXMLToken()
+        self.stream.advance() 
+        t = self.stream.current() # varName
+        target = self.variable(t)
+        self.process(t)
+        #check array
+        if self.stream.current() == "[":
+            self.process("[")
+            target = Index(target, self.compileExpression())
+            self.process("]")
+        self.process("=")
+        value = self.compileExpression()
+        self.process(";")
+        self.closeElement()
+        if isinstance(target, Var) and target.segment == "constant":
+            return None
+        return Let(target, value)
+
+    def compileIf(self):
+        # Add depth
+        self.openElement("ifStatement")
+
+        self.process("if")
+        self.process("(")
+        condition = self.compileExpression()
+        self.process(")")
+        self.process("{")
+        then = self.compileStatements()
+        self.process("}")
+        #check if there is an else statement
+        otherwise = None
+        if self.stream.current() == "else":
+            self.process("else")
+            self.process("{")
+            otherwise = self.compileStatements()
+            self.process("}")
+        self.closeElement()
+        return If(condition, then, otherwise)
+
+    def compileWhile(self):
+        # Add depth
+        self.openElement("whileStatement")
+
+        self.process("while")
+        self.process("(")
+        condition = self.compileExpression()
+        self.process(")")
+        self.process("{")
+        body = self.compileStatements()
+        self.process("}")
+        self.closeElement()
+        return While(condition, body)
+
+    def compileDo(self):
+        # Add depth
+        self.openElement("doStatement")
+
+        self.process("do")
+        call = self.compileSubroutineCall()
+        self.process(";")
+        self.closeElement()
+        return Do(call)
+
+    # name(args), Class.name(args) or variable.name(args). A method gets its object
+    # as first argument, this for name(args) and the variable for variable.name(args)
+    def compileSubroutineCall(self):
+        name = self.stream.current()
+        self.process(name)
+        if self.stream.current() == ".":
+            self.process(".")
+            subroutine = self.stream.current()
+            self.process(subroutine)
+            receiver = self.lookup(name)
+            if receiver is not None:
+                callName = self.typeOf(name) + "." + subroutine
+            else:
+                callName = name + "." + subroutine
         else:
-            if ty == "stringConstant":
-                writeString(t)
+            receiver = Var("pointer", 0)
+            callName = self.className + "." + name
+        self.process("(")
+        args = self.compileExpressionList()
+        self.process(")")
+        if receiver is not None:
+            args.insert(0, receiver)
+        return Call(callName, args)
+
+    def compileReturn(self):
+        # Add depth
+        self.openElement("returnStatement")
+
+        self.process("return")
+        value = None
+        t = self.stream.current()
+        if t!= ";":
+            value = self.compileExpression()
+        self.process(";")
+        self.closeElement()
+        return Return(value)
+
+    # (op term)* is read left to right, so a - b + c is (a - b) + c
+    def compileExpression(self, first_call=True):
+        self.openElement("expression", "\n")
+
+        expr = self.compileTerm()
+        # Check for (op term)*
+        t = self.stream.current()
+        while t in operators:
+            self.process(t) # Should be the op
+            expr = Binary(t, expr, self.compileTerm())
+            t = self.stream.current()
+        self.closeElement()
+        return expr
+
+    def compileTerm(self, firstFlag = True):
+        if firstFlag:
+            self.openElement("term", "\n")
+
+        t = self.stream.current()
+        #print("Term t: " + t)
+        ty = self.stream.currentType()
+        #print("Type is: " + ty)
+
+        if ty == IDENTIFIER:
+            # This will go ahead for a term like a[i] where we are at a
+            if self.stream.peek() == "[":
+                base = self.variable(t)
+                self.process(t)
+                self.process("[")
+                expr = Index(base, self.compileExpression(False))
+                self.process("]")
+            elif self.stream.peek() == "." or self.stream.peek() == "(": # example : Keyboard.readInt("ENTER THE NEXT NUMBER: ");
+                expr = self.compileSubroutineCall()
             else:
-                writePush("constant", t)
-        # VMCode.append((t, ty))
-    Parent.pop()
-
-def compileExpressionList():
-    # Set new depth
-    global Parent
-    expressionList = ET.SubElement(Parent.peek(), "expressionList")
-    expressionList.text = "\n"
-    Parent.push(expressionList)
-
-    count = 0
-
-    t = currToken()
-    #print("Expression list = " + t)
-    while(t != ")"):
-        if t == ",":
-            process(",")
-        else:  
-            count += 1  
-            compileExpression()
-        t = currToken()
-    Parent.pop()
-    return count
-
-def compileTokens(tokens, output_file):
-    # Make these variables global so no passing around
-    global tree
-    global Parent
-    global tokenPairs
-    global currentFile
-    global currentToken
-    global VMCurrentToken
-    global VMStack
-    global VMCode
-    global ifWhileCounter
-    global classSB
-    global localSB
-
-    # Init
-    root = ET.Element("class")
-    tree = ET.ElementTree(root)
-    tokenPairs  = tokens
-    Parent = Stack()
-    Parent.push(root)
-
-    currentToken = 0
-    VMCurrentToken = 0
-    ifWhileCounter = 0
-    currentFile = output_file.stem
-    VMStack = Stack()
-    VMCode = []
-    # Symbol Tables
-    classSB = SymbolTable()
-    localSB = SymbolTable() 
-    
-    compileClass()
-
-    # THIS CODE IS TO MAKE THE XML PRINT WITH INDENTS("PRETTY")
-    # Use a BytesIO buffer to capture the XML bytes
-    buffer = BytesIO()
-    tree.write(buffer, encoding='utf-8', xml_declaration=False)
-
-    # Get the XML string from the buffer and decode it to a string
-    xml_bytes = buffer.getvalue()
-    xml_str = xml_bytes.decode('utf-8')
-
-    # Pretty-print the XML
-    pretty_xml = minidom.parseString(xml_str).toprettyxml(indent="    ")
-
-    # Remove the XML declaration from the pretty-printed string
-    pretty_xml_lines = pretty_xml.splitlines()
-    if pretty_xml_lines[0].startswith('<?xml'):
-        pretty_xml_lines.pop(0)  # Remove the first line if it's the declaration
-    
-    # Join the lines back together, filtering out empty lines
-    pretty_xml_final = "\n".join(line for line in pretty_xml_lines if line.strip())
-
-    # Write the pretty-printed XML to a file
-    with open(output_file, "w", encoding="utf-8") as fh:
-        print(f"Writing file: {output_file}")
-        fh.write(pretty_xml_final)
-
-    #classSB.define("a", "int", "field")
-    classSB.print_elements("Class")
-    localSB.print_elements("Local")
-
-def writeVMFile(file_path):
-    with open(file_path, 'w', encoding='utf-8') as file:
-    # Write each element of the array to the file
-        global VMCode
-        #file.write("***** My compile VM code, remove for submission *****\n")
-        for item in VMCode:
-            file.write(f"{item}\n") 
-
-def writeString(s):
-    for index, char in enumerate(s):
-        if index == 0:
-            VMCode.append("push constant " + str(len(s)))
-            VMCode.append("call String.new 1")
+                expr = self.variable(t)
+                self.process(t)
+        elif ty == INTEGER_CONSTANT:
+            expr = Const(int(t) & WORD_MASK)
+            self.process(t)
+        elif ty == STRING_CONSTANT:
+            expr = String(t)
+            self.process(t)
+        elif t == "true":
+            expr = Const(TRUE_WORD)
+            self.process(t)
+        elif t == "false" or t == "null":
+            expr = Const(0)
+            self.process(t)
+        elif t == "this":
+            expr = Var("pointer", 0)
+            self.process(t)
+        elif t == "-" or t == "~":
+            self.process(t)
+            expr = Unary(t, self.compileTerm())
         else:
-            VMCode.append("call String.appendChar 2")
-        VMCode.append("push constant " + str(ord(char)))
-    VMCode.append("call String.appendChar 2")
-
-
-def writePush(segment, index):
-    if index == "this":
-        VMCode.append("push pointer 0")
-    elif segment == "field":
-        VMCode.append("push this " + str(index))
-    elif index == "true":
-       VMCode.append("push constant 1")
-       VMCode.append("neg")
-    elif index == "false" or index == "null":
-        VMCode.append("push constant 0")
+            self.process("(")
+            expr = self.compileExpression(False)
+            self.process(")")
+        self.closeElement()
+        return expr
+
+    # Returns the list of argument expressions
+    def compileExpressionList(self):
+        # Set new depth
+        self.openElement("expressionList", "\n")
+
+        args = []
+
+        t = self.stream.current()
+        #print("Expression list = " + t)
+        while(t != ")"):
+            if t == ",":
+                self.process(",")
+            else:  
+                args.append(self.compileExpression())
+            t = self.stream.current()
+        self.closeElement()
+        return args
+
+# Compile a TokenStream into a CompilationUnit, emit_xml=False skips writing the .xml parse tree
+# quiet=True skips the symbol tables and the other reports
+def compileTokens(tokens, output_file, emit_xml = True, options = None, program = None, quiet = False):
+    if emit_xml:
+        # The parse tree is streamed to the file while compiling
+        with open(output_file, "w", encoding="utf-8") as fh:
+            unit = CompilationUnit(tokens, output_file.stem, fh, verbose = not quiet, options = options)
+            unit.compileClass(program)
+            if not quiet:
+                print(f"Writing file: {output_file}")
     else:
-        VMCode.append("push " + str(segment) + " " + str(index))
+        unit = CompilationUnit(tokens, output_file.stem, verbose = not quiet, options = options)
+        unit.compileClass(program)
+    if quiet:
+        return unit
+
+    unit.classSB.print_elements("Class")
+    unit.localSB.print_elements("Local")
+    if unit.classIR.inlined:
+        print(f"Inlined {unit.classIR.inlined} calls")
+    if unit.classIR.frames:
+        frames = unit.classIR.frames
+        print(f"Frame sizes: {sum(before for name, before, after in frames)} -> {sum(after for name, before, after in frames)} locals")
+        for name, before, after in frames:
+            if after != before:
+                print(f"  {name}: {before} -> {after}")
+    if unit.peephole is not None:
+        print(unit.peephole.report())
+    if unit.options.time_passes:
+        print(f"Pass timing: {unit.passes.report()}")
+    return unit
+
+def writeVMFile(file_path, VMCode):
+    # The whole class goes out in a single write, returns the number of lines
+    text = VMCode.text()
+    with open(file_path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    return text.count("\n")
+
+# Compile the source of one class to VM code, without any disk I/O or printing
+# Errors are appended to diagnostics when a list is given
+def compile_source(text, class_name, diagnostics = None, options = None, program = None):
+    unit = CompilationUnit(tokenize(text, track_lines = True, verbose = False), class_name, options = options)
+    unit.compileClass(program)
+    if diagnostics is not None:
+        diagnostics.extend(unit.diagnostics)
+    return unit.VMCode.text()
+
+class CompileService:
+    """Answers compile requests for the --serve mode and for JackClient.
+
+    A request is {"path": ...} or {"source": ..., "class": ...}, optionally with
+    "peephole", "shiftHelper", "poolStrings", "level", "inlineSize", "inlineDepth" and
+    "inlineLib" set as in the command line; the answer is {"vm": ..., "diagnostics": [...]}.
+    Results are cached by class name and source hash, so an unchanged class costs
+    one hash on the next request. When inlining, a class given by path is compiled
+    against the other classes of its directory, and their sources are part of the key.
+    """
+    cache_size = 512
 
-def writePop(segment, index):
-    if segment == "field":
-        VMCode.append("pop this " +  str(index))
-    else:
-        VMCode.append("pop " + segment +  " " +  str(index))
-
-def writeArithmetic(command, term = False):
-    if command == "*":
-        VMCode.append("call Math.multiply 2")
-    elif command == "/":
-        VMCode.append("call Math.divide 2")
-    elif command == "+":
-        VMCode.append("add")
-    elif command == "-":
-        if term:
-             VMCode.append("neg")
+    def __init__(self):
+        self.results = {}
+
+    def handle(self, message):
+        try:
+            if "path" in message:
+                path = Path(message["path"])
+                source = path.read_text(encoding="utf-8")
+                class_name = path.stem
+            else:
+                source = message["source"]
+                class_name = message.get("class") or "Main"
+            options = CompileOptions.fromRequest(message)
+            files = []
+            if options.inlining():
+                siblings = sorted(glob.glob(str(path.parent / '*.jack'))) if "path" in message else []
+                files = program_files([file for file in siblings if Path(file).stem != class_name], options.inline_lib)
+                version = programVersion(files)
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            return {"vm": "", "diagnostics": [f"Error: Bad request. Details: {e}"]}
+
+        settings = options.describe()
+        if files:
+            settings += " program=" + version
+        key = (class_name, hashlib.sha256(source.encode("utf-8")).hexdigest(), settings)
+        result = self.results.pop(key, None)
+        if result is None:
+            diagnostics = []
+            try:
+                program = load_program(files) if files else None
+                vm = compile_source(source, class_name, diagnostics, options, program)
+            except Exception as e:
+                vm = ""
+                diagnostics.append(f"Error: The compiler failed on {class_name}. Details: {e!r}")
+            result = {"vm": vm, "diagnostics": diagnostics}
+            if len(self.results) >= self.cache_size:
+                # Drop the least recently used class
+                del self.results[next(iter(self.results))]
+        # Re-insert so the dict stays in least recently used order
+        self.results[key] = result
+        return result
+
+# Keep the compiler loaded and answer JackClient requests on a Unix socket
+def serve(socket_path):
+    import socket
+    import socketserver
+    import stat
+    import threading
+    from JackClient import read_message, write_message
+
+    service = CompileService()
+    lock = threading.Lock()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            message = read_message(self.rfile)
+            if message is not None:
+                with lock:
+                    response = service.handle(message)
+                write_message(self.wfile, response)
+
+    # Only a socket nobody answers on was left behind by a server that died and is replaced
+    if os.path.exists(socket_path):
+        if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            print(f"Error: {socket_path} exists and is not a socket")
+            return 1
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:
+            os.unlink(socket_path)
+        except OSError as e:
+            print(f"Error: Cannot check {socket_path}: {e}")
+            return 1
         else:
-            VMCode.append("sub")
-    elif command == "~":
-        VMCode.append("not")
-    elif command == "<":
-        VMCode.append("lt")
-    elif command == ">":
-        VMCode.append("gt")
-    elif command == "=":
-        VMCode.append("eq")
-    elif command == "&":
-        VMCode.append("and")
-    elif command == "|":
-        VMCode.append("or")
-
-def writeLabel(label):
-    VMCode.append("label " + label)
-
-def writeGoto(label):
-    VMCode.append(label)
-
-def writeIf(label):
-    VMCode.append(label)
-
-def writeCall(name, nArgs):
-    VMCode.append("call " + name + " " + str(nArgs))
-
-
-def writeFunction(index, subinfo):
-    # Subinfo = [name, type , localArgs, size]
-    if subinfo[1] == "constructor":
-        print()
-        VMCode[index] = ("function " + currentFile + "." + subinfo[0] + " " + str(subinfo[2]))
-        VMCode.insert(index+1, "push constant " + str(subinfo[3]))
-        VMCode.insert(index+2, "call Memory.alloc 1")
-        VMCode.insert(index+3, "pop pointer 0")
-    elif subinfo[1] == "method":
-        VMCode[index] = ("function " + currentFile + "." + subinfo[0] + " " + str(subinfo[2]))
-        VMCode.insert(index+1, "push argument 0")
-        VMCode.insert(index+2, "pop pointer 0")
-    else:
-        VMCode[index] = (subinfo[1] + " " + currentFile + "." + subinfo[0] + " " + str(subinfo[2]))
-
-def writeReturn(empty):
-    if empty:
-        writePush("constant", 0)
-    VMCode.append("return")
+            print(f"Error: A server is already listening on {socket_path}")
+            return 1
+        finally:
+            probe.close()
+    with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as server:
+        try:
+            print(f"Serving compile requests on {socket_path}")
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+    return 0
 
 class SymbolTable:
     def __init__(self):
@@ -1006,6 +1232,56 @@ class SBElement:
                     f"Index: {self.index:<10}, "
                     f"Usage: {self.usage:<10}")
 
+class XMLWriter:
+    """Streams the indented xml straight to a file as the parser descends.
+
+    The layout matches what the old ElementTree -> minidom.toprettyxml round
+    trip produced: four space indents, leaf tokens on one line, elements with
+    only whitespace text written as "<tag>" and "</tag>" lines, no blank lines
+    and no trailing newline. Only the open elements are kept in memory.
+    """
+    indent = "    "
+    escapes = str.maketrans({"&": "&amp;", "<": "&lt;", '"': "&quot;", ">": "&gt;"})
+
+    def __init__(self, file):
+        self.file = file
+        self.open = Stack()   # [tag, text, start tag written]
+        self.separator = ""
+
+    def writeLine(self, line):
+        self.file.write(self.separator + line)
+        self.separator = "\n"
+
+    # Write the start tag of the innermost element once it gets a child
+    def startParent(self):
+        if not self.open.is_empty():
+            parent = self.open.peek()
+            if not parent[2]:
+                parent[2] = True
+                self.writeLine(self.indent * (self.open.size() - 1) + f"<{parent[0]}>")
+
+    def openElement(self, tag, text = None):
+        self.startParent()
+        self.open.push([tag, text, False])
+
+    def closeElement(self):
+        tag, text, started = self.open.pop()
+        depth = self.indent * self.open.size()
+        if started:
+            self.writeLine(f"{depth}</{tag}>")
+        elif text is None:
+            self.writeLine(f"{depth}<{tag}/>")
+        else:
+            # Text that holds a newline leaves the closing tag unindented
+            element = f"{depth}<{tag}>{text.translate(self.escapes)}</{tag}>"
+            for line in element.split("\n"):
+                if line.strip():
+                    self.writeLine(line)
+
+    def leaf(self, tag, text):
+        self.startParent()
+        self.writeLine(self.indent * self.open.size() + f"<{tag}>{text.translate(self.escapes)}</{tag}>")
+
 class Stack:
     def __init__(self):
         self.items = []
@@ -1031,6 +1307,98 @@ class Stack:
     def size(self):
         return len(self.items)
 
+# Compile a .jack file, or the classes of a directory the build cache considers stale.
+# Returns the exit code; with a BuildProfile every phase of every file is measured
+def build(path, emit_xml, jobs, force, options, profile = None):
+    if os.path.isfile(path):
+        # Change the file extension
+        output_file_path = change_extension_to_xml(path)
+        vm_file_path = change_extension_to_vm(path)
+        print(f"Reading file: {path}")
+        # Read the file contents and scan them into tokens
+        with phase(profile, "read", os.path.abspath(path)):
+            source = read_source(path)
+        with phase(profile, "tokenize", os.path.abspath(path)):
+            tokens = tokenize(source)
+        if emit_xml:
+            with phase(profile, "tokens_xml", os.path.abspath(path)):
+                tokenFile(tokens, output_file_path)
+        program = None
+        if options.inlining():
+            # The other classes of the directory are only read, to inline their subroutines
+            siblings = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(path)), '*.jack')))
+            with phase(profile, "load_program"):
+                program = load_program(program_files([file for file in siblings if Path(file).stem != Path(path).stem], options.inline_lib))
+        print("Compiling file now...")
+        with phase(profile, "compile", os.path.abspath(path)):
+            unit = compileTokens(tokens, output_file_path, emit_xml, options, program, quiet = profile is not None)
+        print("Writing VM file now...")
+        with phase(profile, "write_vm", os.path.abspath(path)):
+            lines = writeVMFile(vm_file_path, unit.VMCode)
+        if profile is not None:
+            record(profile, os.path.abspath(path), tokens, unit, lines)
+    elif os.path.isdir(path):
+        # Only classes whose source or compiler changed since the last build are compiled
+        jack_files = sorted(glob.glob(os.path.join(path, '*.jack')))
+        settings = options.describe()
+        if options.inlining():
+            # Every class depends on the others, so any change rebuilds them all
+            files = program_files(jack_files, options.inline_lib)
+            settings += " program=" + programVersion(files)
+        cache = BuildCache(path, settings)
+        stale = cache.staleFiles(jack_files, emit_xml, force)
+        if len(stale) < len(jack_files):
+            print(f"{len(jack_files) - len(stale)} of {len(jack_files)} classes are up to date.")
+            if not stale:
+                if cache.changed:
+                    cache.save()
+                return 0
+
+        program = None
+        if options.inlining():
+            with phase(profile, "load_program"):
+                program = load_program(files)
+        failed = []
+        try:
+            if jobs > 1:
+                failed = compileDirectoryParallel(stale, jobs, emit_xml, options, program)
+                for file in stale:
+                    if file not in failed:
+                        cache.record(file, emit_xml)
+            else:
+                tDict, VMPaths = find_jack_files(path, emit_xml, stale, profile)
+                print("Compiling files now...")
+                # tDict = xml path : [tokens, vmpath]
+                for key, value in tDict.items():
+                    source_path = key.with_suffix('.jack')
+                    with phase(profile, "compile", source_path):
+                        unit = compileTokens(value, key, emit_xml, options, program, quiet = profile is not None)
+                    with phase(profile, "write_vm", source_path):
+                        lines = writeVMFile(VMPaths[key], unit.VMCode)
+                    if profile is not None:
+                        record(profile, source_path, value, unit, lines)
+                    # A class with errors stays stale, so the next build reports them again
+                    if unit.diagnostics:
+                        failed.append((str(source_path), unit.diagnostics[0]))
+                    else:
+                        cache.record(source_path, emit_xml)
+                reportFailed(failed, len(stale))
+        finally:
+            cache.save()
+        if failed:
+            return 1
+    else:
+        print(f"Error: The path {path} is neither a file nor a directory.")
+        return 1
+    return 0
+
+# Sizes and pass times of a compiled file for the profile
+def record(profile, path, tokens, unit, vm_lines):
+    entry = profile.file(path)
+    entry["tokens"] = len(tokens)
+    entry["vm_lines"] = vm_lines
+    entry["passes"] = {name: round(seconds, 6) for name, seconds in unit.passes.timings.items()}
+
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description="Open and read the contents of a file.")
@@ -1039,37 +1407,153 @@ def main():
     parser.add_argument(
         'path', 
         type=str, 
+        nargs='?',
         help="Path to the file or dir."
     )
+
+    # Add argument for which outputs to write
+    parser.add_argument(
+        '--emit',
+        choices=["all", "vm"],
+        default="all",
+        help="'all' writes the .xml, T.xml and .vm files, 'vm' only generates the .vm files."
+    )
+
+    # Add argument for parallel compilation of a directory
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help="Number of processes used to compile a directory, 0 uses every CPU."
+    )
+
+    # Add argument to rebuild classes the build cache considers up to date
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help="Recompile every class of a directory, ignoring the build cache."
+    )
+    
+    # Add argument to run the peephole optimizer over the VM code
+    parser.add_argument(
+        '--peephole',
+        action='store_true',
+        help="Run the peephole optimizer with every rule."
+    )
+    parser.add_argument(
+        '--peephole-rules',
+        metavar='RULES',
+        default=None,
+        help="Run the peephole optimizer with only these rules, a comma separated list of rule names."
+    )
+
+    # Add argument to allow calls to the Math.shiftRight helper of the Project_12 OS
+    parser.add_argument(
+        '--shift-helper',
+        action='store_true',
+        help="Compile x / 2^k to Math.shiftRight when x is known to be non-negative, needs the Project_12 Math class."
+    )
+
+    # Add argument to build each string literal once per class
+    parser.add_argument(
+        '--pool-strings',
+        action='store_true',
+        help="Build every distinct string literal of a class once and reuse it, instead of allocating a new String per evaluation. "
+             "Literals passed as arguments are shared and must not be disposed or changed by the callee; "
+             "literals that are assigned or returned always get a new String."
+    )
+
+    # Add argument for the optimization level
+    parser.add_argument(
+        '-O',
+        dest='level',
+        type=int,
+        choices=sorted(levels),
+        default=1,
+        help="Optimization level: 0 lowers the code as parsed, 1 (default) folds constants and fuses branches, 2 adds inlining, tail calls, frame packing and the peephole rules."
+    )
+
+    # Add arguments for the inlining done at -O2
+    parser.add_argument(
+        '--inline-lib',
+        metavar='DIR',
+        default=None,
+        help="Directory of library classes, like Project_12, whose small subroutines -O2 may inline without compiling them."
+    )
+    parser.add_argument(
+        '--inline-size',
+        type=int,
+        default=24,
+        metavar='N',
+        help="Largest subroutine, in IR nodes, that -O2 inlines (default 24)."
+    )
+    parser.add_argument(
+        '--inline-depth',
+        type=int,
+        default=2,
+        metavar='N',
+        help="How deep calls inside inlined code are inlined again at -O2, 0 turns inlining off (default 2)."
+    )
+
+    # Add argument to report the time of each compiler pass
+    parser.add_argument(
+        '--time-passes',
+        action='store_true',
+        help="Print the time spent parsing, in every optimization pass and in lowering, for each file."
+    )
+
+    # Add argument to measure the build instead of printing its progress
+    parser.add_argument(
+        '--profile',
+        metavar='FILE',
+        default=None,
+        help="Measure wall time, peak allocations, tokens and VM lines of every phase of every file and write them as JSON to FILE ('-' for stdout) instead of any other output; compiles in one process."
+    )
+
+    # Add argument to keep the compiler loaded and answer JackClient requests
+    parser.add_argument(
+        '--serve',
+        nargs='?',
+        const="",
+        metavar='SOCKET',
+        help="Serve compile requests on a Unix socket, defaults to $JACKC_SOCKET or a per-user socket in the temp dir."
+    )
     
     # Parse the arguments
     args = parser.parse_args()
+    if args.serve is not None:
+        from JackClient import default_socket_path
+        return serve(args.serve or default_socket_path())
+    if args.path is None:
+        parser.error("the path argument is required")
     path = args.path
+    emit_xml = args.emit == "all"
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+    peephole = None
+    if args.peephole or args.peephole_rules is not None:
+        try:
+            peephole = parse_rules(args.peephole_rules)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.inline_lib is not None and not os.path.isdir(args.inline_lib):
+        parser.error(f"--inline-lib {args.inline_lib} is not a directory")
+    options = CompileOptions(peephole, args.shift_helper, args.pool_strings, args.level, args.time_passes,
+                             args.inline_size, args.inline_depth, args.inline_lib)
     
-    # Change the file extension
-    output_file_path = change_extension_to_xml(path)
-    vm_file_path = change_extension_to_vm(path)
-
-    # Check if the path is a file or directory and process accordingly
-    if os.path.isfile(path):
-        print(f"Reading file: {path}")
-        # Read and print file contents, filtered out to lines of code in an array
-        lines = read_and_parse_file(path)
-        tokens = tokenize(lines)
-        tXML = tokenFile(tokens, output_file_path)
-        print("Compiling file now...")
-        compileTokens(tokens, output_file_path)
-        print("Writing VM file now...")
-        writeVMFile(vm_file_path)
-    elif os.path.isdir(path):
-        tDict, VMPaths = find_jack_files(path)
-        print("Compiling files now...")
-        # tDict = xml path : [tokens, vmpath]
-        for key, value in tDict.items():
-            compileTokens(value, key)
-            writeVMFile(VMPaths[key])
+    if args.profile is None:
+        return build(path, emit_xml, jobs, args.force, options)
+
+    # Everything the build prints is dropped, only the summary is written
+    profile = BuildProfile()
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        status = build(path, emit_xml, 1, args.force, options, profile)
+    summary = json.dumps(profile.summary(options, status), indent=2)
+    if args.profile == "-":
+        print(summary)
     else:
-        print(f"Error: The path {path} is neither a file nor a directory.")
+        with open(args.profile, 'w', encoding='utf-8') as file:
+            file.write(summary + "\n")
+    return status
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,1134 @@
+import copy
+import itertools
+import time
+
+# Intermediate representation of a Jack class, made by the parser in JackCompiler.py.
+# Expressions are trees, every subroutine holds a list of statements. Optimization
+# passes rewrite the trees, then Lowering turns the class into VM commands.
+
+# Constant folding works on 16-bit words kept as 0..65535, like the Hack ALU
+WORD_MASK = 0xFFFF
+TRUE_WORD = 0xFFFF
+
+def signed_word(value):
+    return value - 0x10000 if value & 0x8000 else value
+
+def fold_binary(op, left, right):
+    """Value of `left op right` for two constant words, None when it must be left to run time."""
+    if op == '+':
+        return (left + right) & WORD_MASK
+    if op == '-':
+        return (left - right) & WORD_MASK
+    if op == '*':
+        return (signed_word(left) * signed_word(right)) & WORD_MASK
+    if op == '/':
+        x, y = signed_word(left), signed_word(right)
+        # Math.divide reports division by zero at run time, and -32768 has no positive twin
+        if y == 0 or x == -0x8000 or y == -0x8000:
+            return None
+        q = abs(x) // abs(y)
+        return (q if (x < 0) == (y < 0) else -q) & WORD_MASK
+    if op == '&':
+        return left & right
+    if op == '|':
+        return left | right
+    if op == '<':
+        return TRUE_WORD if signed_word(left) < signed_word(right) else 0
+    if op == '>':
+        return TRUE_WORD if signed_word(left) > signed_word(right) else 0
+    if op == '=':
+        return TRUE_WORD if left == right else 0
+    return None
+
+def fold_unary(op, value):
+    if op == '-':
+        return -value & WORD_MASK
+    return ~value & WORD_MASK
+
+# k when value is 2^k for 1 <= k <= 14, else None
+def shift_of(value):
+    if 2 <= value <= 0x4000 and value & (value - 1) == 0:
+        return value.bit_length() - 1
+    return None
+
+# Expressions
+
+class Const:
+    __slots__ = ("value",)
+    def __init__(self, value):
+        self.value = value          # 16-bit word, 0..65535
+
+class String:
+    __slots__ = ("text",)
+    def __init__(self, text):
+        self.text = text
+
+class Var:
+    __slots__ = ("segment", "index")
+    def __init__(self, segment, index):
+        self.segment = segment      # VM segment: local, argument, static, this or pointer
+        self.index = index
+
+class Index:
+    __slots__ = ("base", "index")
+    def __init__(self, base, index):
+        self.base = base            # base[index], base is a Var or, after inlining, any expression
+        self.index = index
+
+class Unary:
+    __slots__ = ("op", "operand")
+    def __init__(self, op, operand):
+        self.op = op                # '-' or '~'
+        self.operand = operand
+
+class Binary:
+    __slots__ = ("op", "left", "right")
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+class Call:
+    __slots__ = ("name", "args")
+    def __init__(self, name, args):
+        self.name = name            # Class.subroutine
+        self.args = args            # a method call has the object as first argument
+
+# Statements
+
+class Let:
+    __slots__ = ("target", "value")
+    def __init__(self, target, value):
+        self.target = target        # Var or Index
+        self.value = value
+
+class If:
+    __slots__ = ("condition", "then", "otherwise")
+    def __init__(self, condition, then, otherwise = None):
+        self.condition = condition
+        self.then = then
+        self.otherwise = otherwise  # None when there is no else block
+
+class While:
+    __slots__ = ("condition", "body")
+    def __init__(self, condition, body):
+        self.condition = condition
+        self.body = body
+
+class Do:
+    __slots__ = ("call",)
+    def __init__(self, call):
+        self.call = call
+
+class Return:
+    __slots__ = ("value",)
+    def __init__(self, value = None):
+        self.value = value          # None for a void return
+
+class Subroutine:
+    def __init__(self, name, kind, locals, fields, body, arguments = None):
+        self.name = name            # Class.subroutine
+        self.kind = kind            # function, method or constructor
+        self.locals = locals
+        self.fields = fields        # size of the object a constructor allocates
+        self.body = body
+        self.arguments = arguments  # argument count, this included, None when unknown
+
+class ClassIR:
+    def __init__(self, name, statics):
+        self.name = name
+        self.statics = statics
+        self.subroutines = []
+        self.inlined = 0        # calls replaced by the inlining pass
+        self.frames = []        # (subroutine, locals before, locals after) of pack_locals
+
+# Rewrite every expression of a statement list bottom up, rewrite(expr) returns the new expression
+def rewrite_expression(expr, rewrite):
+    if isinstance(expr, Binary):
+        expr.left = rewrite_expression(expr.left, rewrite)
+        expr.right = rewrite_expression(expr.right, rewrite)
+    elif isinstance(expr, Unary):
+        expr.operand = rewrite_expression(expr.operand, rewrite)
+    elif isinstance(expr, Index):
+        expr.base = rewrite_expression(expr.base, rewrite)
+        expr.index = rewrite_expression(expr.index, rewrite)
+    elif isinstance(expr, Call):
+        expr.args = [rewrite_expression(arg, rewrite) for arg in expr.args]
+    return rewrite(expr)
+
+def rewrite_statements(statements, rewrite):
+    for statement in statements:
+        if isinstance(statement, Let):
+            if isinstance(statement.target, Index):
+                statement.target.base = rewrite_expression(statement.target.base, rewrite)
+                statement.target.index = rewrite_expression(statement.target.index, rewrite)
+            statement.value = rewrite_expression(statement.value, rewrite)
+        elif isinstance(statement, If):
+            statement.condition = rewrite_expression(statement.condition, rewrite)
+            rewrite_statements(statement.then, rewrite)
+            if statement.otherwise is not None:
+                rewrite_statements(statement.otherwise, rewrite)
+        elif isinstance(statement, While):
+            statement.condition = rewrite_expression(statement.condition, rewrite)
+            rewrite_statements(statement.body, rewrite)
+        elif isinstance(statement, Do):
+            statement.call = rewrite_expression(statement.call, rewrite)
+        elif isinstance(statement, Return) and statement.value is not None:
+            statement.value = rewrite_expression(statement.value, rewrite)
+
+# Every node of an expression, the expression itself first
+def walk_expression(expr):
+    yield expr
+    if isinstance(expr, Binary):
+        yield from walk_expression(expr.left)
+        yield from walk_expression(expr.right)
+    elif isinstance(expr, Unary):
+        yield from walk_expression(expr.operand)
+    elif isinstance(expr, Index):
+        yield from walk_expression(expr.base)
+        yield from walk_expression(expr.index)
+    elif isinstance(expr, Call):
+        for arg in expr.args:
+            yield from walk_expression(arg)
+
+# Every statement of a list, the statements of nested blocks included
+def walk_statements(statements):
+    for statement in statements:
+        yield statement
+        if isinstance(statement, If):
+            yield from walk_statements(statement.then)
+            if statement.otherwise is not None:
+                yield from walk_statements(statement.otherwise)
+        elif isinstance(statement, While):
+            yield from walk_statements(statement.body)
+
+# The expressions of one statement, without those of its nested blocks
+def statement_expressions(statement):
+    if isinstance(statement, Let):
+        return [statement.target, statement.value]
+    if isinstance(statement, (If, While)):
+        return [statement.condition]
+    if isinstance(statement, Do):
+        return [statement.call]
+    if isinstance(statement, Return) and statement.value is not None:
+        return [statement.value]
+    return []
+
+# Number of IR nodes in a statement list
+def statements_size(statements):
+    size = 0
+    for statement in walk_statements(statements):
+        size += 1
+        for expr in statement_expressions(statement):
+            size += sum(1 for node in walk_expression(expr))
+    return size
+
+# True when evaluating expr may call a subroutine, a string literal calls String.new
+def has_call(expr):
+    return any(isinstance(node, (Call, String)) for node in walk_expression(expr))
+
+# True when expr is known to never be negative
+def non_negative(expr):
+    if isinstance(expr, Const):
+        return expr.value <= 0x7FFF
+    if isinstance(expr, Binary):
+        if expr.op == '&':
+            return non_negative(expr.left) or non_negative(expr.right)
+        if expr.op in ('|', '/'):
+            return non_negative(expr.left) and non_negative(expr.right)
+    if isinstance(expr, Call):
+        return expr.name == "Math.shiftRight"
+    return False
+
+# True when expr is always 0 or true (-1). An if-goto jumps on any value that is not 0,
+# while Jack only takes a branch on true, so only such a condition may skip the not
+def is_boolean(expr):
+    if isinstance(expr, Const):
+        return expr.value in (0, TRUE_WORD)
+    if isinstance(expr, Binary):
+        if expr.op in ('<', '>', '='):
+            return True
+        if expr.op in ('&', '|'):
+            return is_boolean(expr.left) and is_boolean(expr.right)
+    if isinstance(expr, Unary) and expr.op == '~':
+        return is_boolean(expr.operand)
+    return False
+
+# Passes, each one rewrites a ClassIR in place. program maps the name of every class
+# the compiler knows about to its ClassIR, the class itself included
+
+def fold_constants(cls, options, program):
+    def fold(expr):
+        if isinstance(expr, Binary) and isinstance(expr.left, Const) and isinstance(expr.right, Const):
+            value = fold_binary(expr.op, expr.left.value, expr.right.value)
+            if value is not None:
+                return Const(value)
+        elif isinstance(expr, Unary) and isinstance(expr.operand, Const):
+            return Const(fold_unary(expr.op, expr.operand.value))
+        return expr
+    for subroutine in cls.subroutines:
+        rewrite_statements(subroutine.body, fold)
+
+# if and while on a constant condition keep only the code that can run
+def prune_branches(cls, options, program):
+    def prune(statements):
+        out = []
+        for statement in statements:
+            if isinstance(statement, If):
+                prune(statement.then)
+                if statement.otherwise is not None:
+                    prune(statement.otherwise)
+                # Only true runs the then block, like the not; if-goto of the plain layout
+                if isinstance(statement.condition, Const):
+                    if statement.condition.value == TRUE_WORD:
+                        out.extend(statement.then)
+                    elif statement.otherwise is not None:
+                        out.extend(statement.otherwise)
+                    continue
+            elif isinstance(statement, While):
+                prune(statement.body)
+                if isinstance(statement.condition, Const) and statement.condition.value != TRUE_WORD:
+                    continue
+            out.append(statement)
+        statements[:] = out
+    for subroutine in cls.subroutines:
+        prune(subroutine.body)
+
+# x / 1 is x, and x / 2^k is a right shift when x is not negative and Math.shiftRight may be used.
+# Multiplications by constants are left to Lowering, which turns them into add chains.
+def reduce_strength(cls, options, program):
+    def reduce(expr):
+        if isinstance(expr, Binary) and expr.op == '/' and isinstance(expr.right, Const):
+            if expr.right.value == 1:
+                return expr.left
+            shift = shift_of(expr.right.value)
+            if shift is not None and options.shift_helper and non_negative(expr.left):
+                return Call("Math.shiftRight", [expr.left, Const(shift)])
+        return expr
+    for subroutine in cls.subroutines:
+        rewrite_statements(subroutine.body, reduce)
+
+class NotInlinable(Exception):
+    pass
+
+class Inliner:
+    """Replaces calls to small subroutines of any class of the program by a copy of their body.
+
+    A call in a do, a let or a return statement takes the whole body: the arguments
+    and locals of the callee become new locals of the caller, and the value of its
+    final return takes the place of the call. A call inside an expression is only
+    replaced when the callee is a single return of an expression without calls and
+    the arguments have no side effects. Fields of the callee are read through the
+    object, statics of another class only when they are always 0 (like Memory's
+    Ram array). Constructors and recursive subroutines are never inlined, labels
+    are not in the IR, Lowering makes them for the caller.
+    """
+    def __init__(self, cls, options, program):
+        self.cls = cls
+        self.maxSize = options.inline_size
+        self.maxDepth = options.inline_depth
+        self.subroutines = {}   # name: Subroutine
+        self.owners = {}        # name: ClassIR of the subroutine
+        for other in program.values():
+            for subroutine in other.subroutines:
+                self.subroutines[subroutine.name] = subroutine
+                self.owners[subroutine.name] = other
+        self.zeros = {}         # class name: indices of its statics that are always 0
+        self.calls = {}         # name: names the subroutine calls
+        self.recursive = {}     # name: True when the subroutine can call itself
+        self.caller = None
+
+    def run(self):
+        for subroutine in self.cls.subroutines:
+            self.caller = subroutine
+            subroutine.body = self.statements(subroutine.body, 0)
+
+    def statements(self, statements, depth):
+        out = []
+        for statement in statements:
+            if isinstance(statement, If):
+                statement.condition = self.expression(statement.condition, depth)
+                statement.then = self.statements(statement.then, depth)
+                if statement.otherwise is not None:
+                    statement.otherwise = self.statements(statement.otherwise, depth)
+            elif isinstance(statement, While):
+                statement.condition = self.expression(statement.condition, depth)
+                statement.body = self.statements(statement.body, depth)
+            else:
+                expanded = self.expandStatement(statement, depth)
+                if expanded is not None:
+                    out.extend(self.statements(expanded, depth + 1))
+                    continue
+                rewrite_statements([statement], lambda expr: self.inlineExpression(expr, depth))
+            out.append(statement)
+        return out
+
+    def expression(self, expr, depth):
+        return rewrite_expression(expr, lambda node: self.inlineExpression(node, depth))
+
+    # The statements that replace a do, let or return of a call, None when it stays a call
+    def expandStatement(self, statement, depth):
+        call = statement.call if isinstance(statement, Do) else statement.value
+        if depth >= self.maxDepth or not isinstance(call, Call):
+            return None
+        if isinstance(statement, Let) and isinstance(statement.target, Index):
+            # The address is computed before the value, so the callee must not be able to change it
+            if not (self.stable(statement.target.base) and self.stable(statement.target.index)):
+                return None
+        callee = self.candidate(call)
+        if callee is None:
+            return None
+        call.args = [self.expression(arg, depth) for arg in call.args]
+
+        locals = self.caller.locals
+        try:
+            prologue = []
+            bindings = []
+            assigned = {target.index for target in self.assignedVars(callee) if target.segment == "argument"}
+            for i, arg in enumerate(call.args):
+                if i in assigned or not self.stable(arg):
+                    slot = self.newLocal()
+                    prologue.append(Let(Var("local", slot), arg))
+                    arg = Var("local", slot)
+                bindings.append(arg)
+            base = self.caller.locals
+            self.caller.locals += callee.locals
+            # Locals start at 0 on every call, also when the copy runs in a loop
+            prologue += [Let(Var("local", base + i), Const(0)) for i in range(callee.locals)]
+            body = self.translate(callee, bindings, base)
+        except NotInlinable:
+            self.caller.locals = locals
+            return None
+
+        value = body.pop().value
+        self.cls.inlined += 1
+        if isinstance(statement, Do):
+            # The value is dropped, but it may still have side effects
+            if value is not None and has_call(value):
+                body.append(Do(value))
+        elif isinstance(statement, Let):
+            body.append(Let(statement.target, value if value is not None else Const(0)))
+        else:
+            body.append(Return(value if value is not None else Const(0)))
+        return prologue + body
+
+    # The value of a call whose callee only returns an expression, the call itself otherwise
+    def inlineExpression(self, expr, depth):
+        if depth >= self.maxDepth or not isinstance(expr, Call):
+            return expr
+        callee = self.candidate(expr)
+        if callee is None or len(callee.body) != 1 or callee.body[0].value is None:
+            return expr
+        value = callee.body[0].value
+        if has_call(value) or any(has_call(arg) for arg in expr.args):
+            return expr
+        # An argument used more than once is evaluated again for every use
+        uses = self.argumentUses(callee, value)
+        for i, arg in enumerate(expr.args):
+            if uses.get(i, 0) > 1 and not isinstance(arg, (Const, Var)):
+                return expr
+        try:
+            body = self.translate(callee, expr.args, None)
+        except NotInlinable:
+            return expr
+        self.cls.inlined += 1
+        return self.expression(body[0].value, depth + 1)
+
+    # The callee of call when it may be inlined
+    def candidate(self, call):
+        callee = self.subroutines.get(call.name)
+        if callee is None or callee.kind == "constructor" or callee is self.caller:
+            return None
+        body = callee.body
+        if not body or not isinstance(body[-1], Return) or statements_size(body) > self.maxSize:
+            return None
+        # The only return must be the last statement
+        if any(isinstance(statement, Return) for statement in walk_statements(body[:-1])):
+            return None
+        if self.isRecursive(callee.name):
+            return None
+        return callee
+
+    # Constants and the caller's own arguments and locals, which the callee cannot change
+    def stable(self, expr):
+        if isinstance(expr, Const):
+            return True
+        return isinstance(expr, Var) and expr.segment in ("local", "argument", "pointer")
+
+    def newLocal(self):
+        self.caller.locals += 1
+        return self.caller.locals - 1
+
+    def assignedVars(self, callee):
+        return [statement.target for statement in walk_statements(callee.body)
+                if isinstance(statement, Let) and isinstance(statement.target, Var)]
+
+    # How often each argument is read by expr, the object of a method counts as argument 0
+    def argumentUses(self, callee, expr):
+        uses = {}
+        for node in walk_expression(expr):
+            if isinstance(node, Var):
+                if node.segment == "argument":
+                    uses[node.index] = uses.get(node.index, 0) + 1
+                elif node.segment in ("this", "pointer"):
+                    uses[0] = uses.get(0, 0) + 1
+        return uses
+
+    # A copy of the callee's body in terms of the caller. bindings[i] is the value of argument i,
+    # the callee's locals start at local base. Raises NotInlinable when the body cannot be moved
+    def translate(self, callee, bindings, base):
+        owner = self.owners[callee.name]
+        same = owner is self.cls
+        zeros = self.zeroStatics(owner)
+        body = copy.deepcopy(callee.body)
+
+        def binding(index):
+            if index >= len(bindings):
+                raise NotInlinable()
+            return copy.deepcopy(bindings[index])
+
+        def move(expr):
+            if not isinstance(expr, Var):
+                return expr
+            if expr.segment == "argument":
+                return binding(expr.index)
+            if expr.segment == "local":
+                if base is None:
+                    raise NotInlinable()
+                return Var("local", base + expr.index)
+            if expr.segment == "static":
+                if same:
+                    return expr
+                if expr.index in zeros:
+                    return Const(0)
+                raise NotInlinable()
+            if expr.segment == "pointer":
+                return binding(0)
+            # A field, of this when the caller has the same object
+            receiver = binding(0)
+            if same and isinstance(receiver, Var) and receiver.segment == "pointer":
+                return expr
+            return Index(receiver, Const(expr.index))
+
+        rewrite_statements(body, move)
+        for statement in walk_statements(body):
+            if isinstance(statement, Let) and isinstance(statement.target, Var):
+                target = statement.target
+                if target.segment == "static" and not same:
+                    raise NotInlinable()
+                statement.target = move(target)
+        return body
+
+    # Statics of a class that are never set to anything but 0
+    def zeroStatics(self, cls):
+        if cls.name not in self.zeros:
+            zeros = set(range(cls.statics))
+            for subroutine in cls.subroutines:
+                for statement in walk_statements(subroutine.body):
+                    if isinstance(statement, Let) and isinstance(statement.target, Var) and statement.target.segment == "static":
+                        if not (isinstance(statement.value, Const) and statement.value.value == 0):
+                            zeros.discard(statement.target.index)
+            self.zeros[cls.name] = zeros
+        return self.zeros[cls.name]
+
+    def calledNames(self, name):
+        if name not in self.calls:
+            body = self.subroutines[name].body
+            self.calls[name] = {node.name for statement in walk_statements(body)
+                                for expr in statement_expressions(statement)
+                                for node in walk_expression(expr) if isinstance(node, Call)}
+        return self.calls[name]
+
+    # True when name can reach itself through the calls of the program
+    def isRecursive(self, name):
+        if name not in self.recursive:
+            seen = set()
+            pending = list(self.calledNames(name))
+            found = False
+            while pending:
+                current = pending.pop()
+                if current == name:
+                    found = True
+                    break
+                if current in seen or current not in self.subroutines:
+                    continue
+                seen.add(current)
+                pending.extend(self.calledNames(current))
+            self.recursive[name] = found
+        return self.recursive[name]
+
+def inline_calls(cls, options, program):
+    Inliner(cls, options, program).run()
+
+class LocalPacker:
+    """Lets locals whose values are never needed at the same time share a slot.
+
+    A backward liveness pass over the statements finds the locals still to be read
+    after every assignment to a local; the assigned local may not share a slot with
+    any of them. Function entry sets every local to 0, so the locals read before
+    they are assigned are live there and keep apart from each other. Assignments
+    that are never read are dropped first, or kept as a do when the value calls a
+    subroutine, then the locals are given the lowest slot their neighbours leave free.
+    Last, assignments of 0 to a slot that nothing has written since entry are dropped.
+    """
+    def __init__(self, subroutine):
+        self.subroutine = subroutine
+        self.after = {}     # id of a let: (let, locals live after it)
+
+    def pack(self):
+        # A dropped assignment can make the ones before it dead as well
+        entry = self.liveBefore(self.subroutine.body, frozenset())
+        while self.dropDeadStores(self.subroutine.body):
+            self.after = {}
+            entry = self.liveBefore(self.subroutine.body, frozenset())
+
+        edges = {}
+        def interfere(local, others):
+            for other in others:
+                if other != local:
+                    edges.setdefault(local, set()).add(other)
+                    edges.setdefault(other, set()).add(local)
+        for local in entry:
+            interfere(local, entry)
+        for statement, live in self.after.values():
+            interfere(statement.target.index, live)
+
+        slots = {}
+        for local in sorted(self.mentioned()):
+            taken = {slots[other] for other in edges.get(local, ()) if other in slots}
+            slot = 0
+            while slot in taken:
+                slot += 1
+            slots[local] = slot
+
+        def move(expr):
+            if isinstance(expr, Var) and expr.segment == "local":
+                return Var("local", slots[expr.index])
+            return expr
+        rewrite_statements(self.subroutine.body, move)
+        for statement in walk_statements(self.subroutine.body):
+            if isinstance(statement, Let):
+                statement.target = move(statement.target)
+        self.subroutine.locals = max(slots.values()) + 1 if slots else 0
+        self.dropEntryZeros()
+
+    # let x = 0 before anything else writes the slot of x, the function command already set it
+    def dropEntryZeros(self):
+        written = set()
+        out = []
+        for statement in self.subroutine.body:
+            if isinstance(statement, Let) and isinstance(statement.target, Var) and statement.target.segment == "local":
+                if isinstance(statement.value, Const) and statement.value.value == 0 and statement.target.index not in written:
+                    continue
+            for nested in walk_statements([statement]):
+                if isinstance(nested, Let) and isinstance(nested.target, Var) and nested.target.segment == "local":
+                    written.add(nested.target.index)
+            out.append(statement)
+        self.subroutine.body[:] = out
+
+    def uses(self, expr):
+        return {node.index for node in walk_expression(expr) if isinstance(node, Var) and node.segment == "local"}
+
+    # Locals live before statements, given those live after them
+    def liveBefore(self, statements, live):
+        for statement in reversed(statements):
+            if isinstance(statement, Let):
+                target = statement.target
+                if isinstance(target, Var) and target.segment == "local":
+                    self.after[id(statement)] = (statement, live)
+                    live = live - {target.index}
+                else:
+                    live = live | self.uses(target)
+                live = live | self.uses(statement.value)
+            elif isinstance(statement, If):
+                otherwise = live
+                if statement.otherwise is not None:
+                    otherwise = self.liveBefore(statement.otherwise, live)
+                live = self.liveBefore(statement.then, live) | otherwise | self.uses(statement.condition)
+            elif isinstance(statement, While):
+                # The loop test is reached from before the loop and from the end of the body
+                head = live | self.uses(statement.condition)
+                while True:
+                    loop = head | self.liveBefore(statement.body, head)
+                    if loop == head:
+                        break
+                    head = loop
+                live = head
+            elif isinstance(statement, Do):
+                live = live | self.uses(statement.call)
+            elif isinstance(statement, Return):
+                live = frozenset(self.uses(statement.value)) if statement.value is not None else frozenset()
+        return frozenset(live)
+
+    # Remove assignments to locals that are not live after them, True when any was removed
+    def dropDeadStores(self, statements):
+        out = []
+        dropped = False
+        for statement in statements:
+            if isinstance(statement, If):
+                dropped |= self.dropDeadStores(statement.then)
+                if statement.otherwise is not None:
+                    dropped |= self.dropDeadStores(statement.otherwise)
+            elif isinstance(statement, While):
+                dropped |= self.dropDeadStores(statement.body)
+            elif id(statement) in self.after and statement.target.index not in self.after[id(statement)][1]:
+                dropped = True
+                if has_call(statement.value):
+                    out.append(Do(statement.value))
+                continue
+            out.append(statement)
+        statements[:] = out
+        return dropped
+
+    def mentioned(self):
+        locals = set()
+        for statement in walk_statements(self.subroutine.body):
+            for expr in statement_expressions(statement):
+                locals |= self.uses(expr)
+        return locals
+
+# Shrink the frame of every subroutine, the sizes before and after are kept in cls.frames
+def pack_locals(cls, options, program):
+    for subroutine in cls.subroutines:
+        before = subroutine.locals
+        LocalPacker(subroutine).pack()
+        cls.frames.append((subroutine.name, before, subroutine.locals))
+
+# Passes of every optimization level, in the order they run
+levels = {
+    0: [],
+    1: [("fold", fold_constants), ("prune", prune_branches), ("strength", reduce_strength)],
+}
+# Inlined copies get their constant arguments, so they are folded again, and the locals
+# they add are packed with the others
+levels[2] = levels[1] + [("inline", inline_calls), ("fold", fold_constants), ("prune", prune_branches),
+                         ("locals", pack_locals)]
+
+class PassManager:
+    """Runs passes over a class and keeps the time spent in each of them."""
+    def __init__(self, passes):
+        self.passes = passes
+        self.timings = {}
+
+    # program holds the other classes whole program passes may look at, see inline_calls
+    def run(self, cls, options, program = None):
+        program = dict(program or {})
+        program[cls.name] = cls
+        for name, run in self.passes:
+            with self.timed(name):
+                run(cls, options, program)
+
+    # Time any other step, like parsing or lowering, under the same report
+    def timed(self, name):
+        return PassTimer(self.timings, name)
+
+    def report(self):
+        return ", ".join(f"{name} {seconds * 1000:.2f}ms" for name, seconds in self.timings.items())
+
+class PassTimer:
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + time.perf_counter() - self.start
+
+class VMBuffer:
+    """VM code of one class, kept as one chunk of lines per subroutine.
+
+    A function header needs the local count, which is only known once the body
+    is compiled, so header and body are kept apart until the file is written.
+    """
+    def __init__(self):
+        self.chunks = []    # (header, body) of every subroutine
+
+    def addFunction(self, header, body):
+        self.chunks.append((header, body))
+
+    # Replace every function by rewrite(lines of the function)
+    def rewrite(self, rewrite):
+        self.chunks = [(rewrite(header + body), []) for header, body in self.chunks]
+
+    def lines(self):
+        return itertools.chain.from_iterable(itertools.chain.from_iterable(self.chunks))
+
+    def text(self):
+        if not self.chunks:
+            return ""
+        return "\n".join(self.lines()) + "\n"
+
+# Segments that a single push reads without side effects, an operand pushed
+# from one of them can be pushed again instead of being saved in temp 2
+repeatable_segments = {"local", "argument", "static", "this"}
+
+arithmetic = {
+    '+': "add",
+    '-': "sub",
+    '&': "and",
+    '|': "or",
+    '<': "lt",
+    '>': "gt",
+    '=': "eq",
+}
+
+class Lowering:
+    """Turns a ClassIR into VM commands.
+
+    With fast set, multiplications by constants become add chains and if/while
+    branch straight to the block that runs (see lowerIf and lowerWhile); without
+    it every construct is lowered the plain way. At level 2 a subroutine returning
+    a call to itself also jumps back to its start (see writeTailCall), which
+    changes its frames like the slot sharing of pack_locals does.
+    """
+    # Longest add/double chain used instead of a call to Math.multiply
+    max_multiply_chain = 32
+
+    def __init__(self, cls, options, fast = True):
+        self.cls = cls
+        self.options = options
+        self.fast = fast
+        self.labelCounter = 0
+        self.literals = {}    # pooled string literal: static index
+        self.code = []
+        self.subroutine = None
+        self.entryLabel = None  # label at the start of the body, made for the first tail call
+
+    def lowerClass(self):
+        buffer = VMBuffer()
+        for subroutine in self.cls.subroutines:
+            self.code = []
+            self.subroutine = subroutine
+            self.entryLabel = None
+            self.lowerStatements(subroutine.body)
+            if self.entryLabel is not None:
+                self.code.insert(0, "label " + self.entryLabel)
+            buffer.addFunction(self.header(subroutine), self.code)
+        if self.literals:
+            self.code = []
+            self.writeLiteralPool()
+            buffer.addFunction(["function " + self.literalPoolName() + " 0"], self.code)
+        return buffer
+
+    def header(self, subroutine):
+        header = ["function " + subroutine.name + " " + str(subroutine.locals)]
+        if subroutine.kind == "constructor":
+            header.append("push constant " + str(subroutine.fields))
+            header.append("call Memory.alloc 1")
+            header.append("pop pointer 0")
+        elif subroutine.kind == "method":
+            header.append("push argument 0")
+            header.append("pop pointer 0")
+        return header
+
+    def newLabel(self):
+        label = "L" + str(self.labelCounter)
+        self.labelCounter += 1
+        return label
+
+    # Lower into a separate list, so blocks can be laid out in another order than the source
+    def capture(self, lower, node):
+        code = self.code
+        self.code = []
+        lower(node)
+        captured = self.code
+        self.code = code
+        return captured
+
+    def lowerStatements(self, statements):
+        for statement in statements:
+            if isinstance(statement, Let):
+                self.lowerLet(statement)
+            elif isinstance(statement, If):
+                self.lowerIf(statement)
+            elif isinstance(statement, While):
+                self.lowerWhile(statement)
+            elif isinstance(statement, Do):
+                self.lowerExpression(statement.call)
+                self.code.append("pop temp 0")
+            elif isinstance(statement, Return):
+                if self.isTailCall(statement.value):
+                    self.writeTailCall(statement.value)
+                    continue
+                if statement.value is None:
+                    self.code.append("push constant 0")
+                else:
+                    self.lowerStored(statement.value)
+                self.code.append("return")
+
+    # return f(...) inside f itself, with as many arguments as f takes, at level 2 only. A
+    # constructor would allocate a new object on every call, so it keeps the real call
+    def isTailCall(self, value):
+        subroutine = self.subroutine
+        return (self.options.level >= 2 and isinstance(value, Call) and value.name == subroutine.name
+                and subroutine.kind != "constructor" and len(value.args) == subroutine.arguments)
+
+    # The arguments are evaluated onto the stack and popped into the argument slots in reverse,
+    # the locals are reset to the 0 the function command gives them, then the body starts over:
+    #   args; pop argument n-1 .. pop argument 0; push constant 0; pop local i ...; goto entry
+    def writeTailCall(self, call):
+        if self.entryLabel is None:
+            self.entryLabel = self.newLabel()
+        for arg in call.args:
+            self.lowerExpression(arg)
+        for index in reversed(range(len(call.args))):
+            self.code.append("pop argument " + str(index))
+        for index in range(self.subroutine.locals):
+            self.code.append("push constant 0")
+            self.code.append("pop local " + str(index))
+        if self.subroutine.kind == "method":
+            # The object of the call may be another one
+            self.code.append("push argument 0")
+            self.code.append("pop pointer 0")
+        self.code.append("goto " + self.entryLabel)
+
+    def lowerLet(self, statement):
+        target = statement.target
+        if isinstance(target, Index):
+            self.writeAddress(target)
+            self.lowerStored(statement.value)
+            self.code.append("pop temp 0")
+            self.code.append("pop pointer 1")
+            self.code.append("push temp 0")
+            self.code.append("pop that 0")
+        else:
+            self.lowerStored(statement.value)
+            self.code.append("pop " + target.segment + " " + str(target.index))
+
+    # A value that is assigned or returned. Whoever holds it may change or dispose it, so
+    # a string literal gets a String of its own even with pool_strings
+    def lowerStored(self, value):
+        if isinstance(value, String):
+            self.writeNewString(value.text)
+        else:
+            self.lowerExpression(value)
+
+    # Fast layout: an if with an else on a boolean condition (see is_boolean) puts the else
+    # block first and jumps to the then block on the condition, if (~c) jumps over the then
+    # block on c, and any other if still needs a not before its if-goto
+    def lowerIf(self, statement):
+        L1 = self.newLabel()
+        L2 = self.newLabel()
+        conditionNode = statement.condition
+        inverted = self.fast and isinstance(conditionNode, Unary) and conditionNode.op == '~'
+        if inverted:
+            conditionNode = conditionNode.operand
+        condition = self.capture(self.lowerExpression, conditionNode)
+        thenCode = self.capture(self.lowerStatements, statement.then)
+        elseCode = None
+        if statement.otherwise is not None:
+            elseCode = self.capture(self.lowerStatements, statement.otherwise)
+
+        if self.fast and isinstance(statement.condition, Const):
+            # Constant condition, only the branch that runs is kept
+            if statement.condition.value == TRUE_WORD:
+                self.code.extend(thenCode)
+            elif elseCode is not None:
+                self.code.extend(elseCode)
+        elif self.fast and elseCode is not None and not inverted and is_boolean(conditionNode):
+            self.code.extend(condition)
+            self.code.append("if-goto " + L1)
+            self.code.extend(elseCode)
+            self.code.append("goto " + L2)
+            self.code.append("label " + L1)
+            self.code.extend(thenCode)
+            self.code.append("label " + L2)
+        else:
+            self.code.extend(condition)
+            if not inverted:
+                self.code.append("not")
+            self.code.append("if-goto " + L1)
+            self.code.extend(thenCode)
+            if elseCode is not None or not self.fast:
+                self.code.append("goto " + L2)
+                self.code.append("label " + L1)
+                if elseCode is not None:
+                    self.code.extend(elseCode)
+                self.code.append("label " + L2)
+            else:
+                self.code.append("label " + L1)
+
+    # Fast layout rotates the loop on a boolean condition so the test sits at the bottom and
+    # jumps back into the body:
+    #   goto test; label body; statements; label test; condition; if-goto body
+    def lowerWhile(self, statement):
+        L1 = self.newLabel()
+        L2 = self.newLabel()
+        condition = self.capture(self.lowerExpression, statement.condition)
+        body = self.capture(self.lowerStatements, statement.body)
+
+        if not self.fast or not (isinstance(statement.condition, Const) or is_boolean(statement.condition)):
+            self.code.append("label " + L1)
+            self.code.extend(condition)
+            self.code.append("not")
+            self.code.append("if-goto " + L2)
+            self.code.extend(body)
+            self.code.append("goto " + L1)
+            self.code.append("label " + L2)
+        elif not isinstance(statement.condition, Const):
+            self.code.append("goto " + L2)
+            self.code.append("label " + L1)
+            self.code.extend(body)
+            self.code.append("label " + L2)
+            self.code.extend(condition)
+            self.code.append("if-goto " + L1)
+        elif statement.condition.value == TRUE_WORD:
+            # while (true) needs no test
+            self.code.append("label " + L1)
+            self.code.extend(body)
+            self.code.append("goto " + L1)
+
+    def pushVar(self, var):
+        self.code.append("push " + var.segment + " " + str(var.index))
+
+    # Push the address of base[index]. A base of 0 (an inlined Memory.peek or poke) or an
+    # index of 0 (the first field of an inlined accessor) needs no add
+    def writeAddress(self, target):
+        if isinstance(target.base, Const) and target.base.value == 0:
+            self.lowerExpression(target.index)
+        elif self.fast and isinstance(target.index, Const) and target.index.value == 0:
+            self.lowerExpression(target.base)
+        else:
+            self.lowerExpression(target.base)
+            self.lowerExpression(target.index)
+            self.code.append("add")
+
+    def lowerExpression(self, expr):
+        if isinstance(expr, Const):
+            self.writeConstant(expr.value)
+        elif isinstance(expr, Var):
+            self.pushVar(expr)
+        elif isinstance(expr, Binary):
+            self.lowerBinary(expr)
+        elif isinstance(expr, Unary):
+            self.lowerExpression(expr.operand)
+            self.code.append("neg" if expr.op == '-' else "not")
+        elif isinstance(expr, Index):
+            self.writeAddress(expr)
+            self.code.append("pop pointer 1")
+            self.code.append("push that 0")
+        elif isinstance(expr, Call):
+            for arg in expr.args:
+                self.lowerExpression(arg)
+            self.code.append("call " + expr.name + " " + str(len(expr.args)))
+        elif isinstance(expr, String):
+            self.writeString(expr.text)
+
+    def lowerBinary(self, expr):
+        op = expr.op
+        if op == '*' and self.fast:
+            if isinstance(expr.right, Const) and not isinstance(expr.left, Const):
+                self.lowerExpression(expr.left)
+                if self.writeMultiplyByConstant(expr.right.value, expr.left):
+                    return
+                self.writeConstant(expr.right.value)
+                self.code.append("call Math.multiply 2")
+                return
+            if isinstance(expr.left, Const) and not isinstance(expr.right, Const):
+                # c * x, the constant has no side effects so x can go first
+                self.lowerExpression(expr.right)
+                if self.writeMultiplyByConstant(expr.left.value, expr.right):
+                    return
+                self.writeConstant(expr.left.value)
+                self.code.append("call Math.multiply 2")
+                return
+        self.lowerExpression(expr.left)
+        self.lowerExpression(expr.right)
+        if op == '*':
+            self.code.append("call Math.multiply 2")
+        elif op == '/':
+            self.code.append("call Math.divide 2")
+        else:
+            self.code.append(arithmetic[op])
+
+    # x * c with x on the stack, as a chain of doublings that adds x for every set bit of c.
+    # A variable x is pushed again, any other x is kept in temp 2 while temp 1 holds the
+    # value being doubled. Returns False when the chain would be longer than max_multiply_chain
+    def writeMultiplyByConstant(self, constant, operand):
+        factor = signed_word(constant)
+        if factor == -0x8000:
+            return False
+        code = []
+        if factor == 0:
+            # x is still evaluated for its side effects
+            code = ["pop temp 0", "push constant 0"]
+        else:
+            bits = bin(abs(factor))[3:]   # the leading 1 is x itself
+            single = isinstance(operand, Var) and operand.segment in repeatable_segments
+            if single:
+                push = "push " + operand.segment + " " + str(operand.index)
+            else:
+                push = "push temp 2"
+                if "1" in bits:
+                    code = ["pop temp 2", push]
+            # While the stack holds x itself, doubling it only needs one more push of x
+            top = single or "1" in bits
+            for bit in bits:
+                if top:
+                    code += [push, "add"]
+                else:
+                    code += ["pop temp 1", "push temp 1", "push temp 1", "add"]
+                top = False
+                if bit == "1":
+                    code += [push, "add"]
+            if factor < 0:
+                code.append("neg")
+        if len(code) > self.max_multiply_chain:
+            return False
+        self.code.extend(code)
+        return True
+
+    # Push any 16-bit word, only 0..32767 can be pushed directly
+    def writeConstant(self, value):
+        if value <= 0x7FFF:
+            self.code.append("push constant " + str(value))
+        elif value == 0x8000:
+            self.code.append("push constant 32767")
+            self.code.append("not")
+        else:
+            self.code.append("push constant " + str(0x10000 - value))
+            self.code.append("neg")
+
+    def writeString(self, s):
+        if self.options.pool_strings:
+            self.writePooledString(s)
+        else:
+            self.writeNewString(s)
+
+    # String.new followed by one appendChar per character
+    def writeNewString(self, s):
+        self.code.append("push constant " + str(len(s)))
+        self.code.append("call String.new 1")
+        for char in s:
+            self.code.append("push constant " + str(ord(char)))
+            self.code.append("call String.appendChar 2")
+
+    # Push the pooled copy of s, shared by every evaluation of the literal in the class.
+    # The pool is built by the first use of any literal:
+    #   push static k; if-goto L; call Class.literals:init 0; pop temp 0; label L; push static k
+    def writePooledString(self, s):
+        index = self.literals.get(s)
+        if index is None:
+            # Pool statics come after the statics the class declares
+            index = self.literals[s] = self.cls.statics + len(self.literals)
+        label = self.newLabel()
+        self.code.append("push static " + str(index))
+        self.code.append("if-goto " + label)
+        self.code.append("call " + self.literalPoolName() + " 0")
+        self.code.append("pop temp 0")
+        self.code.append("label " + label)
+        self.code.append("push static " + str(index))
+
+    # The ':' makes the name legal in VM code but impossible for a Jack subroutine
+    def literalPoolName(self):
+        return self.cls.name + ".literals:init"
+
+    # Body of the function that builds every pooled literal
+    def writeLiteralPool(self):
+        for s, index in self.literals.items():
+            self.writeNewString(s)
+            self.code.append("pop static " + str(index))
+        self.code.append("push constant 0")
+        self.code.append("return")
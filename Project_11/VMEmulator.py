@@ -0,0 +1,470 @@
+import argparse
+import sys
+import time
+
+from VMLinker import read_program, split_command
+
+# Runs the .vm files of a program without the Java tools. Every command is decoded
+# once into an opcode and its operands with labels, function addresses, statics and
+# temps already resolved, so the interpreter loop only indexes lists.
+# command line prompt: "python VMEmulator.py ProgramDir [OSDir ...] [--keys TEXT] [--max-ops N]"
+
+# Hack memory map
+SP, LCL, ARG, THIS, THAT = 0, 1, 2, 3, 4
+TEMP = 5
+STATIC = 16
+STACK = 256
+HEAP = 2048
+SCREEN = 16384
+KBD = 24576
+RAM_SIZE = 32768
+
+# Opcodes, roughly in order of how often compiled Jack code runs them
+(PUSH_CONSTANT, PUSH_LOCAL, PUSH_ARGUMENT, PUSH_THIS, PUSH_THAT, PUSH_ADDRESS, PUSH_THIS_POINTER, PUSH_THAT_POINTER,
+ POP_LOCAL, POP_ARGUMENT, POP_THIS, POP_THAT, POP_ADDRESS, POP_THIS_POINTER, POP_THAT_POINTER,
+ ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+ GOTO, IF_GOTO, CALL, FUNCTION, RETURN, HALT) = range(30)
+
+push_opcodes = {"constant": PUSH_CONSTANT, "local": PUSH_LOCAL, "argument": PUSH_ARGUMENT, "this": PUSH_THIS, "that": PUSH_THAT}
+pop_opcodes = {"local": POP_LOCAL, "argument": POP_ARGUMENT, "this": POP_THIS, "that": POP_THAT}
+arithmetic_opcodes = {"add": ADD, "sub": SUB, "neg": NEG, "eq": EQ, "gt": GT, "lt": LT, "and": AND, "or": OR, "not": NOT}
+
+# Return address of the entry function, returning to it ends the run
+EXIT = -1
+
+# Key codes of the Hack keyboard for characters that have no ASCII code of their own
+key_codes = {"\n": 128, "\b": 129}
+
+class VMError(Exception):
+    pass
+
+class Program:
+    """The decoded commands of a program, one entry per command in the three lists.
+
+    ops holds the opcode, arg1 and arg2 the operands: a constant, a segment index,
+    an absolute RAM address for static and temp, the command index of a jump or
+    call target, the argument count of a call, the local count of a function.
+    """
+    def __init__(self, classes):
+        self.ops = []
+        self.arg1 = []
+        self.arg2 = []
+        self.functions = {}     # name: index of its function command
+        self.names = []         # name of the function each command belongs to
+        self.lines = []         # (class, line number in its file, text) of each command
+        self.statics = {}       # class name: address of its static 0
+        pending = []            # (command index, function name) of calls
+
+        address = STATIC
+        for cls in classes.values():
+            self.statics[cls.name] = address
+            highest = -1
+            for name in cls.order:
+                for line in cls.functions[name]:
+                    command = split_command(line)
+                    if command[:2] in (["push", "static"], ["pop", "static"]):
+                        highest = max(highest, int(command[2]))
+            number = len(cls.preamble) + 1
+            for name in cls.order:
+                self.decodeFunction(cls, name, address, pending, number)
+                number += len(cls.functions[name])
+            address += highest + 1
+        if address > STACK:
+            raise VMError(f"The statics of the program need {address - STATIC} words, more than fit below the stack")
+
+        for index, name in pending:
+            target = self.functions.get(name)
+            if name == "Sys.halt":
+                self.ops[index] = HALT
+            # An unknown function is only an error when the call runs
+            self.arg1[index] = -1 if target is None else target
+
+    def decodeFunction(self, cls, name, static_base, pending, first_line):
+        labels = {}
+        jumps = []      # (command index, label)
+        for number, line in enumerate(cls.functions[name], first_line):
+            command = split_command(line)
+            if not command:
+                continue
+            kind = command[0]
+            if kind == "label":
+                labels[command[1]] = len(self.ops)
+                continue
+            op = arg1 = arg2 = 0
+            if kind == "push" or kind == "pop":
+                segment, index = command[1], int(command[2])
+                if segment == "static":
+                    op, arg1 = (PUSH_ADDRESS if kind == "push" else POP_ADDRESS), static_base + index
+                elif segment == "temp":
+                    op, arg1 = (PUSH_ADDRESS if kind == "push" else POP_ADDRESS), TEMP + index
+                elif segment == "pointer":
+                    if kind == "push":
+                        op = PUSH_THIS_POINTER if index == 0 else PUSH_THAT_POINTER
+                    else:
+                        op = POP_THIS_POINTER if index == 0 else POP_THAT_POINTER
+                else:
+                    table = push_opcodes if kind == "push" else pop_opcodes
+                    if segment not in table:
+                        raise VMError(f"{cls.path}: bad command '{line.strip()}'")
+                    op, arg1 = table[segment], index
+            elif kind in arithmetic_opcodes:
+                op = arithmetic_opcodes[kind]
+            elif kind == "goto" or kind == "if-goto":
+                op = GOTO if kind == "goto" else IF_GOTO
+                jumps.append((len(self.ops), command[1]))
+            elif kind == "call":
+                op, arg2 = CALL, int(command[2])
+                pending.append((len(self.ops), command[1]))
+            elif kind == "function":
+                op, arg1 = FUNCTION, int(command[2])
+                self.functions[name] = len(self.ops)
+            elif kind == "return":
+                op = RETURN
+            else:
+                raise VMError(f"{cls.path}: unknown command '{line.strip()}'")
+            self.ops.append(op)
+            self.arg1.append(arg1)
+            self.arg2.append(arg2)
+            self.names.append(name)
+            self.lines.append((cls.name, number, line.strip()))
+
+        for index, label in jumps:
+            if label not in labels:
+                raise VMError(f"{cls.path}: {name} jumps to unknown label {label}")
+            target = labels[label]
+            self.arg1[index] = target
+            # goto to itself is the while(true){} of Sys.halt
+            if target == index and self.ops[index] == GOTO:
+                self.ops[index] = HALT
+
+class VMEmulator:
+    """Runs a Program on a Hack RAM of 32K words kept in a Python list.
+
+    The pointer registers live in Python locals while run() executes and are
+    stored back to RAM[0..4] when it returns, so a run can be continued, and the
+    screen and keyboard memory can be changed between runs.
+    """
+    def __init__(self, program, entry = None):
+        self.program = program
+        self.ram = [0] * RAM_SIZE
+        self.pc = 0
+        self.ops = 0            # commands executed so far
+        self.halted = False
+        self.reason = None      # why the run stopped
+        self.keyboardReads = 0  # times the program has read KBD through that
+        self.zeros = {}
+        if entry is None:
+            entry = "Sys.init" if "Sys.init" in program.functions else "Main.main"
+        if entry not in program.functions:
+            raise VMError(f"The program has no function {entry}")
+        self.entry = entry
+        self.reset()
+
+    # Set up the frame of a call to the entry function, like the bootstrap code of VMTranslator.lua
+    def reset(self):
+        ram = self.ram
+        ram[:] = [0] * RAM_SIZE
+        ram[STACK] = EXIT
+        ram[SP] = STACK + 5
+        ram[LCL] = STACK + 5
+        ram[ARG] = STACK
+        self.pc = self.program.functions[self.entry]
+        self.ops = 0
+        self.halted = False
+        self.reason = None
+
+    def run(self, max_ops):
+        """Execute up to max_ops commands, returns the number executed."""
+        if self.halted:
+            return 0
+        program = self.program
+        ops, arg1, arg2 = program.ops, program.arg1, program.arg2
+        ram = self.ram
+        zeros = self.zeros
+        sp, lcl, arg, this, that = ram[SP], ram[LCL], ram[ARG], ram[THIS], ram[THAT]
+        pc = self.pc
+        count = max_ops
+        keyboardReads = 0
+        try:
+            for step in range(max_ops):
+                op = ops[pc]
+                if op == PUSH_CONSTANT:
+                    ram[sp] = arg1[pc]
+                    sp += 1
+                elif op == PUSH_LOCAL:
+                    ram[sp] = ram[lcl + arg1[pc]]
+                    sp += 1
+                elif op == PUSH_ARGUMENT:
+                    ram[sp] = ram[arg + arg1[pc]]
+                    sp += 1
+                elif op == PUSH_THIS:
+                    ram[sp] = ram[this + arg1[pc]]
+                    sp += 1
+                elif op == PUSH_THAT:
+                    address = that + arg1[pc]
+                    if address == KBD:
+                        keyboardReads += 1
+                    ram[sp] = ram[address]
+                    sp += 1
+                elif op == PUSH_ADDRESS:
+                    ram[sp] = ram[arg1[pc]]
+                    sp += 1
+                elif op == PUSH_THIS_POINTER:
+                    ram[sp] = this
+                    sp += 1
+                elif op == PUSH_THAT_POINTER:
+                    ram[sp] = that
+                    sp += 1
+                elif op == POP_LOCAL:
+                    sp -= 1
+                    ram[lcl + arg1[pc]] = ram[sp]
+                elif op == POP_ARGUMENT:
+                    sp -= 1
+                    ram[arg + arg1[pc]] = ram[sp]
+                elif op == POP_THIS:
+                    sp -= 1
+                    ram[this + arg1[pc]] = ram[sp]
+                elif op == POP_THAT:
+                    sp -= 1
+                    ram[that + arg1[pc]] = ram[sp]
+                elif op == POP_ADDRESS:
+                    sp -= 1
+                    ram[arg1[pc]] = ram[sp]
+                elif op == POP_THIS_POINTER:
+                    sp -= 1
+                    this = ram[sp] & 0x7FFF
+                elif op == POP_THAT_POINTER:
+                    sp -= 1
+                    that = ram[sp] & 0x7FFF
+                elif op == ADD:
+                    sp -= 1
+                    value = ram[sp - 1] + ram[sp]
+                    if value > 0x7FFF:
+                        value -= 0x10000
+                    elif value < -0x8000:
+                        value += 0x10000
+                    ram[sp - 1] = value
+                elif op == SUB:
+                    sp -= 1
+                    value = ram[sp - 1] - ram[sp]
+                    if value > 0x7FFF:
+                        value -= 0x10000
+                    elif value < -0x8000:
+                        value += 0x10000
+                    ram[sp - 1] = value
+                elif op == NEG:
+                    value = -ram[sp - 1]
+                    ram[sp - 1] = value if value != 0x8000 else -0x8000
+                elif op == EQ:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] == ram[sp] else 0
+                elif op == GT:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] > ram[sp] else 0
+                elif op == LT:
+                    sp -= 1
+                    ram[sp - 1] = -1 if ram[sp - 1] < ram[sp] else 0
+                elif op == AND:
+                    sp -= 1
+                    ram[sp - 1] &= ram[sp]
+                elif op == OR:
+                    sp -= 1
+                    ram[sp - 1] |= ram[sp]
+                elif op == NOT:
+                    ram[sp - 1] = ~ram[sp - 1]
+                elif op == GOTO:
+                    pc = arg1[pc]
+                    continue
+                elif op == IF_GOTO:
+                    sp -= 1
+                    if ram[sp]:
+                        pc = arg1[pc]
+                        continue
+                elif op == CALL:
+                    target = arg1[pc]
+                    if target < 0:
+                        raise VMError(f"call to an undefined function in {program.lines[pc][2]!r}")
+                    ram[sp] = pc + 1
+                    ram[sp + 1] = lcl
+                    ram[sp + 2] = arg
+                    ram[sp + 3] = this
+                    ram[sp + 4] = that
+                    sp += 5
+                    arg = sp - 5 - arg2[pc]
+                    lcl = sp
+                    if sp >= HEAP:
+                        raise VMError("stack overflow")
+                    pc = target
+                    continue
+                elif op == FUNCTION:
+                    locals = arg1[pc]
+                    if locals:
+                        if locals not in zeros:
+                            zeros[locals] = [0] * locals
+                        ram[sp:sp + locals] = zeros[locals]
+                        sp += locals
+                elif op == RETURN:
+                    frame = lcl
+                    # Without arguments the return value goes where the return address is
+                    pc = ram[frame - 5]
+                    ram[arg] = ram[sp - 1]
+                    sp = arg + 1
+                    that = ram[frame - 1]
+                    this = ram[frame - 2]
+                    arg = ram[frame - 3]
+                    lcl = ram[frame - 4]
+                    if pc == EXIT:
+                        self.halted = True
+                        self.reason = f"{self.entry} returned"
+                        count = step + 1
+                        break
+                    continue
+                elif op == HALT:
+                    self.halted = True
+                    self.reason = "halted in " + program.names[pc]
+                    count = step
+                    break
+                pc += 1
+        except VMError:
+            count = step
+            raise
+        finally:
+            ram[SP], ram[LCL], ram[ARG], ram[THIS], ram[THAT] = sp, lcl, arg, this, that
+            self.pc = pc
+            self.ops += count
+            self.keyboardReads += keyboardReads
+        return count
+
+    def isSpinning(self, max_ops = 5000):
+        """Step up to max_ops commands, True when the machine came back to the exact state
+        it started in: the program is in an endless loop that changes nothing."""
+        start = self.ram[:]
+        pc = self.pc
+        for _ in range(max_ops):
+            if not self.run(1):
+                return False
+            if self.pc == pc and self.ram[:5] == start[:5] and self.ram == start:
+                return True
+        return False
+
+    def screen(self):
+        """The 256 rows of the screen, each a string of 512 '0' and '1'."""
+        rows = []
+        for row in range(256):
+            words = self.ram[SCREEN + row * 32:SCREEN + row * 32 + 32]
+            rows.append("".join(format(word & 0xFFFF, "016b")[::-1] for word in words))
+        return rows
+
+    def writeScreen(self, path):
+        """Save the screen as a plain PBM image."""
+        with open(path, 'w', encoding='ascii') as file:
+            file.write("P1\n512 256\n")
+            for row in self.screen():
+                file.write(row + "\n")
+
+class Keyboard:
+    """Types keys into KBD between runs: a key is pressed while the program polls
+    the keyboard, and released once the program has read it."""
+    def __init__(self, emulator, text):
+        self.emulator = emulator
+        self.keys = [key_codes.get(char, ord(char)) for char in text]
+        self.pressed = False
+        self.reads = emulator.keyboardReads
+
+    # Called between runs, False once every key was typed and the program waits for another
+    def update(self):
+        emulator = self.emulator
+        polled = emulator.keyboardReads > self.reads
+        self.reads = emulator.keyboardReads
+        if not polled:
+            return True
+        if self.pressed:
+            emulator.ram[KBD] = 0
+            self.pressed = False
+        elif self.keys:
+            emulator.ram[KBD] = self.keys.pop(0)
+            self.pressed = True
+        else:
+            return False
+        return True
+
+def run_program(paths, keys = "", max_ops = 100_000_000, entry = None, slice_ops = 20000, spin_check = 50, emulator_class = VMEmulator,
+                skipped = None):
+    """Load the .vm files of paths and run them on an emulator_class, returns the emulator after the run.
+
+    The run ends when the program halts, when it waits for a key after all keys
+    were typed, when it loops forever without changing anything (checked every
+    spin_check slices), or after max_ops commands. Files left out because their
+    class was already read are reported in skipped, as in read_program.
+    """
+    classes = read_program(paths, skipped)
+    if not classes:
+        raise VMError("No .vm files found")
+    emulator = emulator_class(Program(classes), entry)
+    keyboard = Keyboard(emulator, keys)
+    slices = 0
+    while not emulator.halted and emulator.ops < max_ops:
+        emulator.run(min(slice_ops, max_ops - emulator.ops))
+        slices += 1
+        if not keyboard.update():
+            emulator.reason = "waiting for a key"
+            break
+        if slices % spin_check == 0 and not keyboard.keys and not keyboard.pressed and emulator.isSpinning():
+            emulator.reason = "looping forever in " + emulator.program.names[emulator.pc]
+            break
+    if emulator.reason is None:
+        emulator.reason = f"stopped after {emulator.ops} commands"
+    return emulator
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the .vm files of a program.")
+    parser.add_argument(
+        'paths',
+        nargs='+',
+        help="Directories or .vm files of the program, for example the program directory and the compiled OS."
+    )
+    parser.add_argument(
+        '--keys',
+        default="",
+        help="Keys to type, one after the other whenever the program reads the keyboard; \\n is Enter."
+    )
+    parser.add_argument(
+        '--max-ops',
+        type=int,
+        default=100_000_000,
+        help="Stop after this many VM commands (default 100000000)."
+    )
+    parser.add_argument(
+        '--entry',
+        default=None,
+        help="Function to start in (default Sys.init, or Main.main without a Sys class)."
+    )
+    parser.add_argument(
+        '--screen',
+        metavar='FILE',
+        default=None,
+        help="Save the screen as a PBM image when the run ends."
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    skipped = []
+    try:
+        emulator = run_program(args.paths, args.keys.replace("\\n", "\n"), args.max_ops, args.entry, skipped = skipped)
+    except (OSError, ValueError, VMError) as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        for line in skipped:
+            print(line)
+    elapsed = time.perf_counter() - start
+
+    rate = emulator.ops / elapsed if elapsed > 0 else 0
+    print(f"{emulator.reason}: {emulator.ops} VM commands in {elapsed:.2f}s ({rate / 1e6:.2f}M commands/s)")
+    if args.screen:
+        emulator.writeScreen(args.screen)
+        print(f"Wrote {args.screen}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
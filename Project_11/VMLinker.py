@@ -0,0 +1,192 @@
+import argparse
+import os
+import sys
+
+from collections import deque
+from pathlib import Path
+
+# Link step for the .vm files of a whole program. Every function that can not be
+# reached through calls from the entry point (Sys.init, or Main.main when there is
+# no Sys class) is dropped, and the pruned classes are written to a new directory.
+# command line prompt: "python VMLinker.py ProgramDir [OSDir ...] [-o OutDir]"
+
+# Hack instructions that VMTranslator.lua (Project_07-08) emits for each VM command,
+# so the report can tell how much ROM was saved. Labels take no ROM.
+rom_push = {"constant": 7, "local": 10, "argument": 10, "this": 10, "that": 10, "temp": 7, "pointer": 7, "static": 7}
+rom_pop = {"local": 9, "argument": 9, "this": 9, "that": 9, "temp": 7, "pointer": 7, "static": 7}
+rom_commands = {
+    "add": 8, "sub": 8, "and": 8, "or": 8,
+    "neg": 6, "not": 5,
+    "eq": 18, "gt": 18, "lt": 18,
+    "label": 0, "goto": 2, "if-goto": 5,
+    "function": 17, "call": 49, "return": 46,
+}
+
+def rom_size(command):
+    """Hack instructions of one VM command, as split into words."""
+    if command[0] == "push":
+        return rom_push.get(command[1], 0)
+    if command[0] == "pop":
+        return rom_pop.get(command[1], 0)
+    return rom_commands.get(command[0], 0)
+
+def split_command(line):
+    """Words of a VM line without its comment, empty for a blank or comment line."""
+    return line.split("//", 1)[0].split()
+
+class VMClass:
+    """The functions of one .vm file, each kept as the lines it was read from."""
+    def __init__(self, path):
+        self.path = Path(path)
+        self.name = self.path.stem
+        self.preamble = []     # lines before the first function
+        self.functions = {}    # name: lines, in file order
+        self.calls = {}        # name: names of the functions it calls
+        self.order = []
+        current = None
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file.read().splitlines():
+                command = split_command(line)
+                if command and command[0] == "function" and len(command) > 1:
+                    current = command[1]
+                    self.order.append(current)
+                    self.functions[current] = []
+                    self.calls[current] = set()
+                if current is None:
+                    self.preamble.append(line)
+                    continue
+                self.functions[current].append(line)
+                if command and command[0] == "call" and len(command) > 1:
+                    self.calls[current].add(command[1])
+
+    def size(self, name):
+        """(VM commands, Hack instructions) of one function."""
+        commands = [split_command(line) for line in self.functions[name]]
+        commands = [command for command in commands if command]
+        return len(commands), sum(rom_size(command) for command in commands)
+
+    def text(self, keep):
+        lines = list(self.preamble)
+        for name in self.order:
+            if name in keep:
+                lines.extend(self.functions[name])
+        return "\n".join(lines) + "\n"
+
+# The .vm files of every input path. A class found in an earlier path hides the one of
+# the same name in a later path, so a program can replace an OS class with its own. The
+# hidden files are reported in skipped when a list is given, the caller decides what to show
+def read_program(paths, skipped = None):
+    classes = {}
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(Path(path).glob("*.vm"))
+        else:
+            files = [Path(path)]
+        for file in files:
+            if file.stem in classes:
+                if skipped is not None:
+                    skipped.append(f"Skipping {file}, class {file.stem} is already read from {classes[file.stem].path}")
+                continue
+            classes[file.stem] = VMClass(file)
+    return classes
+
+def reachable(classes, roots):
+    """(names of the functions reachable from roots, calls to functions no class defines)."""
+    owner = {name: cls for cls in classes.values() for name in cls.functions}
+    seen = set()
+    missing = set()
+    pending = deque(root for root in roots if root in owner)
+    seen.update(pending)
+    while pending:
+        name = pending.popleft()
+        for callee in owner[name].calls[name]:
+            if callee not in owner:
+                missing.add(callee)
+            elif callee not in seen:
+                seen.add(callee)
+                pending.append(callee)
+    return seen, missing
+
+def default_roots(classes):
+    if "Sys" in classes and "Sys.init" in classes["Sys"].functions:
+        return ["Sys.init"]
+    return ["Main.main"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Drop the functions a program never calls from its .vm files.")
+    parser.add_argument(
+        'paths',
+        nargs='+',
+        help="Directories or .vm files of the program, for example the program directory and the compiled OS."
+    )
+    parser.add_argument(
+        '-o', '--out',
+        default=None,
+        help="Directory for the pruned .vm files, defaults to 'linked' inside the first directory."
+    )
+    parser.add_argument(
+        '--root',
+        action='append',
+        default=None,
+        help="Function the program starts from, may be repeated (default Sys.init, or Main.main without a Sys class)."
+    )
+    parser.add_argument(
+        '-v', '--verbose',
+        action='store_true',
+        help="List every function that was dropped."
+    )
+    args = parser.parse_args()
+
+    skipped = []
+    classes = read_program(args.paths, skipped)
+    for line in skipped:
+        print(line)
+    if not classes:
+        print("Error: No .vm files found.")
+        return 1
+    roots = args.root or default_roots(classes)
+    keep, missing = reachable(classes, roots)
+    if not keep:
+        print(f"Error: None of the entry points {', '.join(roots)} is defined.")
+        return 1
+    for name in sorted(missing):
+        print(f"Warning: {name} is called but none of the linked files defines it")
+
+    first = args.paths[0] if os.path.isdir(args.paths[0]) else os.path.dirname(args.paths[0])
+    out_dir = Path(args.out or os.path.join(first, "linked"))
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    totals = [0, 0, 0, 0, 0, 0]   # functions, commands, instructions: before, after
+    for cls in classes.values():
+        kept = [name for name in cls.order if name in keep]
+        before = [0, 0]
+        after = [0, 0]
+        for name in cls.order:
+            commands, instructions = cls.size(name)
+            before[0] += commands
+            before[1] += instructions
+            if name in keep:
+                after[0] += commands
+                after[1] += instructions
+        totals = [a + b for a, b in zip(totals, [len(cls.order), before[0], before[1], len(kept), after[0], after[1]])]
+        out_path = out_dir / (cls.name + ".vm")
+        if kept:
+            with open(out_path, 'w', encoding='utf-8') as file:
+                file.write(cls.text(keep))
+        elif out_path.exists():
+            out_path.unlink()
+        dropped = len(cls.order) - len(kept)
+        if dropped:
+            print(f"{cls.name}: dropped {dropped} of {len(cls.order)} functions, {before[0] - after[0]} VM commands")
+            if args.verbose:
+                for name in cls.order:
+                    if name not in keep:
+                        print(f"  {name}")
+
+    print(f"Kept {totals[3]} of {totals[0]} functions, {totals[4]} of {totals[1]} VM commands, "
+          f"{totals[5]} of {totals[2]} Hack instructions ({totals[2] - totals[5]} removed)")
+    print(f"Wrote {out_dir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+# Peephole optimizer for VM code. Every rule rewrites the command list of one
+# function by matching short windows of commands, the optimizer runs the chosen
+# rules until none of them changes the function any more.
+
+# Push segments whose value does not depend on pointer 1
+plain_segments = {"constant", "local", "argument", "static", "this", "temp"}
+
+def is_plain_push(line):
+    parts = line.split()
+    return len(parts) == 3 and parts[0] == "push" and parts[1] in plain_segments
+
+def is_branch(line):
+    return line.startswith("goto ") or line.startswith("if-goto ")
+
+# let a[i] = x: x is pushed after the address, so it normally goes through temp 0.
+# When x is a single push (optionally negated) it can be pushed after pointer 1 is set:
+#   push x; pop temp 0; pop pointer 1; push temp 0; pop that 0
+#   -> pop pointer 1; push x; pop that 0
+def rule_array_store(code):
+    out = []
+    i = 0
+    n = len(code)
+    while i < n:
+        if is_plain_push(code[i]):
+            end = i + 1
+            if end < n and code[end] in ("neg", "not"):
+                end += 1
+            if code[end:end + 4] == ["pop temp 0", "pop pointer 1", "push temp 0", "pop that 0"]:
+                out.append("pop pointer 1")
+                out.extend(code[i:end])
+                out.append("pop that 0")
+                i = end + 4
+                continue
+        out.append(code[i])
+        i += 1
+    return out
+
+# push argument 0; pop pointer 0 at the start of a method that never uses this
+def rule_unused_this(code):
+    if code[1:3] != ["push argument 0", "pop pointer 0"]:
+        return code
+    for line in code[3:]:
+        parts = line.split()
+        if len(parts) == 3 and parts[1] in ("this", "pointer") and (parts[1] == "this" or parts[2] == "0"):
+            return code
+    return code[:1] + code[3:]
+
+# goto L when L is one of the labels right after it
+def rule_goto_next(code):
+    out = []
+    for i, line in enumerate(code):
+        if line.startswith("goto "):
+            target = "label " + line[5:]
+            j = i + 1
+            while j < len(code) and code[j].startswith("label ") and code[j] != target:
+                j += 1
+            if j < len(code) and code[j] == target:
+                continue
+        out.append(line)
+    return out
+
+# Commands after goto or return that no label leads to
+def rule_unreachable(code):
+    out = []
+    reachable = True
+    for line in code:
+        if line.startswith("label ") or line.startswith("function "):
+            reachable = True
+        if reachable:
+            out.append(line)
+            if line.startswith("goto ") or line == "return":
+                reachable = False
+    return out
+
+# Labels that no goto or if-goto of the function jumps to
+def rule_unused_label(code):
+    targets = {line.split()[1] for line in code if is_branch(line)}
+    return [line for line in code if not line.startswith("label ") or line[6:] in targets]
+
+# not; not and neg; neg cancel out
+def rule_double_negation(code):
+    out = []
+    for line in code:
+        if out and line in ("not", "neg") and out[-1] == line:
+            out.pop()
+            continue
+        out.append(line)
+    return out
+
+# push x; pop temp 0 when temp 0 is written again or the function returns before it is read.
+# A label, branch or call ends the search, temp 0 is then assumed to be live.
+def rule_dead_temp(code):
+    out = []
+    i = 0
+    n = len(code)
+    while i < n:
+        if i + 1 < n and code[i + 1] == "pop temp 0" and is_plain_push(code[i]):
+            dead = False
+            for line in code[i + 2:]:
+                if line == "pop temp 0" or line == "return":
+                    dead = True
+                    break
+                if line == "push temp 0" or line.startswith("label ") or is_branch(line) or line.startswith("call "):
+                    break
+            if dead:
+                i += 2
+                continue
+        out.append(code[i])
+        i += 1
+    return out
+
+# Rules in the order they are tried, the default runs all of them
+rules = {
+    "array-store": rule_array_store,
+    "unused-this": rule_unused_this,
+    "unreachable": rule_unreachable,
+    "goto-next": rule_goto_next,
+    "unused-label": rule_unused_label,
+    "double-negation": rule_double_negation,
+    "dead-temp": rule_dead_temp,
+}
+
+def parse_rules(text):
+    """Rule names from a comma separated list, "all" selects every rule."""
+    if text in (None, "", "all"):
+        return list(rules)
+    names = [name.strip() for name in text.split(",") if name.strip()]
+    for name in names:
+        if name not in rules:
+            raise ValueError(f"unknown peephole rule '{name}', choose from {', '.join(rules)}")
+    return names
+
+class Peephole:
+    """Runs the selected rules over functions and counts the commands each rule removed."""
+    def __init__(self, names = None):
+        self.names = list(rules) if names is None else list(names)
+        self.counts = dict.fromkeys(self.names, 0)
+
+    # code is the command list of one function, starting with its function command
+    def optimizeFunction(self, code):
+        changed = True
+        while changed:
+            changed = False
+            for name in self.names:
+                result = rules[name](code)
+                if len(result) != len(code) or result != code:
+                    self.counts[name] += len(code) - len(result)
+                    code = result
+                    changed = True
+        return code
+
+    # Optimize the commands of a whole .vm file
+    def optimize(self, lines):
+        out = []
+        function = []
+        for line in lines:
+            if line.startswith("function ") and function:
+                out.extend(self.optimizeFunction(function))
+                function = []
+            function.append(line)
+        if function:
+            out.extend(self.optimizeFunction(function))
+        return out
+
+    def removed(self):
+        return sum(self.counts.values())
+
+    def report(self):
+        details = ", ".join(f"{name} {count}" for name, count in self.counts.items())
+        return f"Peephole removed {self.removed()} commands ({details})"
@@ -0,0 +1,247 @@
+import argparse
+import sys
+import time
+
+from VMEmulator import VMEmulator, VMError, run_program, CALL, GOTO, IF_GOTO, RETURN, HALT
+from VMLinker import rom_size, split_command
+
+# Runs a program on the VM emulator and counts where the time goes: VM commands and
+# estimated Hack cycles per function, per call edge and per VM line. Writes a text
+# report and the collapsed stacks that flamegraph.pl and speedscope read.
+# command line prompt: "python VMProfiler.py ProgramDir [OSDir ...] [--keys TEXT] [--collapsed FILE]"
+
+control_opcodes = (GOTO, IF_GOTO, CALL, RETURN, HALT)
+
+def cycle_cost(command):
+    """Hack instructions that VMTranslator.lua executes for one VM command.
+
+    Straight-line code costs its ROM size. function loops once per local, and eq, gt
+    and lt count their longer false path, 2 more than the true one.
+    """
+    if command[0] == "function":
+        return 8 + 13 * int(command[2])
+    if command[0] in ("eq", "gt", "lt"):
+        return 15
+    return rom_size(command)
+
+class VMProfiler(VMEmulator):
+    """A VMEmulator that runs one basic block at a time and records each block it ran.
+
+    A block runs from the current command up to the next jump, call or return, so
+    the commands of a block always run together. Counting the blocks gives every
+    command's count, and the calls and returns between blocks keep the call stack.
+    """
+    def __init__(self, program, entry = None):
+        ops = program.ops
+        size = len(ops)
+        # Commands from each command up to and including the next control command
+        self.blocks = [1] * size
+        for index in range(size - 2, -1, -1):
+            if ops[index] not in control_opcodes:
+                self.blocks[index] = self.blocks[index + 1] + 1
+        self.costs = [cycle_cost(split_command(line[2])) for line in program.lines]
+        self.prefix = [0]   # cycles of the commands before each command
+        for cost in self.costs:
+            self.prefix.append(self.prefix[-1] + cost)
+        super().__init__(program, entry)
+
+    def reset(self):
+        super().reset()
+        self.starts = [0] * (len(self.program.ops) + 1)    # +1 where a run starts, -1 where it ends
+        self.nodes = {}         # (parent node, function): node of the calling context tree
+        self.paths = [(self.entry,)]
+        self.nodeOps = [0]
+        self.nodeCycles = [0]
+        self.stack = [0]
+
+    def run(self, max_ops):
+        program = self.program
+        ops, names = program.ops, program.names
+        blocks, prefix, starts = self.blocks, self.prefix, self.starts
+        executed = 0
+        while executed < max_ops and not self.halted:
+            start = self.pc
+            before = self.ops
+            try:
+                VMEmulator.run(self, min(blocks[start], max_ops - executed))
+            finally:
+                count = self.ops - before
+                executed += count
+                starts[start] += 1
+                starts[start + count] -= 1
+                node = self.stack[-1]
+                self.nodeOps[node] += count
+                self.nodeCycles[node] += prefix[start + count] - prefix[start]
+            if count == 0:
+                break
+            last = ops[start + count - 1]
+            if last == CALL and not self.halted:
+                key = (node, names[self.pc])
+                if key not in self.nodes:
+                    self.nodes[key] = len(self.paths)
+                    self.paths.append(self.paths[node] + (names[self.pc],))
+                    self.nodeOps.append(0)
+                    self.nodeCycles.append(0)
+                self.stack.append(self.nodes[key])
+            elif last == RETURN and len(self.stack) > 1:
+                self.stack.pop()
+        return executed
+
+    def counts(self):
+        """Times each command ran."""
+        counts = []
+        running = 0
+        for change in self.starts[:-1]:
+            running += change
+            counts.append(running)
+        return counts
+
+class Profile:
+    """The totals of a profiled run by function, call edge and VM line."""
+    def __init__(self, profiler):
+        program = profiler.program
+        self.counts = profiler.counts()
+        self.cycles = [count * cost for count, cost in zip(self.counts, profiler.costs)]
+        self.lines = program.lines
+        self.totalOps = sum(self.counts)
+        self.totalCycles = sum(self.cycles)
+
+        # name: [calls, self commands, self cycles, inclusive cycles]
+        self.functions = {name: [0, 0, 0, 0] for name in program.functions}
+        for index, name in enumerate(program.names):
+            totals = self.functions[name]
+            totals[1] += self.counts[index]
+            totals[2] += self.cycles[index]
+        for name, index in program.functions.items():
+            self.functions[name][0] = self.counts[index]
+
+        # A recursive function counts the cycles of a stack only once
+        for path, cycles in zip(profiler.paths, profiler.nodeCycles):
+            for name in set(path):
+                self.functions[name][3] += cycles
+
+        self.edges = {}     # (caller, callee): calls
+        for index, op in enumerate(program.ops):
+            if op == CALL and self.counts[index]:
+                key = (program.names[index], split_command(program.lines[index][2])[1])
+                self.edges[key] = self.edges.get(key, 0) + self.counts[index]
+
+        self.stacks = list(zip(profiler.paths, profiler.nodeOps, profiler.nodeCycles))
+
+    def percent(self, cycles):
+        return 100 * cycles / self.totalCycles if self.totalCycles else 0
+
+    def report(self, top = 20):
+        out = [f"{self.totalOps} VM commands, {self.totalCycles} estimated Hack cycles", ""]
+        ranked = sorted(self.functions.items(), key=lambda item: (-item[1][2], item[0]))
+        out.append(f"Functions by self cycles (top {top} of {sum(1 for _, t in ranked if t[1])} that ran)")
+        out.append(f"{'self cycles':>14} {'%':>6} {'incl cycles':>14} {'%':>6} {'calls':>10} {'commands':>12}  function")
+        for name, (calls, commands, cycles, inclusive) in ranked[:top]:
+            if not commands:
+                break
+            out.append(f"{cycles:>14} {self.percent(cycles):>6.2f} {inclusive:>14} {self.percent(inclusive):>6.2f} "
+                       f"{calls:>10} {commands:>12}  {name}")
+
+        out += ["", f"Call edges by calls (top {top} of {len(self.edges)})"]
+        out.append(f"{'calls':>10}  caller -> callee")
+        for (caller, callee), calls in sorted(self.edges.items(), key=lambda item: (-item[1], item[0]))[:top]:
+            out.append(f"{calls:>10}  {caller} -> {callee}")
+
+        out += ["", f"VM lines by cycles (top {top})"]
+        out.append(f"{'cycles':>14} {'%':>6} {'count':>10}  line")
+        ranked = sorted(range(len(self.cycles)), key=lambda index: (-self.cycles[index], index))
+        for index in ranked[:top]:
+            if not self.counts[index]:
+                break
+            cls, number, text = self.lines[index]
+            out.append(f"{self.cycles[index]:>14} {self.percent(self.cycles[index]):>6.2f} {self.counts[index]:>10}  "
+                       f"{cls}.vm:{number}  {text}")
+        return "\n".join(out) + "\n"
+
+    def collapsed(self, weight = "cycles"):
+        """One 'caller;callee;... weight' line per call stack that ran any commands."""
+        out = []
+        for path, ops, cycles in self.stacks:
+            value = cycles if weight == "cycles" else ops
+            if value:
+                out.append(f"{';'.join(path)} {value}")
+        return "\n".join(sorted(out)) + "\n"
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the .vm files of a program and report where its time goes.")
+    parser.add_argument(
+        'paths',
+        nargs='+',
+        help="Directories or .vm files of the program, for example the program directory and the compiled OS."
+    )
+    parser.add_argument(
+        '--keys',
+        default="",
+        help="Keys to type, one after the other whenever the program reads the keyboard; \\n is Enter."
+    )
+    parser.add_argument(
+        '--max-ops',
+        type=int,
+        default=100_000_000,
+        help="Stop after this many VM commands (default 100000000)."
+    )
+    parser.add_argument(
+        '--entry',
+        default=None,
+        help="Function to start in (default Sys.init, or Main.main without a Sys class)."
+    )
+    parser.add_argument(
+        '--top',
+        type=int,
+        default=20,
+        help="Rows in each table of the report (default 20)."
+    )
+    parser.add_argument(
+        '-o', '--report',
+        metavar='FILE',
+        default=None,
+        help="Write the report to FILE instead of printing it."
+    )
+    parser.add_argument(
+        '--collapsed',
+        metavar='FILE',
+        default=None,
+        help="Write the call stacks in the collapsed format of flamegraph.pl."
+    )
+    parser.add_argument(
+        '--weight',
+        choices=["cycles", "commands"],
+        default="cycles",
+        help="What the collapsed stacks count (default cycles)."
+    )
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    skipped = []
+    try:
+        profiler = run_program(args.paths, args.keys.replace("\\n", "\n"), args.max_ops, args.entry,
+                               emulator_class=VMProfiler, skipped=skipped)
+    except (OSError, ValueError, VMError) as e:
+        print(f"Error: {e}")
+        return 1
+    finally:
+        for line in skipped:
+            print(line)
+    elapsed = time.perf_counter() - start
+
+    profile = Profile(profiler)
+    report = f"Profile of {profiler.entry}, {profiler.reason}, run in {elapsed:.2f}s\n" + profile.report(args.top)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as file:
+            file.write(report)
+        print(f"Wrote {args.report}")
+    else:
+        print(report, end="")
+    if args.collapsed:
+        with open(args.collapsed, 'w', encoding='utf-8') as file:
+            file.write(profile.collapsed(args.weight))
+        print(f"Wrote {args.collapsed}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+# Benchmark for the whole compiler on a fixed corpus: the Project_12 OS, JackBFS and
+# generated classes. Measures tokenize and compile time, tokens per second, peak memory
+# and the size of the VM code, writes the results as JSON and can gate on a baseline
+# command line prompt: "python bench/bench_compiler.py [--rounds N] [-O N] [-o results.json] [--compare baseline.json]"
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+sys.path.insert(0, os.path.join(ROOT, "Project_10"))
+
+import JackAnalyzer
+import JackCompiler
+
+from stress_many_subroutines import generate_class
+
+# metric: (True when a higher value is better, the time in seconds it is measured from)
+metrics = {
+    "tokenize_s": (False, "tokenize_s"),
+    "compile_s": (False, "compile_s"),
+    "analyze_s": (False, "analyze_s"),
+    "tokens_per_s": (True, "compile_s"),
+    "peak_kb": (False, None),
+    "vm_lines": (False, None),
+    "vm_bytes": (False, None),
+}
+
+def generate_expressions(class_name, subroutines):
+    """Jack source of a class whose subroutines are long on loops, arrays, calls and nested expressions."""
+    lines = [f"class {class_name} {{", "    field Array data;", "    field int size;", "    static int seed;"]
+    for i in range(subroutines):
+        lines.append(f"    method int e{i}(int a, int b) {{")
+        lines.append("        var int i, sum, t;")
+        lines.append("        let i = 0;")
+        lines.append("        while (i < size) {")
+        lines.append(f"            let t = ((data[i] * {i % 7 + 2}) + (a - (b / 3))) & (~(i | {i}));")
+        lines.append("            if ((t > sum) & ~(t = 0) | (i < 4)) { let sum = sum + Math.max(t, a); }")
+        lines.append(f"            else {{ let data[i + 1] = -(sum - t) * 2 + seed; let seed = seed + {i}; }}")
+        lines.append("            let i = i + 1;")
+        lines.append("        }")
+        lines.append(f"        do Output.printString(\"result {i}\");")
+        lines.append(f"        return sum + e{max(i - 1, 0)}(a, b - 1);")
+        lines.append("    }")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+def load_corpus():
+    """{group: {class name: source}} of the benchmark corpus."""
+    corpus = {}
+    for group, directory in (("Project_12", "Project_12"), ("JackBFS", os.path.join("Project_09", "JackBFS"))):
+        sources = {}
+        for file in sorted(glob.glob(os.path.join(ROOT, directory, '*.jack'))):
+            sources[os.path.splitext(os.path.basename(file))[0]] = JackCompiler.read_source(file)
+        corpus[group] = sources
+    corpus["Synthetic"] = {
+        "Stress": generate_class("Stress", 3000, 1000),
+        "Expressions": generate_expressions("Expressions", 1000),
+    }
+    return corpus
+
+def compile_group(sources, options):
+    """Compile every class of a group, returns {class name: VM code}."""
+    program = None
+    if options.inlining():
+        program = {name: JackCompiler.CompilationUnit(JackCompiler.tokenize(source, verbose = False), name).parseClass()
+                   for name, source in sources.items()}
+    vm = {}
+    for name, source in sources.items():
+        unit = JackCompiler.CompilationUnit(JackCompiler.tokenize(source, verbose = False), name, options = options)
+        unit.compileClass(None if program is None else dict(program))
+        if unit.diagnostics:
+            raise RuntimeError(f"{name}: {unit.diagnostics[0]}")
+        vm[name] = unit.VMCode.text()
+    return vm
+
+def analyze_group(sources, directory):
+    """Run the Project_10 analyzer over a group, its xml goes to directory."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, source in sources.items():
+            JackAnalyzer.compileTokens(JackAnalyzer.tokenize(source), os.path.join(directory, name + ".xml"))
+
+def best_time(function, rounds):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def bench_group(sources, options, rounds, directory):
+    tokens = sum(len(JackCompiler.tokenize(source, verbose = False)) for source in sources.values())
+    tokenize_s = best_time(lambda: [JackCompiler.tokenize(source, verbose = False) for source in sources.values()], rounds)
+    compile_s = best_time(lambda: compile_group(sources, options), rounds)
+    analyze_s = best_time(lambda: analyze_group(sources, directory), rounds)
+
+    tracemalloc.start()
+    vm = compile_group(sources, options)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    text = "".join(vm.values())
+    return {
+        "classes": len(sources),
+        "tokens": tokens,
+        "tokenize_s": round(tokenize_s, 6),
+        "compile_s": round(compile_s, 6),
+        "analyze_s": round(analyze_s, 6),
+        "tokens_per_s": round(tokens / compile_s),
+        "peak_kb": round(peak / 1024),
+        "vm_lines": text.count("\n"),
+        "vm_bytes": len(text.encode("utf-8")),
+    }
+
+def run_benchmark(rounds, level):
+    options = JackCompiler.CompileOptions(level = level)
+    groups = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for group, sources in load_corpus().items():
+            groups[group] = bench_group(sources, options, rounds, directory)
+    return {
+        "python": platform.python_version(),
+        "options": options.describe().strip(),
+        "rounds": rounds,
+        "groups": groups,
+    }
+
+def print_results(results):
+    print(f"Python {results['python']}, {results['options']}, best of {results['rounds']} rounds")
+    print(f"{'group':<12} {'tokens':>8} {'tokenize':>10} {'compile':>10} {'analyze':>10} {'tokens/s':>10} "
+          f"{'peak KB':>9} {'VM lines':>9}")
+    for group, row in results["groups"].items():
+        print(f"{group:<12} {row['tokens']:>8} {row['tokenize_s']:>9.3f}s {row['compile_s']:>9.3f}s "
+              f"{row['analyze_s']:>9.3f}s {row['tokens_per_s']:>10,} {row['peak_kb']:>9} {row['vm_lines']:>9}")
+
+# Every metric that got worse than the baseline by more than threshold percent. A time
+# metric only counts when its time changed by at least noise seconds, the small groups
+# compile in milliseconds
+def regressions(baseline, current, threshold, noise):
+    found = []
+    for group, row in current["groups"].items():
+        base = baseline["groups"].get(group)
+        if base is None:
+            continue
+        for metric, (higher_is_better, seconds) in metrics.items():
+            old, new = base.get(metric), row.get(metric)
+            if not old or new is None:
+                continue
+            if seconds and abs((row.get(seconds) or 0) - (base.get(seconds) or 0)) < noise:
+                continue
+            change = 100 * (new - old) / old
+            if (-change if higher_is_better else change) > threshold:
+                found.append(f"{group} {metric}: {old} -> {new} ({change:+.1f}%)")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Jack compiler and analyzer on a fixed corpus.")
+    parser.add_argument('--rounds', type=int, default=5, help="Number of timed rounds, the best is reported.")
+    parser.add_argument('-O', '--level', type=int, default=1, choices=sorted(JackCompiler.levels),
+                        help="Optimization level to compile at (default 1).")
+    parser.add_argument('-o', '--output', default=None, help="Write the results to this JSON file.")
+    parser.add_argument('--compare', metavar='BASELINE', default=None,
+                        help="JSON results to compare with, exits with 1 when a metric regressed.")
+    parser.add_argument('--current', metavar='RESULTS', default=None,
+                        help="Compare these saved JSON results instead of running the benchmark.")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="Percent a metric may get worse before --compare fails (default 10).")
+    parser.add_argument('--noise', type=float, default=0.005,
+                        help="Time changes smaller than this many seconds never fail --compare (default 0.005).")
+    args = parser.parse_args()
+
+    if args.current:
+        with open(args.current, 'r', encoding='utf-8') as file:
+            results = json.load(file)
+    else:
+        results = run_benchmark(args.rounds, args.level)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+        print(f"Wrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline.get("options") != results.get("options"):
+            print(f"Warning: baseline was compiled with '{baseline.get('options')}', not '{results.get('options')}'")
+        found = regressions(baseline, results, args.threshold, args.noise)
+        for line in found:
+            print(f"Regression: {line}")
+        if found:
+            return 1
+        print(f"No metric regressed by more than {args.threshold:g}%")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+# Micro-benchmark for the Jack scanner, reports tokens per second on the OS sources
+# command line prompt: "python bench/bench_tokenizer.py [--rounds N] [dir]"
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+
+import JackCompiler
+
+def load_sources(directory_path):
+    sources = {}
+    for file in sorted(glob.glob(os.path.join(directory_path, '*.jack'))):
+        sources[os.path.basename(file)] = JackCompiler.read_source(file)
+    return sources
+
+def bench(sources, rounds):
+    """Tokenize every source `rounds` times, return (token count per round, best seconds per round)."""
+    best = None
+    count = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        count = 0
+        for source in sources.values():
+            count += len(JackCompiler.tokenize(source))
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return count, best
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure scanner throughput in tokens per second.")
+    parser.add_argument(
+        'path',
+        nargs='?',
+        default=os.path.join(ROOT, "Project_12"),
+        help="Directory of .jack files (defaults to the Project_12 OS)."
+    )
+    parser.add_argument('--rounds', type=int, default=50, help="Number of timed rounds, the best is reported.")
+    args = parser.parse_args()
+
+    sources = load_sources(args.path)
+    if not sources:
+        print(f"Error: No .jack files found in {args.path}")
+        return 1
+
+    for name, source in sources.items():
+        count, seconds = bench({name: source}, args.rounds)
+        print(f"{name:<16} {count:>7} tokens  {count / seconds:>12,.0f} tokens/s")
+
+    count, seconds = bench(sources, args.rounds)
+    size = sum(len(source) for source in sources.values())
+    print(f"{'total':<16} {count:>7} tokens  {count / seconds:>12,.0f} tokens/s  "
+          f"({size / seconds / 1e6:.1f} MB/s)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
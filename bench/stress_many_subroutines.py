@@ -0,0 +1,65 @@
+# Stress check for the parser on machine-generated classes, compiles one class with
+# thousands of field declarations and subroutines and verifies every function made it
+# command line prompt: "python bench/stress_many_subroutines.py [--subroutines N] [--fields N]"
+import argparse
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+
+import JackCompiler
+
+def generate_class(class_name, subroutines, fields):
+    """Jack source of a class with `fields` field declarations and `subroutines` subroutines."""
+    lines = [f"class {class_name} {{"]
+    for i in range(fields):
+        lines.append(f"    field int f{i};")
+    lines.append("    static int count;")
+    for i in range(subroutines):
+        kind = ("function", "method", "constructor")[i % 3]
+        if kind == "constructor":
+            lines.append(f"    constructor {class_name} new{i}(int a, int b) {{")
+            lines.append(f"        let count = count + {i};")
+            lines.append("        return this;")
+        else:
+            lines.append(f"    {kind} int s{i}(int a, int b, int c) {{")
+            lines.append("        var int x, y;")
+            lines.append("        var boolean done;")
+            lines.append(f"        let x = a + {i};")
+            lines.append("        if (x > b) { let y = x - b; } else { let y = c; }")
+            lines.append("        return y;")
+        lines.append("    }")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a generated class with many subroutines and fields.")
+    parser.add_argument('--subroutines', type=int, default=10000, help="Number of subroutines in the class.")
+    parser.add_argument('--fields', type=int, default=10000, help="Number of field declarations in the class.")
+    args = parser.parse_args()
+
+    class_name = "Stress"
+    source = generate_class(class_name, args.subroutines, args.fields)
+
+    start = time.perf_counter()
+    tokens = JackCompiler.tokenize(source)
+    unit = JackCompiler.CompilationUnit(tokens, class_name, io.StringIO())
+    unit.compileClass()
+    vm = unit.VMCode.text()
+    elapsed = time.perf_counter() - start
+
+    functions = vm.count("\nfunction ") + vm.startswith("function ")
+    print(f"{len(tokens)} tokens, {functions} functions, {vm.count(chr(10))} VM lines in {elapsed:.2f}s")
+    if unit.diagnostics:
+        print(f"Error: {len(unit.diagnostics)} diagnostics, first: {unit.diagnostics[0]}")
+        return 1
+    if functions != args.subroutines:
+        print(f"Error: Expected {args.subroutines} functions, found {functions}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
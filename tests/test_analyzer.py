@@ -0,0 +1,35 @@
+# The Project_10 analyzer parses declarations, subroutines and statements with loops,
+# so a long generated class must not run into the recursion limit
+# command line prompt: "python -m pytest tests/test_analyzer.py"
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_10"))
+
+import JackAnalyzer
+
+def generate_class(count):
+    """A class with count fields, count subroutines and count statements in one of them."""
+    lines = ["class Long {"]
+    lines += [f"    field int f{i};" for i in range(count)]
+    lines += [f"    function int s{i}(int a, int b) {{ var int x; var int y; let x = a; return x; }}" for i in range(count)]
+    lines.append("    function void main() {")
+    lines += ["        var int v;"] * count
+    lines += ["        let v = v + 1;"] * count
+    lines.append("        return;")
+    lines.append("    }")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+def test_long_class_is_analyzed(tmp_path):
+    count = 3 * sys.getrecursionlimit()
+    output = tmp_path / "Long.xml"
+    JackAnalyzer.compileTokens(JackAnalyzer.tokenize(generate_class(count)), str(output))
+    xml = output.read_text(encoding="utf-8")
+    assert xml.count("<classVarDec>") == count
+    assert xml.count("<subroutineDec>") == count + 1
+    assert xml.count("<parameterList>") == count + 1
+    assert xml.count("<varDec>") == 3 * count
+    assert xml.count("<letStatement>") == 2 * count
+    assert xml.count("<returnStatement>") == count + 1
@@ -0,0 +1,30 @@
+# A class that compiled with errors must not be cached as up to date: the next build of
+# the directory compiles it again and reports the same errors, with and without -j
+# command line prompt: "python -m pytest tests/test_build_cache.py"
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+
+import JackCompiler
+
+BROKEN = """
+class Main {
+    function int main() {
+        return x;
+    }
+}
+"""
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_broken_class_is_rebuilt(tmp_path, capsys, jobs):
+    (tmp_path / "Main.jack").write_text(BROKEN, encoding="utf-8")
+    for _ in range(2):
+        code = JackCompiler.build(str(tmp_path), False, jobs, False, JackCompiler.CompileOptions())
+        out = capsys.readouterr().out
+        assert code == 1
+        assert "Undefined variable x" in out
+        assert "up to date" not in out
@@ -0,0 +1,48 @@
+# Flags of JackCompiler.py must not take the path that follows them as their value
+# command line prompt: "python -m pytest tests/test_command_line.py"
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+
+from VMPeephole import rules
+
+MAIN = """
+class Main {
+    function void main() {
+        var int x;
+        let x = 1 + 2;
+        return;
+    }
+}
+"""
+
+def jackc(*args):
+    return subprocess.run([sys.executable, os.path.join(ROOT, "Project_11", "JackCompiler.py"), *args],
+                          capture_output=True, text=True)
+
+def test_peephole_before_path(tmp_path):
+    (tmp_path / "Main.jack").write_text(MAIN, encoding="utf-8")
+    result = jackc("--peephole", str(tmp_path), "--emit", "vm")
+    assert result.returncode == 0, result.stderr
+    assert (tmp_path / "Main.vm").exists()
+
+def test_peephole_rules(tmp_path):
+    (tmp_path / "Main.jack").write_text(MAIN, encoding="utf-8")
+    rule = next(iter(rules))
+    assert jackc("--peephole-rules", rule, str(tmp_path), "--emit", "vm", "--force").returncode == 0
+    result = jackc("--peephole-rules", "no-such-rule", str(tmp_path))
+    assert result.returncode == 2
+    assert "unknown peephole rule" in result.stderr
+
+def test_profile_before_path(tmp_path):
+    (tmp_path / "Main.jack").write_text(MAIN, encoding="utf-8")
+    result = jackc("--profile", "-", str(tmp_path), "--emit", "vm")
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout)["files"]
+    output = tmp_path / "profile.json"
+    assert jackc("--profile", str(output), str(tmp_path), "--force").returncode == 0
+    assert json.loads(output.read_text(encoding="utf-8"))["files"]
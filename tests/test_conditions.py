@@ -0,0 +1,63 @@
+# Conditions that are not 0 or true must behave the same at every -O level: Jack only
+# takes a branch or runs a loop body on true (-1), whatever layout the compiler picks
+# command line prompt: "python -m pytest tests/test_conditions.py"
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+
+import JackCompiler
+
+from VMEmulator import STACK, run_program
+
+MAIN = """
+class Main {
+    function int main() {
+        var int x, count, result;
+        let x = 5;
+
+        // while on a value that is neither 0 nor true
+        let count = 0;
+        while (x - count) { let count = count + 1; }
+        let result = count;
+
+        // if with an else on a bitwise condition
+        if (x & 1) { let result = result + 10; } else { let result = result + 20; }
+
+        // the same condition without an else
+        if (x & 1) { let result = result + 100; }
+
+        // inverted condition with and without an else
+        if (~(x - 5)) { let result = result + 1000; } else { let result = result + 2000; }
+        if (~x) { let result = result + 4000; }
+
+        // constant conditions that fold to something other than true
+        if (3) { let result = result + 8000; } else { let result = result + 16000; }
+        while (2) { let result = result + 1; }
+
+        // real booleans still take the fast layout
+        if ((x > 3) & (x < 9)) { let result = result - 3; } else { let result = result - 5; }
+        return result;
+    }
+}
+"""
+
+def run_main(source, level, tmp_path):
+    """Compile Main at level, run Main.main and return what it returned."""
+    directory = tmp_path / f"O{level}"
+    directory.mkdir()
+    diagnostics = []
+    vm = JackCompiler.compile_source(source, "Main", diagnostics, JackCompiler.CompileOptions(level = level))
+    assert diagnostics == []
+    (directory / "Main.vm").write_text(vm, encoding="utf-8")
+    emulator = run_program([str(directory)], entry = "Main.main", max_ops = 100_000)
+    assert emulator.reason == "Main.main returned"
+    return emulator.ram[STACK]
+
+def test_conditions_match_across_levels(tmp_path):
+    results = {level: run_main(MAIN, level, tmp_path) for level in sorted(JackCompiler.levels)}
+    # -O0 is the reference: the loops never run, x & 1 and 3 take their else blocks
+    assert results[0] == 0 + 20 + 1000 + 16000 - 3
+    assert results[1] == results[0]
+    assert results[2] == results[0]
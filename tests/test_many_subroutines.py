@@ -0,0 +1,19 @@
+# The parser reads declarations and subroutines in loops, so a generated class with
+# 10,000 subroutines compiles without running into the recursion limit
+# command line prompt: "python -m pytest tests/test_many_subroutines.py"
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+import JackCompiler
+
+from stress_many_subroutines import generate_class
+
+def test_ten_thousand_subroutines():
+    diagnostics = []
+    vm = JackCompiler.compile_source(generate_class("Stress", 10000, 1000), "Stress", diagnostics)
+    assert diagnostics == []
+    assert sum(line.startswith("function ") for line in vm.splitlines()) == 10000
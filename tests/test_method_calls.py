@@ -0,0 +1,91 @@
+# Method calls push their object before the arguments and call the declared type of the
+# variable, for do statements and expressions, on locals, fields and the current object
+# command line prompt: "python -m pytest tests/test_method_calls.py"
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+
+import JackCompiler
+
+from VMEmulator import STACK, run_program
+
+SOURCES = {
+    # Just enough of the OS for constructors
+    "Memory": """
+class Memory {
+    static int next;
+    function int alloc(int size) {
+        var int block;
+        if (next = 0) { let next = 3000; }
+        let block = next;
+        let next = next + size;
+        return block;
+    }
+}
+""",
+    "Counter": """
+class Counter {
+    field int total;
+    constructor Counter new(int start) { let total = start; return this; }
+    method int add(int a, int b) { let total = total + a - b; return total; }
+    method void bump(int a) { let total = total + a + a + a + a + a + a + a + a + a + a; return; }
+    method int twice(int a) {
+        // Calls on the current object, as a statement and in an expression
+        do bump(a);
+        return add(a, 1);
+    }
+    method int get() { return total; }
+}
+""",
+    "Holder": """
+class Holder {
+    field Counter tally;
+    constructor Holder new() { let tally = Counter.new(100); return this; }
+    method int run() {
+        // Calls on a field, whose name is not its type
+        do tally.bump(2);
+        return tally.add(7, 3);
+    }
+}
+""",
+    "Main": """
+class Main {
+    function int main() {
+        var Counter c;
+        var Holder h;
+        var int r;
+        let c = Counter.new(5);
+        do c.bump(1);
+        let r = c.add(4, 2);
+        let r = r + c.twice(3);
+        let h = Holder.new();
+        let r = r + h.run();
+        return r + c.get();
+    }
+}
+""",
+}
+
+def compile_program(level, directory):
+    directory.mkdir()
+    vm = {}
+    for name, source in SOURCES.items():
+        diagnostics = []
+        vm[name] = JackCompiler.compile_source(source, name, diagnostics, JackCompiler.CompileOptions(level = level))
+        assert diagnostics == []
+        (directory / (name + ".vm")).write_text(vm[name], encoding="utf-8")
+    return vm
+
+def test_method_calls_at_every_level(tmp_path):
+    for level in sorted(JackCompiler.levels):
+        vm = compile_program(level, tmp_path / f"O{level}")
+        emulator = run_program([str(tmp_path / f"O{level}")], entry = "Main.main", max_ops = 100_000)
+        assert emulator.reason == "Main.main returned"
+        # c: 5, 15, 17, 47, 49; h.tally: 100, 120, 124; r = 17 + 49 + 124
+        assert emulator.ram[STACK] == 17 + 49 + 124 + 49
+        if level == 0:
+            assert "push local 0\npush constant 4\npush constant 2\ncall Counter.add 3" in vm["Main"]
+            assert "push this 0\npush constant 2\ncall Counter.bump 2" in vm["Holder"]
+            assert "push pointer 0\npush argument 1\ncall Counter.bump 2" in vm["Counter"]
@@ -0,0 +1,51 @@
+# --pool-strings shares one String per literal, so only literals that are passed as
+# arguments are pooled: one that is assigned or returned may be changed or disposed
+# command line prompt: "python -m pytest tests/test_pool_strings.py"
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+
+import JackCompiler
+
+MAIN = """
+class Main {
+    static Array names;
+    function void main() {
+        var String s;
+        do Output.printString("shared");
+        do Output.printString("shared");
+        let s = "mine";
+        do s.dispose();
+        let names[0] = "kept";
+        do Output.printString(Main.name());
+        return;
+    }
+    function String name() {
+        return "returned";
+    }
+}
+"""
+
+def functions(vm):
+    """{function name: its VM lines}."""
+    found = {}
+    for line in vm.splitlines():
+        if line.startswith("function "):
+            name = line.split()[1]
+            found[name] = []
+        found[name].append(line)
+    return found
+
+def test_only_arguments_are_pooled():
+    diagnostics = []
+    vm = JackCompiler.compile_source(MAIN, "Main", diagnostics, JackCompiler.CompileOptions(pool_strings = True))
+    assert diagnostics == []
+    code = functions(vm)
+    # The pool builds "shared" once, the other literals are built where they are used
+    assert code["Main.literals:init"].count("call String.new 1") == 1
+    assert code["Main.literals:init"].count("push constant " + str(ord("s"))) == 1
+    assert code["Main.main"].count("call Main.literals:init 0") == 2
+    assert code["Main.main"].count("call String.new 1") == 2
+    assert code["Main.name"].count("call String.new 1") == 1
@@ -0,0 +1,25 @@
+# read_program keeps the first file of each class and reports the later ones to its
+# caller instead of printing them
+# command line prompt: "python -m pytest tests/test_read_program.py"
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+
+from VMLinker import read_program
+
+def write_class(directory, constant):
+    directory.mkdir()
+    (directory / "Main.vm").write_text(f"function Main.main 0\npush constant {constant}\nreturn\n", encoding="utf-8")
+    return str(directory)
+
+def test_shadowed_class_is_reported(tmp_path, capsys):
+    program = write_class(tmp_path / "program", 1)
+    library = write_class(tmp_path / "library", 2)
+    skipped = []
+    classes = read_program([program, library], skipped)
+    assert str(classes["Main"].path).startswith(program)
+    assert len(skipped) == 1 and skipped[0].startswith(f"Skipping {os.path.join(library, 'Main.vm')}")
+    assert read_program([program, library])["Main"].path == classes["Main"].path
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,50 @@
+# --serve must not take over the socket of a server that is still running, and must
+# still replace the socket file a server that died left behind
+# command line prompt: "python -m pytest tests/test_serve.py"
+import os
+import signal
+import socket
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+
+import JackCompiler
+
+def test_live_server_is_kept(tmp_path, capsys):
+    path = str(tmp_path / "jack.sock")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as listener:
+        listener.bind(path)
+        listener.listen()
+        assert JackCompiler.serve(path) == 1
+        assert os.path.exists(path)
+    assert "already listening" in capsys.readouterr().out
+
+def test_other_file_is_kept(tmp_path):
+    path = tmp_path / "jack.sock"
+    path.write_text("not a socket", encoding="utf-8")
+    assert JackCompiler.serve(str(path)) == 1
+    assert path.read_text(encoding="utf-8") == "not a socket"
+
+def test_stale_socket_is_replaced(tmp_path):
+    path = str(tmp_path / "jack.sock")
+    # A socket file that no process listens on any more
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as dead:
+        dead.bind(path)
+    server = subprocess.Popen([sys.executable, "-u", os.path.join(ROOT, "Project_11", "JackCompiler.py"), "--serve", path],
+                              stdout=subprocess.PIPE, text=True)
+    try:
+        assert server.stdout.readline().startswith(f"Serving compile requests on {path}")
+        # The server closes an empty request once it handles requests, only then is
+        # Ctrl+C caught by serve()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(path)
+            client.shutdown(socket.SHUT_WR)
+            assert client.recv(1) == b""
+    finally:
+        server.send_signal(signal.SIGINT)
+        server.wait(timeout=10)
+        server.stdout.close()
+    assert server.returncode == 0
+    assert not os.path.exists(path)
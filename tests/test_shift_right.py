@@ -0,0 +1,89 @@
+# Math.shiftRight of the Project_12 OS against Math.divide: for x >= 0 shifting right by
+# k must give x / 2^k, which is what --shift-helper relies on
+# command line prompt: "python -m pytest tests/test_shift_right.py"
+import glob
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+
+import JackCompiler
+
+from VMEmulator import run_program
+
+# Errors go to RAM[8000], the number of checks to RAM[8001] and (a & 127) / 8 to RAM[8002].
+# Math.divide overflows doubling y past 16384, so x >= 16384 is only checked for 32767,
+# whose shifts are found by halving 16383
+MAIN = """
+class Main {
+    function void main() {
+        var int x, k, expected, errors, checks;
+        let x = 0;
+        while (x < 16384) {
+            let errors = errors + Main.check(x);
+            let checks = checks + 15;
+            let x = x + 331;
+        }
+        let errors = errors + Main.check(1) + Main.check(255) + Main.check(16383);
+        let checks = checks + 45;
+
+        if (~(Math.shiftRight(32767, 0) = 32767)) {
+            let errors = errors + 1;
+        }
+        let k = 1;
+        let expected = 16383;
+        while (k < 16) {
+            if (~(Math.shiftRight(32767, k) = expected)) {
+                let errors = errors + 1;
+            }
+            let expected = expected / 2;
+            let k = k + 1;
+        }
+        // Math.divide relies on Math.multiply, which tests its bits the same way
+        if (~(Math.multiply(123, -45) = -5535)) {
+            let errors = errors + 1;
+        }
+        do Memory.poke(8000, errors);
+        do Memory.poke(8001, checks + 16);
+        do Memory.poke(8002, Main.masked(64));
+        return;
+    }
+
+    function int check(int x) {
+        var int k, p, errors;
+        let p = 1;
+        while (k < 15) {
+            if (~(Math.shiftRight(x, k) = (x / p))) {
+                let errors = errors + 1;
+            }
+            let p = p + p;
+            let k = k + 1;
+        }
+        return errors;
+    }
+
+    /** x & 127 is known to be non-negative, so --shift-helper divides it with shiftRight */
+    function int masked(int a) {
+        return (a & 127) / 8;
+    }
+}
+"""
+
+def test_shift_right_matches_divide(tmp_path):
+    options = JackCompiler.CompileOptions(shift_helper = True)
+    sources = {os.path.splitext(os.path.basename(file))[0]: JackCompiler.read_source(file)
+               for file in glob.glob(os.path.join(ROOT, "Project_12", "*.jack"))}
+    sources["Main"] = MAIN
+    for name, source in sources.items():
+        diagnostics = []
+        vm = JackCompiler.compile_source(source, name, diagnostics, options)
+        assert diagnostics == []
+        (tmp_path / (name + ".vm")).write_text(vm, encoding="utf-8")
+    assert "call Math.shiftRight 2" in (tmp_path / "Main.vm").read_text(encoding="utf-8")
+
+    emulator = run_program([str(tmp_path)], max_ops = 50_000_000)
+    assert emulator.halted
+    assert emulator.ram[8001] == 50 * 15 + 45 + 16
+    assert emulator.ram[8000] == 0
+    assert emulator.ram[8002] == 8
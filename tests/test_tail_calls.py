@@ -0,0 +1,38 @@
+# A subroutine that returns a call to itself only jumps back to its start at -O2, the
+# level whose passes change frames; -O0 and -O1 keep the real call
+# command line prompt: "python -m pytest tests/test_tail_calls.py"
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+
+import JackCompiler
+
+from VMEmulator import STACK, run_program
+
+MAIN = """
+class Main {
+    function int main() {
+        return Main.sum(100, 0);
+    }
+    function int sum(int n, int total) {
+        if (n = 0) { return total; }
+        return Main.sum(n - 1, total + n);
+    }
+}
+"""
+
+def test_tail_calls_only_at_level_2(tmp_path):
+    for level in sorted(JackCompiler.levels):
+        directory = tmp_path / f"O{level}"
+        directory.mkdir()
+        diagnostics = []
+        options = JackCompiler.CompileOptions(level = level, inline_depth = 0)
+        vm = JackCompiler.compile_source(MAIN, "Main", diagnostics, options)
+        assert diagnostics == []
+        assert (vm.count("call Main.sum 2") == 1) == (level >= 2)
+        (directory / "Main.vm").write_text(vm, encoding="utf-8")
+        emulator = run_program([str(directory)], entry = "Main.main", max_ops = 100_000)
+        assert emulator.reason == "Main.main returned"
+        assert emulator.ram[STACK] == 5050
@@ -0,0 +1,18 @@
+# Line numbers of the scanner, which compile_source diagnostics and the compile server report
+# command line prompt: "python -m pytest tests/test_tokenize.py"
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Project_11"))
+
+import JackCompiler
+
+def test_lines_after_an_unexpected_character():
+    source = "class Main {\n  static int x;\n\n  $\n\n  function void main() {\n    return;\n  }\n}\n"
+    tokens = JackCompiler.tokenize(source, track_lines = True, verbose = False)
+    assert tokens.errors == ["Error: Unexpected character '$' in source (line 4)"]
+    lines = {token: line for (token, _), line in zip(tokens, tokens.lines)}
+    assert lines["static"] == 2
+    assert lines["function"] == 6
+    assert lines["return"] == 7